@@ -1,13 +1,48 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g, stream_with_context
 from services.cpic_loader import load_cpic_data
-from cpic_engine import initialize_cpic_engine
+from cpic_engine import get_drug_genes, initialize_cpic_engine, load_recommendation_table
 from services.vcf_parser import parse_vcf
+from services.pharmacogene_index import get_pharmacogene_index
+from services.star_allele_caller import get_star_allele_caller
 from services.drug_gene_matcher import match_drug_with_vcf
-from services.phenotype_engine import determine_phenotype
-from services.response_builder import build_response_json, prepare_llm_prompt, format_response_for_json_output
+from services.phenotype_engine import PHENOTYPE_MAP, determine_phenotype
+from services.response_builder import (
+    build_response_json,
+    prepare_llm_prompt,
+    format_response_for_json_output,
+    build_responses_from_analyses,
+    build_compact_response,
+    PROMPT_TEMPLATE_VERSION
+)
+from services.analysis_pipeline import analyze_drugs, required_genes, stream_analysis_events
+from services.deadline import Deadline, resolve_deadline_seconds
+from services.admission import AdmissionController, AdmissionRejected
+from services.genotype_input import MAX_GENOTYPE_BATCH, GenotypeInputError, genotypes_to_vcf_data
+from services.http_cache import (
+    ETagCache,
+    compress_response,
+    compute_etag,
+    content_hash,
+    content_patient_id,
+    request_fingerprint
+)
 from services.llm_service import get_llm_provider
+from services.llm_hedging import HedgedProvider
+from services.llm_singleflight import LLM_SINGLEFLIGHT, SingleFlightProvider
+from services.llm_cache import get_recommendation_cache, provider_model
+from services.llm_tiering import LLM_FAST_MODEL, TieredProvider
+from services.llm_stream import format_sse
+from services.prompt_budget import PROMPT_STATS
+from services.cpic_tables import get_cpic_tables
+from services.result_store import get_result_store, knowledge_base_version, parse_time
+from services.knowledge_base import ensure_snapshot
+from services.variant_qc import VCF_QC_FILTERS
 import os
+import time
+import uuid
+from contextlib import ExitStack
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,25 +55,175 @@ app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB in bytes
 # Preserve JSON field order (Flask 3.0+ style)
 app.json.sort_keys = False
 
+# Reverse proxies in front of the app (1 behind a single load balancer). Only that many X-Forwarded-For
+# hops are trusted for request.remote_addr; with 0 the header is ignored, as any client can set it.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+if TRUSTED_PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
 # Load CPIC data at startup
 try:
     CPIC_ENGINE = initialize_cpic_engine("data/cpic_gene-drug_pairs.xlsx")
+    # Genes of every CPIC drug, which focus the fallback prompt for drugs outside SUPPORTED_DRUGS
+    get_drug_genes()
 except Exception as e:
     print(f"Fatal error: Could not load CPIC data - {e}")
     raise
 
+# Load the versioned CPIC recommendation table (deterministic clinical_recommendation)
+try:
+    CPIC_RECOMMENDATIONS = load_recommendation_table("data/cpic_recommendations.json")
+except Exception as e:
+    print(f"⚠ Warning: Could not load CPIC recommendation table - {e}")
+    CPIC_RECOMMENDATIONS = None
+
+# Build the pharmacogene annotation index and star-allele callers used for raw (untagged) VCFs
+try:
+    get_pharmacogene_index()
+    get_star_allele_caller("CYP2D6")
+    print("✓ Pharmacogene annotation index and allele definitions loaded")
+except Exception as e:
+    print(f"Fatal error: Could not load pharmacogene tables - {e}")
+    raise
+
+def build_llm_provider(provider_name: str, api_key: str, model: str = None):
+    """
+    Build one provider stack: the base provider, optionally hedged with
+    LLM_HEDGE_PROVIDER, behind single-flight coalescing.
+    """
+    provider = get_llm_provider(provider_name, api_key, model)
+    hedge_provider_name = os.getenv("LLM_HEDGE_PROVIDER", "").lower()
+    if hedge_provider_name:
+        # Slow or failed primary calls are also sent to the secondary provider
+        try:
+            provider = HedgedProvider(provider, get_llm_provider(hedge_provider_name))
+        except Exception as e:
+            print(f"⚠ Warning: Could not initialize hedge provider '{hedge_provider_name}' - {e}")
+    # Identical prompts already in flight (in this worker or another on the host) are sent only once
+    if LLM_SINGLEFLIGHT:
+        provider = SingleFlightProvider(provider)
+    return provider
+
+
 # Initialize LLM provider (optional)
 LLM_PROVIDER = None
+# Gemini by default; LLM_PROVIDER=openai switches to the OpenAI provider
+llm_provider_name = os.getenv("LLM_PROVIDER", "gemini").lower()
+api_key_name = "OPENAI_API_KEY" if llm_provider_name == "openai" else "GOOGLE_API_KEY"
 try:
-    api_key = os.getenv("GOOGLE_API_KEY")
+    api_key = os.getenv(api_key_name)
     if api_key:
-        LLM_PROVIDER = get_llm_provider("gemini", api_key)
-        print("✓ Google Gemini API initialized")
+        LLM_PROVIDER = build_llm_provider(llm_provider_name, api_key)
+        if llm_provider_name == "openai":
+            print("✓ OpenAI API initialized")
+        else:
+            print("✓ Google Gemini API initialized")
+        if os.getenv("LLM_HEDGE_PROVIDER"):
+            print(f"✓ Hedged LLM requests enabled (secondary: {os.getenv('LLM_HEDGE_PROVIDER').lower()})")
+        # Optional model tiering: simple low-risk cases go to LLM_FAST_MODEL
+        if LLM_FAST_MODEL:
+            LLM_PROVIDER = TieredProvider(build_llm_provider(llm_provider_name, api_key, LLM_FAST_MODEL), LLM_PROVIDER)
+            print(f"✓ LLM model tiering enabled (fast: {LLM_FAST_MODEL}, strong: {LLM_PROVIDER.model})")
     else:
-        print("⚠ GOOGLE_API_KEY not found. LLM features disabled. Set GOOGLE_API_KEY environment variable to enable.")
+        print(f"⚠ {api_key_name} not found. LLM features disabled. Set {api_key_name} environment variable to enable.")
 except Exception as e:
     print(f"⚠ Warning: Could not initialize LLM provider - {e}")
-    print("LLM features will be disabled. Set GOOGLE_API_KEY environment variable to enable.")
+    print(f"LLM features will be disabled. Set {api_key_name} environment variable to enable.")
+
+# Persistent per-drug LLM answer cache (filled ahead of traffic by tools/warm_llm_cache.py)
+LLM_CACHE_STORE = get_recommendation_cache() if LLM_PROVIDER is not None else None
+if LLM_CACHE_STORE is not None:
+    print(f"✓ LLM recommendation cache at {LLM_CACHE_STORE.path}")
+
+# A table store built with the built-in map holds a copy of it that takes precedence over later map fixes
+CPIC_TABLES = get_cpic_tables()
+if CPIC_TABLES and CPIC_TABLES.meta.get("builtin") == "true" and \
+        CPIC_TABLES.meta.get("builtin_version") != knowledge_base_version(PHENOTYPE_MAP):
+    print(f"⚠ CPIC table store {CPIC_TABLES.path} was built from an older PHENOTYPE_MAP. "
+          "Rebuild it with python -m tools.ingest_cpic_tables.")
+
+# Stored results are reused only while everything they were derived from is unchanged
+KB_VERSION = knowledge_base_version(
+    "data/cpic_gene-drug_pairs.xlsx", "data/cpic_recommendations.json",
+    "data/allele_definitions.tsv", "data/pharmacogene_variants.tsv",
+    "data/pharmacogene_regions.tsv", "data/liftover_grch37_to_grch38.tsv",
+    PHENOTYPE_MAP, CPIC_TABLES.meta if CPIC_TABLES else None, PROMPT_TEMPLATE_VERSION,
+    VCF_QC_FILTERS
+)
+
+# Persistent per-drug analysis results, keyed by VCF content hash, drug and KB_VERSION
+RESULT_STORE = get_result_store()
+if RESULT_STORE is not None:
+    print(f"✓ Result store at {RESULT_STORE.path} (knowledge base {KB_VERSION})")
+    # Snapshot of this knowledge base, diffed against the next one by tools/reanalyze.py
+    ensure_snapshot(KB_VERSION, CPIC_ENGINE, CPIC_RECOMMENDATIONS)
+
+# ETags of recent deterministic responses, so repeat requests can get a 304 without recomputation
+ETAG_CACHE = ETagCache()
+
+# Per-process admission control for /api/analysis (limits configured via ADMISSION_* env vars)
+ADMISSION = AdmissionController()
+
+
+@app.before_request
+def start_request_timer():
+    """Record when the request started so its service time can be reported."""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def add_server_timing(response):
+    """Expose in-app service time (used by tools/load_test.py to estimate worker saturation)."""
+    started = g.get('request_started')
+    if started is not None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.headers['Server-Timing'] = f"app;dur={elapsed_ms:.1f}"
+    return response
+
+
+@app.after_request
+def compress_body(response):
+    """Apply gzip/brotli compression negotiated via Accept-Encoding."""
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+
+def client_identifier() -> str:
+    """
+    Identify the caller for per-client quotas.
+
+    Only the client address is used: X-Client-Id and untrusted X-Forwarded-For
+    hops are set by the client, which could rotate them for a fresh quota.
+    Behind TRUSTED_PROXY_COUNT proxies, ProxyFix has already resolved the
+    address from the hops those proxies appended.
+    """
+    return request.remote_addr or 'unknown'
+
+
+def shed_response(e: AdmissionRejected):
+    """Build the 429/503 response for a request rejected by admission control."""
+    print(f"⚠ Request shed ({e.status}): {e.reason}")
+    response = jsonify({
+        "error": "Too many requests" if e.status == 429 else "Server busy",
+        "details": f"{e.reason}. Retry after {e.retry_after}s."
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+
+def parse_drug_list(drugs) -> list:
+    """Accept drugs as a comma-separated string or a list of names."""
+    if isinstance(drugs, str):
+        drugs = drugs.split(',')
+    if not isinstance(drugs, (list, tuple)):
+        return []
+    return [str(d).strip() for d in drugs if str(d).strip()]
+
+
+def not_modified(etag: str):
+    """Build an empty 304 response carrying the (weak) ETag."""
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
 
 
 @app.route('/')
@@ -74,10 +259,13 @@ def analyze():
         if not drugs_input:
             return render_template('index.html', error="No drugs provided")
         
-        # Parse VCF file
+        # Split drugs by comma and strip whitespace
+        drug_list = [d.strip() for d in drugs_input.split(',') if d.strip()]
+
+        # Parse VCF file (only the genes these drugs need)
         print("=" * 60)
         print("Starting VCF analysis...")
-        vcf_data = parse_vcf(vcf_file)
+        vcf_data = parse_vcf(vcf_file, genes=required_genes(drug_list, CPIC_ENGINE))
         print(f"VCF parsing success: {vcf_data.get('vcf_parsing_success')}")
         
         # Check if VCF parsing was successful
@@ -91,8 +279,6 @@ def analyze():
         genes_with_variants = [g for g in parsed_genes if vcf_data['variants'][g]]
         print(f"Genes found in VCF: {genes_with_variants}")
         
-        # Split drugs by comma and strip whitespace
-        drug_list = [d.strip() for d in drugs_input.split(',') if d.strip()]
         print(f"Analyzing {len(drug_list)} drug(s): {drug_list}")
         
         # Build results
@@ -205,6 +391,11 @@ def api_analysis():
     API endpoint that returns structured JSON responses for VCF analysis.
     This endpoint is designed for programmatic access and LLM integration.
     """
+    # Overall time budget: configured default, optionally tightened by the client
+    deadline = Deadline(resolve_deadline_seconds(
+        request.values.get('deadline_ms') or request.headers.get('X-Request-Deadline-Ms')
+    ))
+    
     try:
         # Get uploaded VCF file
         if 'vcf_file' not in request.files:
@@ -219,162 +410,98 @@ def api_analysis():
         if not drugs_input:
             return jsonify({"error": "No drugs provided"}), 400
         
-        # Parse VCF file
-        vcf_data = parse_vcf(vcf_file)
-        print(f"VCF Parse Result: {vcf_data.get('vcf_parsing_success')}")
-        
-        if not vcf_data.get('vcf_parsing_success'):
-            return jsonify({
-                "error": "VCF parsing failed",
-                "details": vcf_data.get('error', 'Unknown error')
-            }), 400
-        
         # Split drugs by comma
         drug_list = [d.strip() for d in drugs_input.split(',') if d.strip()]
         print(f"Drug list to analyze: {drug_list}")
-        print(f"CPIC_ENGINE keys: {list(CPIC_ENGINE.keys())}")
-        print(f"VCF variants keys: {list(vcf_data.get('variants', {}).keys())}")
+        response_format = request.values.get('format', '').lower()
         
-        # Build JSON responses
-        json_responses = []
+        # Deterministic mode: patient ID derived from the VCF content, weak ETag validation
+        deterministic = request.values.get('deterministic', '').lower() in ('1', 'true', 'yes')
+        patient_id = request.values.get('patient_id', '').strip() or None
+        fingerprint = None
+        vcf_hash = None
+        vcf_content = None
+        if deterministic or RESULT_STORE is not None:
+            vcf_content = vcf_file.read()
+            vcf_hash = content_hash(vcf_content)
+            vcf_file.seek(0)
+        if deterministic:
+            patient_id = patient_id or content_patient_id(vcf_hash)
+            fingerprint = request_fingerprint(
+                vcf_hash, ','.join(d.upper() for d in drug_list), response_format, LLM_PROVIDER is not None,
+                patient_id
+            )
+            cached_etag = ETAG_CACHE.get(fingerprint)
+            if cached_etag and request.if_none_match.contains_weak(cached_etag):
+                print(f"ETag match for {patient_id} - returning 304")
+                return not_modified(cached_etag)
         
-        for drug in drug_list:
-            print(f"\n--- Processing drug: {drug} ---")
-            print(f"Drug in CPIC_ENGINE: {drug in CPIC_ENGINE}")
-            if drug in CPIC_ENGINE:
-                print(f"CPIC data for {drug}: {CPIC_ENGINE[drug]}")
+        # Admission control: cost-weighted concurrency limit, bounded queue, per-client quota
+        cost = ADMISSION.estimate_cost(request.content_length or 0, len(drug_list), LLM_PROVIDER is not None)
+        with ADMISSION.admit(client_identifier(), cost, deadline=deadline):
+            # Parse VCF file, collecting only the genes the requested drugs depend on
+            vcf_data = parse_vcf(vcf_file, genes=required_genes(drug_list, CPIC_ENGINE))
+            print(f"VCF Parse Result: {vcf_data.get('vcf_parsing_success')}")
             
-            # Match drug with VCF data
-            match_result = match_drug_with_vcf(drug, vcf_data, CPIC_ENGINE)
-            print(f"Match result: {match_result}")
-            print(f"  - valid: {match_result.get('valid')}")
-            print(f"  - gene: {match_result.get('gene')}")
-            print(f"  - gene_found_in_vcf: {match_result.get('gene_found_in_vcf')}")
-            print(f"  - variant_count: {match_result.get('variant_count')}")
+            if not vcf_data.get('vcf_parsing_success'):
+                return jsonify({
+                    "error": "VCF parsing failed",
+                    "details": vcf_data.get('error', 'Unknown error')
+                }), 400
             
-            if match_result.get('valid') and match_result.get('gene_found_in_vcf'):
-                gene = match_result.get('gene')
-                
-                # Get variants for this gene
-                gene_variants = vcf_data['variants'].get(gene, [])
-                print(f"Gene variants: {gene_variants}")
-                
-                # Determine phenotype
-                phenotype_result = determine_phenotype(gene, gene_variants)
-                print(f"Phenotype: {phenotype_result}")
-                
-                # Generate clinical recommendation using LLM
-                llm_result = None
-                if LLM_PROVIDER:
-                    try:
-                        print(f"Calling Gemini API for {drug}...")
-                        llm_prompt = prepare_llm_prompt(
-                            drug=match_result.get('drug'),
-                            gene=gene,
-                            phenotype=phenotype_result.get('phenotype'),
-                            diplotype=phenotype_result.get('diplotype'),
-                            cpic_level=match_result.get('cpic_level'),
-                            variants=gene_variants,
-                            guideline_url=match_result.get('guideline_url'),
-                            risk_assessment=None
-                        )
-                        llm_result = LLM_PROVIDER.generate_clinical_recommendation(llm_prompt)
-                        print(f"LLM response: {llm_result}")
-                    except Exception as e:
-                        print(f"⚠ LLM API error: {e}")
-                        llm_result = None
-                
-                # Build structured JSON response
-                json_response = build_response_json(
-                    drug=match_result.get('drug'),
-                    gene=gene,
-                    phenotype=phenotype_result.get('phenotype'),
-                    diplotype=phenotype_result.get('diplotype'),
-                    variant_count=match_result.get('variant_count', 0),
-                    variants=gene_variants,
-                    vcf_parsing_success=vcf_data.get('vcf_parsing_success'),
-                    cpic_level=match_result.get('cpic_level'),
-                    clinical_recommendation=llm_result.get('clinical_recommendation') if llm_result else None,
-                    llm_explanation=llm_result.get('llm_generated_explanation') if llm_result else None,
-                    guideline_url=match_result.get('guideline_url')
-                )
-                json_responses.append(json_response)
-                print(f"Added response for {drug}")
+            print(f"VCF variants keys: {list(vcf_data.get('variants', {}).keys())}")
             
-            elif match_result.get('gemini_fallback'):
-                # Drug not in CPIC - use Gemini for full analysis
-                print(f"Using Gemini fallback for {drug}")
-                
-                # All available variants from VCF
-                all_variants = []
-                for gene_variants_list in vcf_data['variants'].values():
-                    if isinstance(gene_variants_list, list):
-                        all_variants.extend(gene_variants_list)
-                
-                # Build patient-friendly Gemini prompt for drug not in CPIC
-                gemini_prompt = f"""You are a healthcare expert explaining medication genetics to a patient in simple, easy-to-understand language.
-
-PATIENT'S GENETIC PROFILE FOR: {match_result.get('drug')}
-Patient's identified genes and genetic markers: {', '.join(list(vcf_data.get('variants', {}).keys())) or 'Multiple genes detected'}
-Total genetic variants found: {len(all_variants)}
-
-IMPORTANT: This medication is not in our standard database, but we can still analyze it using the patient's genetic profile.
-
-Please provide information in this JSON format, using simple language that a patient can understand:
-{{
-  "clinical_recommendation": {{
-    "dosage_adjustment": "In simple terms, whether the patient should take more, less, or standard amounts based on their genetics",
-    "monitoring": "What the patient and their doctor should watch for or check regularly",
-    "alternative_drugs": ["Other medications that might work better based on this patient's genetics"],
-    "urgency": "How important it is to discuss this with a doctor: routine|important|urgent"
-  }},
-  "llm_generated_explanation": {{
-    "summary": "A simple 1-2 sentence explanation of how the patient's genetics might affect {match_result.get('drug')}",
-    "mechanism": "In plain English, how the patient's genetic profile affects how their body processes {match_result.get('drug')}",
-    "interaction_notes": ["Important practical tips about taking {match_result.get('drug')}", "What to discuss with their doctor"],
-    "evidence_basis": "How confident we are in this information based on available research"
-  }}
-}}
-
-Remember: Write for a patient with no medical background. Be supportive, encouraging, and clear."""
-                
-                llm_result = None
-                if LLM_PROVIDER:
-                    try:
-                        print(f"Calling Gemini API with fallback for {drug}...")
-                        llm_result = LLM_PROVIDER.generate_clinical_recommendation(gemini_prompt)
-                        print(f"LLM fallback response: {llm_result}")
-                    except Exception as e:
-                        print(f"⚠ LLM fallback error: {e}")
-                        llm_result = None
-                
-                # Build response with Gemini data
-                json_response = build_response_json(
-                    drug=match_result.get('drug'),
-                    gene="Unknown (Gemini analysis)",
-                    phenotype="Analysis by Gemini",
-                    diplotype=None,
-                    variant_count=len(all_variants),
-                    variants=all_variants,
-                    vcf_parsing_success=vcf_data.get('vcf_parsing_success'),
-                    cpic_level="Custom",
-                    clinical_recommendation=llm_result.get('clinical_recommendation') if llm_result else None,
-                    llm_explanation=llm_result.get('llm_generated_explanation') if llm_result else None,
-                    guideline_url=match_result.get('guideline_url')
-                )
-                json_responses.append(json_response)
-                print(f"Added Gemini fallback response for {drug}")
+            # Drugs already analysed for this VCF under the current knowledge base come from the store
+            stored = {}
+            if RESULT_STORE is not None:
+                stored = RESULT_STORE.get_analyses(vcf_hash, drug_list, KB_VERSION,
+                                                   require_llm=LLM_PROVIDER is not None)
+                if stored:
+                    print(f"Result store: {len(stored)} drug(s) served from stored results")
+            missing = list(dict.fromkeys(d.upper() for d in drug_list if d.upper() not in stored))
+            fresh = analyze_drugs(vcf_data, missing, CPIC_ENGINE, LLM_PROVIDER, deadline=deadline,
+                                  recommendations=CPIC_RECOMMENDATIONS, llm_cache=LLM_CACHE_STORE) if missing else []
+            by_drug = dict(stored, **{a["drug"]: a for a in fresh})
+            analyses = [by_drug[d.upper()] for d in drug_list if d.upper() in by_drug]
+            print(f"\nTotal responses: {len(analyses)}")
+
+            # One patient ID for every drug of the request and for the stored results
+            # (64 random bits, as for content_patient_id(), since history is queried by it)
+            patient_id = patient_id or f"PATIENT_{uuid.uuid4().hex[:16].upper()}"
+            json_responses = build_responses_from_analyses(
+                analyses, vcf_data.get('vcf_parsing_success'), patient_id=patient_id
+            )
+            if RESULT_STORE is not None and fresh:
+                # Store the same response objects the client receives
+                response_by_drug = {a["drug"]: r for a, r in zip(analyses, json_responses)}
+                fresh = [a for a in fresh if a["drug"] in response_by_drug]
+                RESULT_STORE.put_results(vcf_hash, KB_VERSION, fresh,
+                                         [response_by_drug[a["drug"]] for a in fresh],
+                                         vcf_content=vcf_content)
             
+            # Opt-in compact format: one patient-level profile, drugs reference genes
+            if response_format == 'compact':
+                body = build_compact_response(analyses, vcf_data, patient_id=patient_id)
             else:
-                # Drug not valid
-                print(f"Drug {drug} not valid: {match_result.get('error')}")
-        
-        print(f"\nTotal responses: {len(json_responses)}")
-        
-        return jsonify({
-            "total_analyses": len(json_responses),
-            "analyses": json_responses
-        }), 200
+                body = {
+                    "total_analyses": len(json_responses),
+                    "analyses": json_responses
+                }
+            
+            response = jsonify(body)
+            if deterministic:
+                etag = compute_etag(body)
+                # Degraded answers should not short-circuit later, complete ones
+                if not any(a.get('degraded') for a in analyses):
+                    ETAG_CACHE.put(fingerprint, etag)
+                if request.if_none_match.contains_weak(etag):
+                    return not_modified(etag)
+                response.set_etag(etag, weak=True)
+            
+            return response, 200
+    
+    except AdmissionRejected as e:
+        return shed_response(e)
     
     except Exception as e:
         print(f"Unexpected error in /api/analysis: {str(e)}")
@@ -386,5 +513,233 @@ Remember: Write for a patient with no medical background. Be supportive, encoura
         }), 500
 
 
+@app.route('/api/results', methods=['GET'])
+def api_results():
+    """
+    Query stored per-drug analysis results, newest first.
+
+    Filters (optional, combined): patient_id, vcf_hash, drug, phenotype,
+    since / until (ISO-8601 date or epoch seconds), kb_version ("current" for
+    this deployment's knowledge base), limit (default 100, at most 1000).
+    e.g. /api/results?drug=CLOPIDOGREL&phenotype=PM&since=2026-10-01
+    """
+    if RESULT_STORE is None:
+        return jsonify({"error": "Result store is disabled"}), 404
+    args = request.args
+    kb_version = args.get('kb_version')
+    try:
+        results = RESULT_STORE.query(
+            patient_id=args.get('patient_id'),
+            vcf_hash=args.get('vcf_hash'),
+            drug=args.get('drug'),
+            phenotype=args.get('phenotype'),
+            since=parse_time(args.get('since')),
+            until=parse_time(args.get('until')),
+            kb_version=KB_VERSION if kb_version == 'current' else kb_version,
+            limit=int(args.get('limit', 100))
+        )
+    except ValueError as e:
+        return jsonify({"error": "Invalid query parameter", "details": str(e)}), 400
+    return jsonify({"kb_version": KB_VERSION, "total": len(results), "results": results})
+
+
+@app.route('/api/analysis/stream', methods=['POST'])
+def api_analysis_stream():
+    """
+    Streaming variant of /api/analysis (text/event-stream).
+
+    Sends the deterministic results (phenotypes, CPIC recommendations) as soon
+    as they are computed, then forwards each drug's LLM explanation as the
+    model generates it. Events: "analysis", "explanation" (repeated),
+    "result" (one per drug), "done"; an "error" event ends a failed stream.
+    """
+    deadline = Deadline(resolve_deadline_seconds(
+        request.values.get('deadline_ms') or request.headers.get('X-Request-Deadline-Ms')
+    ))
+    
+    if 'vcf_file' not in request.files:
+        return jsonify({"error": "No VCF file provided"}), 400
+    vcf_file = request.files['vcf_file']
+    if vcf_file.filename == '':
+        return jsonify({"error": "No VCF file selected"}), 400
+    drug_list = parse_drug_list(request.form.get('drugs', ''))
+    if not drug_list:
+        return jsonify({"error": "No drugs provided"}), 400
+    
+    # The admission slot is held until the stream finishes, not just until this view returns
+    admission = ExitStack()
+    cost = ADMISSION.estimate_cost(request.content_length or 0, len(drug_list), LLM_PROVIDER is not None)
+    try:
+        admission.enter_context(ADMISSION.admit(client_identifier(), cost, deadline=deadline))
+        vcf_data = parse_vcf(vcf_file, genes=required_genes(drug_list, CPIC_ENGINE))
+    except AdmissionRejected as e:
+        return shed_response(e)
+    except Exception as e:
+        admission.close()
+        print(f"Unexpected error in /api/analysis/stream: {str(e)}")
+        return jsonify({"error": "Analysis error", "details": str(e)}), 500
+    
+    if not vcf_data.get('vcf_parsing_success'):
+        admission.close()
+        return jsonify({
+            "error": "VCF parsing failed",
+            "details": vcf_data.get('error', 'Unknown error')
+        }), 400
+    
+    def generate():
+        try:
+            for event, data in stream_analysis_events(vcf_data, drug_list, CPIC_ENGINE, LLM_PROVIDER,
+                                                      deadline=deadline, recommendations=CPIC_RECOMMENDATIONS,
+                                                      llm_cache=LLM_CACHE_STORE):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Unexpected error in /api/analysis/stream: {str(e)}")
+            yield format_sse("error", {"error": "Analysis error", "details": str(e)})
+        finally:
+            admission.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def llm_stack_stats(provider) -> dict:
+    """Counters of one provider stack built by build_llm_provider()."""
+    stats = {"model": provider_model(provider)}
+    if isinstance(provider, SingleFlightProvider):
+        stats["singleflight"] = provider.singleflight_stats()
+        provider = provider.provider
+    if isinstance(provider, HedgedProvider):
+        stats["hedging"] = provider.stats()
+    return stats
+
+
+@app.route('/api/llm/stats', methods=['GET'])
+def api_llm_stats():
+    """
+    LLM layer counters for tuning: per-tier latency/errors, hedging,
+    single-flight coalescing, the recommendation cache and latency by
+    prompt size (this worker only).
+    """
+    if LLM_PROVIDER is None:
+        return jsonify({"enabled": False})
+    body = {"enabled": True}
+    if isinstance(LLM_PROVIDER, TieredProvider):
+        body["tiers"] = {
+            tier: dict(tier_provider.stats(), **llm_stack_stats(tier_provider.provider))
+            for tier, tier_provider in LLM_PROVIDER.tiers.items()
+        }
+    else:
+        body.update(llm_stack_stats(LLM_PROVIDER))
+    if LLM_CACHE_STORE is not None:
+        body["cache"] = LLM_CACHE_STORE.stats()
+    body["prompts"] = PROMPT_STATS.snapshot()
+    return jsonify(body)
+
+def analyze_genotype_entry(entry, default_drugs, response_format: str, llm_provider, deadline) -> dict:
+    """
+    Analyze one patient from /api/genotypes.
+
+    Returns:
+    --------
+    dict
+        The same body /api/analysis returns for one VCF (full or compact),
+        or {"patient_id", "error", "details"} if the entry is invalid
+    """
+    patient_id = entry.get('patient_id') if isinstance(entry, dict) else None
+    patient_id = str(patient_id) if patient_id else f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
+    try:
+        if not isinstance(entry, dict):
+            raise GenotypeInputError("Each patient must be a JSON object")
+        drug_list = parse_drug_list(entry.get('drugs', default_drugs))
+        if not drug_list:
+            raise GenotypeInputError("No drugs provided")
+        vcf_data = genotypes_to_vcf_data(entry.get('genotypes'))
+    except GenotypeInputError as e:
+        return {"patient_id": patient_id, "error": "Invalid genotype payload", "details": str(e)}
+
+    analyses = analyze_drugs(vcf_data, drug_list, CPIC_ENGINE, llm_provider, deadline=deadline,
+                             verbose=False, recommendations=CPIC_RECOMMENDATIONS, llm_cache=LLM_CACHE_STORE)
+    if response_format == 'compact':
+        return build_compact_response(analyses, vcf_data, patient_id=patient_id)
+    json_responses = build_responses_from_analyses(analyses, True, patient_id=patient_id)
+    return {
+        "patient_id": patient_id,
+        "total_analyses": len(json_responses),
+        "analyses": json_responses
+    }
+
+
+@app.route('/api/genotypes', methods=['POST'])
+def api_genotypes():
+    """
+    API endpoint for pre-called star alleles (EHR / LIMS), skipping VCF parsing.
+
+    Body (JSON), one patient:
+        {"patient_id": "P1", "genotypes": {"CYP2D6": "*1/*4"}, "drugs": ["CODEINE"]}
+    or a batch (per-patient "drugs" override the shared list):
+        {"drugs": "CODEINE,CLOPIDOGREL", "patients": [{"patient_id": ..., "genotypes": {...}}, ...]}
+
+    Optional: "format": "compact", "llm": true (LLM enrichment is off by
+    default so order-time lookups stay fast), "deadline_ms".
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+
+    deadline = Deadline(resolve_deadline_seconds(
+        payload.get('deadline_ms') or request.headers.get('X-Request-Deadline-Ms')
+    ))
+    batch = 'patients' in payload
+    patients = payload.get('patients') if batch else [payload]
+    if not isinstance(patients, list) or not patients:
+        return jsonify({"error": "'patients' must be a non-empty list"}), 400
+    if len(patients) > MAX_GENOTYPE_BATCH:
+        return jsonify({
+            "error": "Batch too large",
+            "details": f"At most {MAX_GENOTYPE_BATCH} patients per request"
+        }), 413
+
+    default_drugs = payload.get('drugs') if batch else None
+    response_format = str(payload.get('format', '')).lower()
+    llm_provider = LLM_PROVIDER if payload.get('llm') is True else None
+
+    try:
+        drug_count = sum(
+            len(parse_drug_list(p.get('drugs', default_drugs))) if isinstance(p, dict) else 0
+            for p in patients
+        )
+        cost = ADMISSION.estimate_cost(request.content_length or 0, drug_count, llm_provider is not None)
+        with ADMISSION.admit(client_identifier(), cost, deadline=deadline):
+            results = [
+                analyze_genotype_entry(entry, default_drugs, response_format, llm_provider, deadline)
+                for entry in patients
+            ]
+
+        if not batch:
+            if 'error' in results[0]:
+                return jsonify(results[0]), 400
+            return jsonify(results[0]), 200
+
+        print(f"Genotype batch: {len(results)} patients, {drug_count} drug lookups")
+        return jsonify({
+            "total_patients": len(results),
+            "failed": sum(1 for r in results if 'error' in r),
+            "results": results
+        }), 200
+
+    except AdmissionRejected as e:
+        return shed_response(e)
+
+    except Exception as e:
+        print(f"Unexpected error in /api/genotypes: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "error": "Analysis error",
+            "details": str(e)
+        }), 500
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
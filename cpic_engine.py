@@ -1,6 +1,13 @@
+import json
+import threading
+from pathlib import Path
+
 from services.cpic_loader import load_cpic_data
 
 
+CPIC_PAIRS_FILE = Path(__file__).resolve().parent / "data" / "cpic_gene-drug_pairs.xlsx"
+
+
 SUPPORTED_DRUGS = [
     "CODEINE",
     "WARFARIN",
@@ -66,3 +73,82 @@ def initialize_cpic_engine(filepath: str) -> dict:
     print(f"Loaded {len(supported_cpic_data)} supported drugs from CPIC dataset.")
     
     return supported_cpic_data
+
+
+def load_recommendation_table(filepath: str) -> dict:
+    """
+    Load the versioned CPIC recommendation table and index it by (drug, phenotype).
+    
+    Parameters:
+    -----------
+    filepath : str
+        Path to the JSON table (e.g., data/cpic_recommendations.json)
+        
+    Returns:
+    --------
+    dict
+        {
+            "version": "2026.10",
+            "recommendations": {
+                ("CODEINE", "PM"): {"dosage_adjustment": ..., "monitoring": ...,
+                                    "alternative_drugs": [...], "urgency": "urgent"},
+                ...
+            }
+        }
+    """
+    with open(filepath, encoding="utf-8") as handle:
+        document = json.load(handle)
+    
+    index = {}
+    for entry in document.get("recommendations", []):
+        key = (entry["drug"].strip().upper(), entry["phenotype"].strip().upper())
+        index[key] = {
+            "dosage_adjustment": entry["dosage_adjustment"],
+            "monitoring": entry["monitoring"],
+            "alternative_drugs": list(entry.get("alternative_drugs", [])),
+            "urgency": entry.get("urgency", "routine")
+        }
+    
+    print(f"Loaded {len(index)} CPIC recommendations (table version {document.get('version')}).")
+    
+    return {
+        "version": document.get("version"),
+        "recommendations": index
+    }
+
+
+def lookup_recommendation(table: dict, drug: str, phenotype: str):
+    """
+    Return the CPIC recommendation for a drug/phenotype pair, or None.
+    
+    The result is a fresh copy, so callers may modify it.
+    """
+    if not table or not drug or not phenotype:
+        return None
+    entry = table["recommendations"].get((str(drug).strip().upper(), str(phenotype).strip().upper()))
+    if entry is None:
+        return None
+    return dict(entry, alternative_drugs=list(entry["alternative_drugs"]))
+
+
+_DRUG_GENES = None
+_DRUG_GENES_LOCK = threading.Lock()
+
+
+def get_drug_genes() -> dict:
+    """
+    Return every drug in the CPIC table with all genes paired with it, loaded once per process.
+    
+    Unlike initialize_cpic_engine() this covers drugs outside SUPPORTED_DRUGS,
+    so the fallback LLM prompt can focus on the genes that matter for the drug.
+    Example: {"IBUPROFEN": ["CYP2C9", "CYP2C8"], ...}
+    """
+    global _DRUG_GENES
+    if _DRUG_GENES is None:
+        with _DRUG_GENES_LOCK:
+            if _DRUG_GENES is None:
+                _DRUG_GENES = {
+                    drug: [gene.upper() for gene in info["genes"]]
+                    for drug, info in load_cpic_data(str(CPIC_PAIRS_FILE)).items()
+                }
+    return _DRUG_GENES
@@ -0,0 +1,32 @@
+"""
+Gunicorn configuration for PharmaGuard (loaded automatically by `gunicorn app:app`).
+
+The default worker class is gevent: each worker runs many requests as green
+threads, and the LLM providers' HTTP calls and retry backoff sleeps yield to
+other requests instead of pinning the worker. Set GUNICORN_WORKER_CLASS=sync
+to get the classic one-request-per-worker model back.
+"""
+
+import os
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+workers = int(os.getenv("GUNICORN_WORKERS", os.getenv("WEB_CONCURRENCY", "2")))
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+
+# Concurrent requests per gevent worker (ignored by sync workers)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+
+# LLM-bound requests can legitimately take a while; this is the per-request
+# limit for sync workers and the heartbeat limit for gevent workers
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# The app must be imported after gevent has monkey-patched the standard
+# library, so it is loaded in each worker rather than in the master
+preload_app = False
+
+accesslog = "-"
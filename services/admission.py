@@ -0,0 +1,172 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, amount: float) -> float:
+        """
+        Take `amount` tokens if available.
+
+        Returns:
+        --------
+        float
+            0.0 if the tokens were taken, otherwise seconds until they would be available
+        """
+        now = time.monotonic()
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    Cost-weighted admission control for analysis requests (per worker process).
+
+    - At most `capacity` cost units run concurrently; a single request never
+      costs more than half the capacity, so one huge upload cannot lock out
+      small requests.
+    - Up to `max_queue` requests wait (at most `max_wait` seconds) for capacity;
+      beyond that requests are rejected immediately with 503 + Retry-After.
+    - Each client has a token bucket of cost units; exhausting it yields 429.
+    """
+
+    def __init__(self, capacity: float = None, max_queue: int = None, max_wait: float = None,
+                 client_rate: float = None, client_burst: float = None, llm_weight: float = None):
+        self.capacity = capacity if capacity is not None else float(os.getenv("ADMISSION_CAPACITY", "200"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "5"))
+        self.client_rate = client_rate if client_rate is not None else float(os.getenv("ADMISSION_CLIENT_RATE", "20"))
+        self.client_burst = client_burst if client_burst is not None else float(os.getenv("ADMISSION_CLIENT_BURST", "200"))
+        self.llm_weight = llm_weight if llm_weight is not None else float(os.getenv("ADMISSION_LLM_WEIGHT", "2"))
+        self.max_request_cost = self.capacity / 2
+
+        self._condition = threading.Condition()
+        self._in_use = 0.0
+        self._waiting = 0
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._avg_service_seconds = 1.0
+
+    def estimate_cost(self, content_length: int, drug_count: int, llm_enabled: bool) -> float:
+        """
+        Estimate a request's cost in capacity units.
+
+        Parameters:
+        -----------
+        content_length : int
+            Upload size in bytes (VCF + form)
+        drug_count : int
+            Number of drugs requested
+        llm_enabled : bool
+            Whether LLM enrichment will run for this request
+
+        Returns:
+        --------
+        float
+            (1 + size in MB) x drugs x LLM weight, capped at half the capacity
+        """
+        size_factor = 1.0 + (content_length or 0) / (1024 * 1024)
+        cost = size_factor * max(1, drug_count) * (self.llm_weight if llm_enabled else 1.0)
+        return min(cost, self.max_request_cost)
+
+    def _check_quota(self, client_id: str, cost: float):
+        with self._buckets_lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) > 10000:
+                    # Forget idle clients (full buckets carry no state worth keeping)
+                    self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full()}
+                bucket = TokenBucket(self.client_rate, self.client_burst)
+                self._buckets[client_id] = bucket
+            wait = bucket.try_consume(cost)
+        if wait > 0:
+            raise AdmissionRejected(429, max(1, math.ceil(wait)), "Client quota exceeded")
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_service_seconds))
+
+    @contextmanager
+    def admit(self, client_id: str, cost: float, deadline=None):
+        """
+        Hold `cost` units of capacity for the duration of the with-block.
+
+        Raises:
+        -------
+        AdmissionRejected
+            429 if the client's quota is exhausted, 503 if the wait queue is
+            full or capacity did not free up within the allowed wait
+        """
+        self._check_quota(client_id, cost)
+
+        max_wait = self.max_wait
+        if deadline is not None:
+            max_wait = min(max_wait, deadline.remaining())
+
+        with self._condition:
+            if self._in_use + cost > self.capacity:
+                if self._waiting >= self.max_queue:
+                    raise AdmissionRejected(503, self._retry_after(), "Server busy - queue full")
+                self._waiting += 1
+                try:
+                    wait_until = time.monotonic() + max_wait
+                    while self._in_use + cost > self.capacity:
+                        remaining = wait_until - time.monotonic()
+                        if remaining <= 0:
+                            raise AdmissionRejected(503, self._retry_after(), "Server busy - timed out waiting for capacity")
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += cost
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._condition:
+                self._in_use -= cost
+                self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * elapsed
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Current load, for monitoring."""
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "in_use": round(self._in_use, 2),
+                "waiting": self._waiting,
+                "max_queue": self.max_queue,
+                "avg_service_seconds": round(self._avg_service_seconds, 3)
+            }
@@ -0,0 +1,550 @@
+import os
+import time
+import uuid
+
+from cpic_engine import get_drug_genes, lookup_recommendation
+from services.deadline import DeadlineExceeded
+from services.drug_gene_matcher import match_drug_with_vcf
+from services.llm_cache import is_cacheable, provider_model, recommendation_cache_key
+from services.llm_service import default_recommendation, extract_json
+from services.llm_stream import PartialJSONFieldExtractor
+from services.llm_tiering import route_provider
+from services.phenotype_engine import determine_phenotype
+from services.prompt_budget import PROMPT_STATS, estimate_tokens
+from services.response_builder import (
+    build_responses_from_analyses, prepare_llm_prompt, prepare_fallback_llm_prompt, prepare_batch_llm_prompt
+)
+
+
+# Batched prompting: one LLM call covers up to LLM_BATCH_SIZE drugs of a request
+LLM_BATCH_MODE = os.getenv("LLM_BATCH_MODE", "false").lower() in ("1", "true", "yes")
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+# Calls per chunk: the first, plus retries limited to the items that came back invalid
+LLM_BATCH_ATTEMPTS = 2
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def _generate_within_deadline(llm_provider, build_prompt, deadline, drug: str, usage: dict = None) -> tuple:
+    """
+    Call the LLM provider unless the request deadline has run out.
+
+    The estimated prompt size is stored in usage["prompt_tokens"] (when a
+    dict is given) and recorded with the call latency in PROMPT_STATS.
+
+    Returns:
+    --------
+    tuple
+        (llm_result or None, degraded) - degraded results carry the deterministic
+        default_recommendation() instead of an LLM response
+    """
+    if deadline and deadline.expired():
+        print(f"⚠ Deadline reached - skipping LLM for {drug}")
+        return default_recommendation(), True
+    prompt = build_prompt()
+    prompt_tokens = estimate_tokens(prompt)
+    if usage is not None:
+        usage["prompt_tokens"] = prompt_tokens
+    started = time.monotonic()
+    try:
+        print(f"Calling LLM API for {drug} (~{prompt_tokens} prompt tokens)...")
+        llm_result = llm_provider.generate_clinical_recommendation(prompt, deadline=deadline)
+        elapsed = time.monotonic() - started
+        PROMPT_STATS.record(prompt_tokens, elapsed)
+        print(f"LLM response ({elapsed:.2f}s): {llm_result}")
+        return llm_result, False
+    except DeadlineExceeded as e:
+        print(f"⚠ Deadline exceeded during LLM call for {drug}: {e}")
+        return default_recommendation(), True
+    except Exception as e:
+        print(f"⚠ LLM API error: {e}")
+        return None, False
+
+
+def _cache_fields(analysis_or_match: dict, phenotype_result: dict = None) -> dict:
+    """Fields of the LLM cache key for a CPIC drug analysis."""
+    source = phenotype_result or analysis_or_match
+    return {
+        "drug": analysis_or_match.get("drug"),
+        "gene": analysis_or_match.get("gene"),
+        "phenotype": source.get("phenotype"),
+        "diplotype": source.get("diplotype"),
+        "cpic_level": analysis_or_match.get("cpic_level")
+    }
+
+
+def _generate_with_cache(llm_provider, llm_cache, cache_fields: dict, build_prompt, deadline, drug: str,
+                         usage: dict = None) -> tuple:
+    """
+    _generate_within_deadline() behind the persistent LLM recommendation cache.
+
+    Only real (non-degraded, non-fallback) answers are stored. Cache hits
+    send no prompt, so `usage` is left untouched.
+    """
+    if llm_cache is None:
+        return _generate_within_deadline(llm_provider, build_prompt, deadline, drug, usage)
+    model = provider_model(llm_provider)
+    key = recommendation_cache_key(model=model, **cache_fields)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        print(f"LLM cache hit for {drug}")
+        return cached, False
+    usage = {} if usage is None else usage
+    llm_result, degraded = _generate_within_deadline(llm_provider, build_prompt, deadline, drug, usage)
+    if not degraded and is_cacheable(llm_result):
+        llm_cache.put(key, llm_result, model, prompt_tokens=usage.get("prompt_tokens"), **cache_fields)
+    return llm_result, degraded
+
+
+def _valid_batch_item(item, explanation_only: bool) -> bool:
+    """Check one element of a batched LLM answer before it is used."""
+    if not isinstance(item, dict):
+        return False
+    explanation = item.get("llm_generated_explanation")
+    if not isinstance(explanation, dict) or not explanation.get("summary"):
+        return False
+    if explanation_only:
+        return True
+    recommendation = item.get("clinical_recommendation")
+    return isinstance(recommendation, dict) and bool(recommendation.get("dosage_adjustment"))
+
+
+def _enrich_in_batches(analyses: list, llm_provider, variants_by_gene: dict, gene_profiles: dict, deadline, log):
+    """
+    Fill LLM fields for all analyses with one structured call per chunk of drugs.
+
+    Each answer element is validated on its own; only the drugs whose element
+    was missing or invalid are sent again. Drugs still unanswered after
+    LLM_BATCH_ATTEMPTS get default_recommendation() (degraded if the deadline
+    ran out).
+    """
+    for start in range(0, len(analyses), max(1, LLM_BATCH_SIZE)):
+        pending = analyses[start:start + max(1, LLM_BATCH_SIZE)]
+        out_of_time = False
+
+        for attempt in range(LLM_BATCH_ATTEMPTS):
+            if deadline and deadline.expired():
+                out_of_time = True
+                break
+
+            # Shared context: only the genes these drugs depend on
+            genes = []
+            for analysis in pending:
+                for gene in ([analysis["gene"]] if analysis["gene"] else analysis["genes"]):
+                    if gene not in genes:
+                        genes.append(gene)
+            patient_genes = {
+                gene: gene_profiles.get(gene, {"variant_count": len(variants_by_gene.get(gene, []))})
+                for gene in genes
+            }
+            items = [{
+                "drug": analysis["drug"],
+                "gene": analysis["gene"],
+                "cpic_level": analysis["cpic_level"],
+                "guideline_url": analysis["guideline_url"],
+                "explanation_only": analysis["recommendation_source"] is not None
+            } for analysis in pending]
+
+            prompt = prepare_batch_llm_prompt(patient_genes, items)
+            prompt_tokens = estimate_tokens(prompt)
+            log(f"Calling LLM API for {len(pending)} drugs in one batch "
+                f"(attempt {attempt + 1}, ~{prompt_tokens} prompt tokens)...")
+            started = time.monotonic()
+            try:
+                answer = llm_provider.generate_json(prompt, deadline=deadline)
+            except DeadlineExceeded as e:
+                print(f"⚠ Deadline exceeded during batched LLM call: {e}")
+                out_of_time = True
+                break
+            PROMPT_STATS.record(prompt_tokens, time.monotonic() - started)
+
+            answer = answer if isinstance(answer, list) else []
+            by_drug = {}
+            for position, element in enumerate(answer):
+                if isinstance(element, dict):
+                    name = str(element.get("drug") or "").strip().upper()
+                    # Unnamed elements are matched by position
+                    if not name and position < len(pending):
+                        name = pending[position]["drug"]
+                    by_drug.setdefault(name, element)
+
+            still_pending = []
+            for analysis, item in zip(pending, items):
+                element = by_drug.get(analysis["drug"])
+                if not _valid_batch_item(element, item["explanation_only"]):
+                    still_pending.append(analysis)
+                    continue
+                analysis["llm_explanation"] = element["llm_generated_explanation"]
+                analysis["prompt_tokens"] = prompt_tokens
+                if not item["explanation_only"]:
+                    analysis["clinical_recommendation"] = element["clinical_recommendation"]
+                    analysis["recommendation_source"] = "llm"
+
+            if still_pending:
+                log(f"⚠ Batched LLM answer missing or invalid for: {', '.join(a['drug'] for a in still_pending)}")
+            pending = still_pending
+            if not pending:
+                break
+
+        for analysis in pending:
+            fallback = default_recommendation()
+            analysis["llm_explanation"] = fallback["llm_generated_explanation"]
+            if analysis["recommendation_source"] is None:
+                analysis["clinical_recommendation"] = fallback["clinical_recommendation"]
+            analysis["degraded"] = out_of_time or bool(deadline and deadline.expired())
+
+
+def recommendation_source(table_recommendation, llm_result, degraded: bool, recommendations: dict = None):
+    """Label where an analysis' clinical_recommendation came from (None = placeholder)."""
+    if table_recommendation:
+        return f"cpic_table:{recommendations.get('version')}"
+    if llm_result and not degraded:
+        return "llm"
+    return None
+
+
+def required_genes(drug_list: list, cpic_engine: dict):
+    """
+    Genes analyze_drugs() reads for these drugs, for parse_vcf(genes=...).
+
+    A CPIC drug only needs its own gene; a drug outside the CPIC engine is
+    explained from every gene in the VCF, so any such drug returns None
+    (parse all supported genes).
+    """
+    genes = set()
+    for drug in drug_list:
+        info = cpic_engine.get(str(drug).strip().upper())
+        if not info or not info.get("gene"):
+            return None
+        genes.add(info["gene"].upper())
+    return genes
+
+
+def analyze_drugs(vcf_data: dict, drug_list: list, cpic_engine: dict, llm_provider=None, deadline=None,
+                  verbose: bool = True, recommendations: dict = None, batch_llm: bool = None,
+                  llm_cache=None) -> list:
+    """
+    Run drug matching, phenotyping and (optional) LLM enrichment for each drug.
+
+    The result is format-neutral: response_builder turns it into either the
+    per-drug schema (build_responses_from_analyses) or the compact patient-level
+    schema (build_compact_response).
+
+    Parameters:
+    -----------
+    vcf_data : dict
+        Parsed VCF data from vcf_parser.parse_vcf()
+    drug_list : list
+        Drug names as entered by the user
+    cpic_engine : dict
+        CPIC data from cpic_engine.initialize_cpic_engine()
+    llm_provider : LLMProvider
+        Provider used for clinical recommendations (None disables LLM calls)
+    deadline : Deadline
+        Request time budget; once it runs out the remaining drugs get the
+        deterministic default recommendation and are marked as degraded
+    verbose : bool
+        Print per-drug progress (disable for high-volume batch calls)
+    recommendations : dict
+        CPIC recommendation table from cpic_engine.load_recommendation_table();
+        a matching (drug, phenotype) entry fills clinical_recommendation
+        deterministically and the LLM only supplies the explanation
+    batch_llm : bool
+        Enrich all drugs with one structured LLM call per LLM_BATCH_SIZE drugs
+        instead of one call per drug (default: LLM_BATCH_MODE env setting);
+        needs a provider with generate_json()
+    llm_cache : RecommendationCache
+        Persistent LLM answer cache (services/llm_cache.py) consulted before
+        per-drug CPIC prompts; batched and fallback prompts are not cached
+
+    Returns:
+    --------
+    list
+        One analysis dict per analyzable drug:
+        {
+            "drug": "CODEINE",
+            "gene": "CYP2D6",             # None for Gemini fallback drugs
+            "genes": ["CYP2D6"],           # genes whose profile the analysis uses
+            "phenotype": "PM",
+            "diplotype": "*4/*4",
+            "variant_count": 3,
+            "variants": [...],
+            "cpic_level": "A",
+            "guideline_url": "...",
+            "clinical_recommendation": {...} or None,
+            "llm_explanation": {...} or None,
+            "gemini_fallback": False,
+            "degraded": False,             # True if the LLM step was skipped for time
+            "recommendation_source": "cpic_table:2026.10",  # or "llm" / None
+            "prompt_tokens": 610,          # estimated LLM prompt size (None if not sent)
+            "qc_rejected": {"CYP2D6": {"GT!=0/0": 12}}  # calls dropped by VCF QC, per gene and filter
+        }
+    """
+    log = print if verbose else _quiet
+    variants_by_gene = vcf_data.get('variants', {})
+    qc_rejected = (vcf_data.get('qc') or {}).get('rejected', {})
+    phenotype_cache = {}
+    analyses = []
+
+    if batch_llm is None:
+        batch_llm = LLM_BATCH_MODE
+    batch_llm = bool(batch_llm and llm_provider and hasattr(llm_provider, "generate_json"))
+    # In batch mode the per-drug loop skips the LLM; it is called once afterwards
+    inline_provider = None if batch_llm else llm_provider
+
+    for drug in drug_list:
+        log(f"\n--- Processing drug: {drug} ---")
+
+        # Match drug with VCF data
+        match_result = match_drug_with_vcf(drug, vcf_data, cpic_engine)
+        log(f"Match result: {match_result}")
+
+        if match_result.get('valid') and match_result.get('gene_found_in_vcf'):
+            gene = match_result.get('gene')
+            gene_variants = variants_by_gene.get(gene, [])
+
+            # Phenotype depends only on the gene, so share it across drugs
+            if gene not in phenotype_cache:
+                phenotype_cache[gene] = determine_phenotype(gene, gene_variants)
+            phenotype_result = phenotype_cache[gene]
+            log(f"Phenotype: {phenotype_result}")
+
+            # Guideline recommendation from the CPIC table when one exists
+            table_recommendation = lookup_recommendation(
+                recommendations, match_result.get('drug'), phenotype_result.get('phenotype')
+            )
+
+            # Generate clinical recommendation (or just the explanation) using LLM
+            llm_result = None
+            degraded = False
+            usage = {}
+            if inline_provider:
+                llm_result, degraded = _generate_with_cache(
+                    route_provider(inline_provider, phenotype_result.get('phenotype'),
+                                   match_result.get('cpic_level'), match_result.get('drug')),
+                    llm_cache,
+                    _cache_fields(match_result, phenotype_result),
+                    lambda: prepare_llm_prompt(
+                        drug=match_result.get('drug'),
+                        gene=gene,
+                        phenotype=phenotype_result.get('phenotype'),
+                        diplotype=phenotype_result.get('diplotype'),
+                        cpic_level=match_result.get('cpic_level'),
+                        variants=gene_variants,
+                        guideline_url=match_result.get('guideline_url'),
+                        risk_assessment=None
+                    ),
+                    deadline,
+                    drug,
+                    usage
+                )
+
+            analyses.append({
+                "drug": match_result.get('drug'),
+                "gene": gene,
+                "genes": [gene],
+                "phenotype": phenotype_result.get('phenotype'),
+                "diplotype": phenotype_result.get('diplotype'),
+                "variant_count": match_result.get('variant_count', 0),
+                "variants": gene_variants,
+                "cpic_level": match_result.get('cpic_level'),
+                "guideline_url": match_result.get('guideline_url'),
+                "clinical_recommendation": table_recommendation or (llm_result.get('clinical_recommendation') if llm_result else None),
+                "llm_explanation": llm_result.get('llm_generated_explanation') if llm_result else None,
+                "gemini_fallback": False,
+                "degraded": degraded,
+                "recommendation_source": recommendation_source(table_recommendation, llm_result, degraded, recommendations),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "qc_rejected": {gene: qc_rejected[gene]} if qc_rejected.get(gene) else {}
+            })
+            log(f"Added response for {drug}")
+
+        elif match_result.get('gemini_fallback'):
+            # Drug not in CPIC - use Gemini for full analysis
+            log(f"Using Gemini fallback for {drug}")
+
+            # All available variants from VCF
+            all_variants = []
+            for gene_variants_list in variants_by_gene.values():
+                if isinstance(gene_variants_list, list):
+                    all_variants.extend(gene_variants_list)
+
+            llm_result = None
+            degraded = False
+            usage = {}
+            if inline_provider:
+                llm_result, degraded = _generate_within_deadline(
+                    route_provider(inline_provider, None, gemini_fallback=True),
+                    lambda: prepare_fallback_llm_prompt(
+                        drug=match_result.get('drug'),
+                        genes=list(variants_by_gene.keys()),
+                        variant_count=len(all_variants),
+                        variants_by_gene=variants_by_gene,
+                        focus_genes=get_drug_genes().get(match_result.get('drug'), [])
+                    ),
+                    deadline,
+                    drug,
+                    usage
+                )
+
+            analyses.append({
+                "drug": match_result.get('drug'),
+                "gene": None,
+                "genes": [g for g, v in variants_by_gene.items() if v],
+                "phenotype": "Analysis by Gemini",
+                "diplotype": None,
+                "variant_count": len(all_variants),
+                "variants": all_variants,
+                "cpic_level": "Custom",
+                "guideline_url": match_result.get('guideline_url'),
+                "clinical_recommendation": llm_result.get('clinical_recommendation') if llm_result else None,
+                "llm_explanation": llm_result.get('llm_generated_explanation') if llm_result else None,
+                "gemini_fallback": True,
+                "degraded": degraded,
+                "recommendation_source": recommendation_source(None, llm_result, degraded),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "qc_rejected": {g: counts for g, counts in sorted(qc_rejected.items()) if counts}
+            })
+            log(f"Added Gemini fallback response for {drug}")
+
+        else:
+            # Drug not valid
+            log(f"Drug {drug} not valid: {match_result.get('error')}")
+
+    if batch_llm and analyses:
+        gene_profiles = {
+            gene: {
+                "diplotype": result.get("diplotype"),
+                "phenotype": result.get("phenotype"),
+                "variant_count": len(variants_by_gene.get(gene, []))
+            }
+            for gene, result in phenotype_cache.items()
+        }
+        _enrich_in_batches(analyses, llm_provider, variants_by_gene, gene_profiles, deadline, log)
+
+    return analyses
+
+
+def _analysis_prompt(analysis: dict, variants_by_gene: dict) -> str:
+    """Rebuild the per-drug LLM prompt analyze_drugs() would send for an analysis."""
+    if analysis["gemini_fallback"]:
+        return prepare_fallback_llm_prompt(
+            drug=analysis["drug"],
+            genes=list(variants_by_gene.keys()),
+            variant_count=analysis["variant_count"],
+            variants_by_gene=variants_by_gene,
+            focus_genes=get_drug_genes().get(analysis["drug"], [])
+        )
+    return prepare_llm_prompt(
+        drug=analysis["drug"],
+        gene=analysis["gene"],
+        phenotype=analysis["phenotype"],
+        diplotype=analysis["diplotype"],
+        cpic_level=analysis["cpic_level"],
+        variants=analysis["variants"],
+        guideline_url=analysis["guideline_url"],
+        risk_assessment=None
+    )
+
+
+def _stream_recommendation(llm_provider, prompt: str, deadline, drug: str):
+    """
+    Stream one drug's LLM answer, yielding ("explanation", {...}) events.
+
+    The generator's return value is (llm_result or None, degraded), like
+    _generate_within_deadline(). Providers without a streaming mode, and
+    streams that fail before producing any text, fall back to the normal call.
+    A streamed answer that does not parse is requested again through the
+    normal call, as the non-streaming path would, rather than replaced by a
+    placeholder that would be labelled as an LLM answer.
+    """
+    if deadline and deadline.expired():
+        print(f"⚠ Deadline reached - skipping LLM for {drug}")
+        return default_recommendation(), True
+
+    prompt_tokens = estimate_tokens(prompt)
+    started = time.monotonic()
+    extractor = PartialJSONFieldExtractor()
+    chunks = []
+    try:
+        for chunk in llm_provider.stream_text(prompt, deadline=deadline):
+            chunks.append(chunk)
+            for field, delta in extractor.feed(chunk):
+                yield "explanation", {"drug": drug, "field": field, "delta": delta}
+    except DeadlineExceeded as e:
+        print(f"⚠ Deadline exceeded while streaming LLM answer for {drug}: {e}")
+        return default_recommendation(), True
+    except Exception as e:
+        if chunks:
+            print(f"⚠ LLM stream for {drug} ended early: {e}")
+        else:
+            if not isinstance(e, NotImplementedError):
+                print(f"⚠ LLM streaming unavailable for {drug} ({e}) - using a normal call")
+            return _generate_within_deadline(llm_provider, lambda: prompt, deadline, drug)
+
+    PROMPT_STATS.record(prompt_tokens, time.monotonic() - started)
+    llm_result = extract_json("".join(chunks))
+    if not isinstance(llm_result, dict):
+        print(f"⚠ Could not parse streamed LLM answer for {drug} - using a normal call")
+        return _generate_within_deadline(llm_provider, lambda: prompt, deadline, drug)
+    return llm_result, False
+
+
+def stream_analysis_events(vcf_data: dict, drug_list: list, cpic_engine: dict, llm_provider=None, deadline=None,
+                           recommendations: dict = None, patient_id: str = None, llm_cache=None):
+    """
+    Run the analysis and yield server-sent-event payloads as results become available.
+
+    The deterministic part (matching, phenotyping, CPIC table) is computed up
+    front and sent immediately; the LLM explanation for each drug is then
+    streamed field by field while the model generates it.
+
+    Yields:
+    -------
+    tuple
+        (event, data) pairs, in this order:
+        ("analysis", {"patient_id", "results": [per-drug responses without LLM text]})
+        ("explanation", {"drug", "field", "delta"})     # repeated while streaming
+        ("result", per-drug response)                   # once per drug, final
+        ("done", {"patient_id", "total_analyses"})
+    """
+    patient_id = patient_id or f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
+    variants_by_gene = vcf_data.get('variants', {})
+    analyses = analyze_drugs(vcf_data, drug_list, cpic_engine, None, deadline=deadline,
+                             verbose=False, recommendations=recommendations)
+
+    yield "analysis", {
+        "patient_id": patient_id,
+        "results": build_responses_from_analyses(analyses, True, patient_id)
+    }
+
+    for analysis in analyses:
+        if llm_provider:
+            provider = route_provider(llm_provider, analysis["phenotype"], analysis["cpic_level"],
+                                      analysis["drug"], analysis["gemini_fallback"])
+            model = provider_model(provider)
+            cache_key = None
+            llm_result = None
+            if llm_cache is not None and not analysis["gemini_fallback"]:
+                cache_key = recommendation_cache_key(model=model, **_cache_fields(analysis))
+                llm_result = llm_cache.get(cache_key)
+            if llm_result is not None:
+                degraded = False
+            else:
+                prompt = _analysis_prompt(analysis, variants_by_gene)
+                llm_result, degraded = yield from _stream_recommendation(provider, prompt, deadline, analysis["drug"])
+                if not degraded:
+                    analysis["prompt_tokens"] = estimate_tokens(prompt)
+                if cache_key and not degraded and is_cacheable(llm_result):
+                    llm_cache.put(cache_key, llm_result, model, prompt_tokens=analysis["prompt_tokens"],
+                                  **_cache_fields(analysis))
+            analysis["llm_explanation"] = llm_result.get('llm_generated_explanation') if llm_result else None
+            if analysis["recommendation_source"] is None:
+                analysis["clinical_recommendation"] = llm_result.get('clinical_recommendation') if llm_result else None
+                analysis["recommendation_source"] = recommendation_source(None, llm_result, degraded)
+            analysis["degraded"] = degraded
+        yield "result", build_responses_from_analyses([analysis], True, patient_id)[0]
+
+    yield "done", {"patient_id": patient_id, "total_analyses": len(analyses)}
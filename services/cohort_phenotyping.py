@@ -0,0 +1,147 @@
+import threading
+
+import numpy as np
+
+from services.phenotype_engine import PHENOTYPE_MAP, determine_phenotype
+from services.star_allele_caller import get_star_allele_caller
+
+
+# Phenotype codes returned by phenotype_cohort (index into this tuple)
+PHENOTYPE_LABELS = ("Unknown", "PM", "IM", "NM", "RM", "URM")
+CONFIDENCE_LABELS = ("low", "medium", "high")
+
+
+class CohortPhenotyper:
+    """
+    Batch phenotyping for one gene over integer-encoded allele pairs.
+
+    Every (allele1, allele2) combination of the gene's allele vocabulary is
+    run through determine_phenotype() once at construction, so the results
+    follow exactly the same rules as per-patient calls. Phenotyping a cohort
+    is then a fancy-indexing lookup into K x K matrices.
+    """
+
+    def __init__(self, gene: str):
+        self.gene = str(gene).strip().upper()
+
+        alleles = []
+        caller = get_star_allele_caller(self.gene)
+        if caller is not None:
+            alleles.extend(caller.allele_names)
+        for diplotype in PHENOTYPE_MAP.get(self.gene, {}):
+            alleles.extend(diplotype.split("/", 1))
+        self.alleles = list(dict.fromkeys(alleles))
+        self.allele_codes = {name: code for code, name in enumerate(self.alleles)}
+
+        size = len(self.alleles)
+        phenotype_index = {label: code for code, label in enumerate(PHENOTYPE_LABELS)}
+        confidence_index = {label: code for code, label in enumerate(CONFIDENCE_LABELS)}
+        self.phenotype_matrix = np.zeros((size, size), dtype=np.int8)
+        self.confidence_matrix = np.zeros((size, size), dtype=np.int8)
+        self.diplotype_matrix = np.zeros((size, size), dtype=np.int32)
+        self.diplotype_labels = []
+        diplotype_codes = {}
+
+        for i, a1 in enumerate(self.alleles):
+            for j, a2 in enumerate(self.alleles):
+                result = determine_phenotype(self.gene, [{"star": a1}, {"star": a2}])
+                diplotype = result.get("diplotype")
+                if diplotype not in diplotype_codes:
+                    diplotype_codes[diplotype] = len(self.diplotype_labels)
+                    self.diplotype_labels.append(diplotype)
+                self.diplotype_matrix[i, j] = diplotype_codes[diplotype]
+                self.phenotype_matrix[i, j] = phenotype_index.get(result.get("phenotype"), 0)
+                self.confidence_matrix[i, j] = confidence_index.get(result.get("confidence"), 0)
+
+        self.diplotype_labels = np.array(self.diplotype_labels, dtype=object)
+
+    def encode(self, allele_names) -> np.ndarray:
+        """Map allele names to integer codes (-1 for alleles outside the vocabulary)."""
+        return np.fromiter((self.allele_codes.get(name, -1) for name in allele_names),
+                           dtype=np.int32, count=len(allele_names))
+
+    def phenotype(self, allele1, allele2) -> dict:
+        """
+        Phenotype N patients from integer-encoded allele pairs.
+
+        Parameters:
+        -----------
+        allele1, allele2 : array-like of int
+            Allele codes (see `alleles` / encode()), shape (N,); codes outside
+            the vocabulary (e.g. -1) give "Unknown" with low confidence
+
+        Returns:
+        --------
+        dict
+            {
+                "phenotype_code": int8 array (index into PHENOTYPE_LABELS),
+                "confidence_code": int8 array (index into CONFIDENCE_LABELS),
+                "diplotype_code": int32 array (index into diplotype_labels),
+                "diplotype": object array of diplotype strings
+            }
+        """
+        allele1 = np.asarray(allele1, dtype=np.int64)
+        allele2 = np.asarray(allele2, dtype=np.int64)
+        if allele1.shape != allele2.shape:
+            raise ValueError(f"Allele arrays differ in shape: {allele1.shape} vs {allele2.shape}")
+
+        size = len(self.alleles)
+        if not size:
+            # Gene without allele definitions or phenotype rules: no code is in the vocabulary
+            return {
+                "phenotype_code": np.zeros(allele1.shape, dtype=np.int8),
+                "confidence_code": np.zeros(allele1.shape, dtype=np.int8),
+                "diplotype_code": np.full(allele1.shape, -1, dtype=np.int32),
+                "diplotype": np.full(allele1.shape, None, dtype=object)
+            }
+        valid = (allele1 >= 0) & (allele1 < size) & (allele2 >= 0) & (allele2 < size)
+        i = np.where(valid, allele1, 0)
+        j = np.where(valid, allele2, 0)
+
+        phenotype_code = np.where(valid, self.phenotype_matrix[i, j], 0).astype(np.int8)
+        confidence_code = np.where(valid, self.confidence_matrix[i, j], 0).astype(np.int8)
+        diplotype_code = self.diplotype_matrix[i, j]
+        diplotype = self.diplotype_labels[diplotype_code]
+        if not valid.all():
+            diplotype[~valid] = None
+            diplotype_code = np.where(valid, diplotype_code, -1).astype(np.int32)
+
+        return {
+            "phenotype_code": phenotype_code,
+            "confidence_code": confidence_code,
+            "diplotype_code": diplotype_code,
+            "diplotype": diplotype
+        }
+
+
+_PHENOTYPERS = {}
+_PHENOTYPERS_LOCK = threading.Lock()
+
+
+def get_cohort_phenotyper(gene: str) -> CohortPhenotyper:
+    """Return the (cached) batch phenotyper for a gene."""
+    gene = str(gene).strip().upper()
+    if gene not in _PHENOTYPERS:
+        with _PHENOTYPERS_LOCK:
+            if gene not in _PHENOTYPERS:
+                _PHENOTYPERS[gene] = CohortPhenotyper(gene)
+    return _PHENOTYPERS[gene]
+
+
+def phenotype_cohort(gene: str, allele1, allele2) -> dict:
+    """
+    Phenotype a cohort for one gene; see CohortPhenotyper.phenotype().
+
+    Parameters:
+    -----------
+    gene : str
+        Gene name (e.g., "CYP2C19")
+    allele1, allele2 : array-like of int
+        Integer allele codes for N patients, from get_cohort_phenotyper(gene).encode()
+
+    Returns:
+    --------
+    dict
+        Per-patient phenotype/confidence/diplotype arrays
+    """
+    return get_cohort_phenotyper(gene).phenotype(allele1, allele2)
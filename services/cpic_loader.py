@@ -14,10 +14,12 @@ def load_cpic_data(filepath: str) -> dict:
     Returns:
     --------
     dict
-        Dictionary with drug names (uppercase) as keys and gene/cpic_level/guideline_url as values
+        Dictionary with drug names (uppercase) as keys and gene/cpic_level/guideline_url as values;
+        "gene" is the drug's first listed gene, "genes" every gene paired with it
         Example: {
             "CODEINE": {
                 "gene": "CYP2D6", 
+                "genes": ["CYP2D6"],
                 "cpic_level": "A",
                 "guideline_url": "https://cpicpgx.org/guidelines/..."
             }
@@ -68,10 +70,15 @@ def load_cpic_data(filepath: str) -> dict:
         drug_key = str(drug).strip().upper()
         gene_value = str(gene).strip()
         
+        # Later rows for the same drug only add their gene to "genes"
+        if drug_key in cpic_data:
+            if gene_value not in cpic_data[drug_key]["genes"]:
+                cpic_data[drug_key]["genes"].append(gene_value)
+        
         # Only add if this drug hasn't been added yet (keep first entry)
         if drug_key not in cpic_data:
             # Build the entry
-            entry = {"gene": gene_value}
+            entry = {"gene": gene_value, "genes": [gene_value]}
             
             # Add CPIC Level if it exists and is not null
             if "CPIC Level" in df.columns and pd.notna(row["CPIC Level"]):
@@ -0,0 +1,228 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# Indexed CPIC allele-function / diplotype-phenotype tables built by tools/ingest_cpic_tables.py
+CPIC_TABLES_PATH = os.getenv("CPIC_TABLES_PATH", "data/cpic_tables.sqlite3")
+
+SCHEMA = (
+    """
+    CREATE TABLE diplotype_phenotype (
+        gene TEXT NOT NULL,
+        diplotype_key TEXT NOT NULL,
+        diplotype TEXT NOT NULL,
+        phenotype TEXT NOT NULL,
+        activity_score TEXT,
+        PRIMARY KEY (gene, diplotype_key)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE allele_function (
+        gene TEXT NOT NULL,
+        allele TEXT NOT NULL,
+        function TEXT,
+        activity_value TEXT,
+        PRIMARY KEY (gene, allele)
+    ) WITHOUT ROWID
+    """,
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID"
+)
+
+# CPIC phenotype wording -> phenotype codes used throughout the app (checked in order)
+_PHENOTYPE_PATTERNS = (
+    ("ultrarapid", "URM"),
+    ("ultra-rapid", "URM"),
+    ("rapid", "RM"),
+    ("poor", "PM"),
+    ("intermediate", "IM"),
+    ("decreased function", "IM"),
+    ("normal", "NM"),
+    ("increased function", "RM"),
+)
+_PHENOTYPE_CODES = {"PM", "IM", "NM", "RM", "URM"}
+
+
+def normalize_phenotype(label) -> str:
+    """
+    Map a CPIC phenotype label to the app's codes (PM/IM/NM/RM/URM).
+
+    e.g. "CYP2D6 Poor Metabolizer" -> "PM", "Likely Intermediate Metabolizer"
+    -> "IM", "SLCO1B1 Decreased Function" -> "IM". Indeterminate or
+    unrecognised labels map to "Unknown".
+    """
+    text = str(label or "").strip()
+    if text.upper() in _PHENOTYPE_CODES:
+        return text.upper()
+    lowered = text.lower()
+    for pattern, code in _PHENOTYPE_PATTERNS:
+        if pattern in lowered:
+            return code
+    return "Unknown"
+
+
+def _allele_sort_key(allele: str) -> tuple:
+    # "*2" < "*10" < "*10x2" < "c.2846A>T"
+    match = re.match(r"\*(\d+)(.*)", allele)
+    return (0, int(match.group(1)), match.group(2)) if match else (1, 0, allele)
+
+
+def diplotype_key(diplotype: str) -> str:
+    """Order-independent form of a diplotype ("*4/*1" and "*1/*4" -> "*1/*4")."""
+    alleles = [a.strip() for a in str(diplotype or "").split("/", 1)]
+    if len(alleles) != 2:
+        return str(diplotype or "").strip()
+    return "/".join(sorted(alleles, key=_allele_sort_key))
+
+
+def write_cpic_tables(path: str, diplotype_rows, allele_rows, meta: dict = None, chunk_size: int = 10000) -> dict:
+    """
+    Build a new table store at `path`, replacing any existing one atomically.
+
+    Rows are streamed into a temporary file in chunks, so ingesting large
+    tables does not hold them in memory; running workers keep reading the
+    previous file until they reopen it.
+
+    Parameters:
+    -----------
+    path : str
+        Destination SQLite file
+    diplotype_rows : iterable
+        (gene, diplotype, phenotype_code, activity_score) tuples
+    allele_rows : iterable
+        (gene, allele, function, activity_value) tuples
+    meta : dict
+        Extra metadata stored with the tables (sources, version, ...)
+    chunk_size : int
+        Rows per executemany() batch
+
+    Returns:
+    --------
+    dict
+        {"diplotypes": n, "alleles": n}
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    counts = {"diplotypes": 0, "alleles": 0}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        def load(sql, rows, count_key, convert):
+            chunk = []
+            for row in rows:
+                chunk.append(convert(row))
+                if len(chunk) >= chunk_size:
+                    conn.executemany(sql, chunk)
+                    counts[count_key] += len(chunk)
+                    chunk = []
+            if chunk:
+                conn.executemany(sql, chunk)
+                counts[count_key] += len(chunk)
+
+        # Later sources override earlier ones for the same key
+        load("INSERT OR REPLACE INTO diplotype_phenotype VALUES (?, ?, ?, ?, ?)", diplotype_rows, "diplotypes",
+             lambda r: (r[0].upper(), diplotype_key(r[1]), r[1].strip(), r[2], r[3]))
+        load("INSERT OR REPLACE INTO allele_function VALUES (?, ?, ?, ?)", allele_rows, "alleles",
+             lambda r: (r[0].upper(), r[1].strip(), r[2], r[3]))
+
+        meta = dict(meta or {}, ingested_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+    return counts
+
+
+class CPICTableStore:
+    """
+    Read-only lookups into the indexed CPIC table store.
+
+    The tables live in one SQLite file shared by all workers: lookups are
+    primary-key searches served from the OS page cache, so worker memory does
+    not grow with the number of genes and diplotypes covered. One connection
+    per thread (and per process, so connections are never shared across a fork).
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or CPIC_TABLES_PATH
+        self._local = threading.local()
+        self.meta = dict(self._connection().execute("SELECT key, value FROM meta").fetchall())
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def phenotype(self, gene: str, diplotype: str):
+        """Phenotype code for a diplotype in either allele order (None if not in the tables)."""
+        row = self._connection().execute(
+            "SELECT phenotype FROM diplotype_phenotype WHERE gene = ? AND diplotype_key = ?",
+            (str(gene).upper(), diplotype_key(diplotype))
+        ).fetchone()
+        return row[0] if row else None
+
+    def allele_function(self, gene: str, allele: str):
+        """{"function", "activity_value"} of a star allele (None if not in the tables)."""
+        row = self._connection().execute(
+            "SELECT function, activity_value FROM allele_function WHERE gene = ? AND allele = ?",
+            (str(gene).upper(), str(allele).strip())
+        ).fetchone()
+        return {"function": row[0], "activity_value": row[1]} if row else None
+
+    def iter_phenotypes(self):
+        """Yield (gene, diplotype_key, phenotype) for every diplotype, in key order."""
+        yield from self._connection().execute(
+            "SELECT gene, diplotype_key, phenotype FROM diplotype_phenotype ORDER BY gene, diplotype_key"
+        )
+
+    def stats(self) -> dict:
+        conn = self._connection()
+        return {
+            "path": self.path,
+            "diplotypes": conn.execute("SELECT COUNT(*) FROM diplotype_phenotype").fetchone()[0],
+            "alleles": conn.execute("SELECT COUNT(*) FROM allele_function").fetchone()[0],
+            "genes": [g for (g,) in conn.execute("SELECT DISTINCT gene FROM diplotype_phenotype ORDER BY gene")],
+            "meta": self.meta
+        }
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_cpic_tables():
+    """Return the process-wide CPICTableStore (None if the store has not been built)."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                if not os.path.exists(CPIC_TABLES_PATH):
+                    _STORE = False
+                else:
+                    try:
+                        _STORE = CPICTableStore()
+                    except sqlite3.Error as e:
+                        print(f"⚠ CPIC table store unavailable ({e}) - using built-in phenotype map")
+                        _STORE = False
+    return _STORE or None
@@ -0,0 +1,76 @@
+import os
+import time
+
+
+# Do not start an LLM call (or retry) with less time than this left
+MIN_CALL_SECONDS = float(os.getenv("LLM_MIN_CALL_SECONDS", "1.0"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget cannot cover another LLM call or retry."""
+
+
+class Deadline:
+    """
+    Absolute time budget for one request, measured on the monotonic clock.
+
+    Created once per request and passed down to the LLM providers, which shrink
+    their HTTP timeouts and retry backoff to fit the time that is left.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """True once there is not enough time left to start another LLM call."""
+        return self.remaining() < MIN_CALL_SECONDS
+
+    def timeout(self, default: float) -> float:
+        """
+        Clamp a per-call timeout to the remaining budget.
+
+        Raises:
+        -------
+        DeadlineExceeded
+            If too little time remains to start the call at all
+        """
+        remaining = self.remaining()
+        if remaining < MIN_CALL_SECONDS:
+            raise DeadlineExceeded(f"Only {remaining:.2f}s left of {self.seconds:.1f}s budget")
+        return min(default, remaining)
+
+    def can_sleep(self, seconds: float) -> bool:
+        """True if sleeping `seconds` still leaves time for one more call."""
+        return self.remaining() - seconds >= MIN_CALL_SECONDS
+
+
+def resolve_deadline_seconds(requested_ms=None) -> float:
+    """
+    Determine the request time budget from configuration and the client.
+
+    Parameters:
+    -----------
+    requested_ms : str or int
+        Client-supplied budget in milliseconds (form field / header), optional
+
+    Returns:
+    --------
+    float
+        Budget in seconds: the client's value if given, never more than the
+        configured ANALYSIS_DEADLINE_SECONDS (default 60)
+    """
+    configured = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "60"))
+    if requested_ms in (None, ""):
+        return configured
+    try:
+        requested = float(requested_ms) / 1000.0
+    except (TypeError, ValueError):
+        return configured
+    if requested <= 0:
+        return configured
+    return min(requested, configured)
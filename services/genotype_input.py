@@ -0,0 +1,71 @@
+import os
+
+from services.pharmacogene_index import get_pharmacogene_index
+
+
+# Largest batch accepted by /api/genotypes in one request
+MAX_GENOTYPE_BATCH = int(os.getenv("MAX_GENOTYPE_BATCH", "5000"))
+
+
+class GenotypeInputError(ValueError):
+    """Raised when a structured genotype payload cannot be used."""
+
+
+def _split_diplotype(value) -> list:
+    """Accept "*1/*4", "*1|*4", ["*1", "*4"] or {"diplotype": ...} / {"alleles": [...]}."""
+    if isinstance(value, dict):
+        value = value.get("diplotype") or value.get("alleles")
+    if isinstance(value, str):
+        alleles = value.replace("|", "/").split("/")
+    elif isinstance(value, (list, tuple)):
+        alleles = list(value)
+    else:
+        raise GenotypeInputError(f"Unsupported genotype value: {value!r}")
+
+    alleles = [str(a).strip() for a in alleles]
+    if len(alleles) != 2 or not all(alleles):
+        raise GenotypeInputError(f"Expected exactly two alleles, got {value!r}")
+    return alleles
+
+
+def genotypes_to_vcf_data(genotypes: dict) -> dict:
+    """
+    Turn pre-called star alleles into the structure parse_vcf() produces.
+
+    Each allele becomes a STAR-labelled variant, so determine_phenotype(),
+    match_drug_with_vcf() and the response builders treat the payload exactly
+    like a tagged VCF - without generating or parsing one.
+
+    Parameters:
+    -----------
+    genotypes : dict
+        Gene -> diplotype, e.g. {"CYP2D6": "*1/*4", "CYP2C19": ["*2", "*17"]}
+
+    Returns:
+    --------
+    dict
+        {"vcf_parsing_success": True, "variants": {"CYP2D6": [{"star": "*1"}, {"star": "*4"}], ...}}
+
+    Raises:
+    -------
+    GenotypeInputError
+        If the payload is not a mapping, names an unsupported gene or has a
+        malformed diplotype
+    """
+    if not isinstance(genotypes, dict) or not genotypes:
+        raise GenotypeInputError("'genotypes' must be a non-empty object of gene -> diplotype")
+
+    supported_genes = get_pharmacogene_index().genes
+    variants = {gene: [] for gene in supported_genes}
+    for gene, value in genotypes.items():
+        gene_name = str(gene).strip().upper()
+        if gene_name not in supported_genes:
+            raise GenotypeInputError(
+                f"Unsupported gene '{gene}' (supported: {', '.join(sorted(supported_genes))})"
+            )
+        variants[gene_name] = [{"star": allele} for allele in _split_diplotype(value)]
+
+    return {
+        "vcf_parsing_success": True,
+        "variants": variants
+    }
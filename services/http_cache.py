@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Optional dependency - gzip is always available
+    brotli = None
+
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+
+
+def content_hash(content: bytes) -> str:
+    """Return the SHA-256 hex digest of raw uploaded content."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def content_patient_id(vcf_hash: str) -> str:
+    """
+    Derive a stable patient ID from a VCF content hash (same file -> same ID).
+
+    64 bits of the hash are kept: the ID selects result-store history, and
+    shorter prefixes start to collide across a few tens of thousands of files.
+    """
+    return f"PATIENT_{vcf_hash[:16].upper()}"
+
+
+def compute_etag(payload) -> str:
+    """
+    Compute a weak-ETag value for a JSON payload.
+
+    "timestamp" fields are excluded so that two analyses of the same input that
+    only differ in when they ran are treated as equivalent (weak validator semantics).
+
+    Parameters:
+    -----------
+    payload : dict or list
+        JSON-serializable response body
+
+    Returns:
+    --------
+    str
+        Opaque ETag value (without quotes or W/ prefix)
+    """
+    def strip_timestamps(value):
+        if isinstance(value, dict):
+            return {k: strip_timestamps(v) for k, v in value.items() if k != "timestamp"}
+        if isinstance(value, list):
+            return [strip_timestamps(v) for v in value]
+        return value
+
+    canonical = json.dumps(strip_timestamps(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+class ETagCache:
+    """
+    Bounded LRU map from a request fingerprint to the ETag of its last response.
+
+    Lets a conditional request be answered with 304 before any analysis work is
+    done. Entries are per process; a miss simply falls back to full computation.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str):
+        with self._lock:
+            etag = self._entries.get(fingerprint)
+            if etag is not None:
+                self._entries.move_to_end(fingerprint)
+            return etag
+
+    def put(self, fingerprint: str, etag: str):
+        with self._lock:
+            self._entries[fingerprint] = etag
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def request_fingerprint(vcf_hash: str, *parts) -> str:
+    """Combine a VCF hash and the other response-shaping inputs into one cache key."""
+    return hashlib.sha256("|".join([vcf_hash] + [str(p) for p in parts]).encode("utf-8")).hexdigest()
+
+
+def choose_encoding(accept_encoding: str):
+    """
+    Pick the response encoding from an Accept-Encoding header.
+
+    Parameters:
+    -----------
+    accept_encoding : str
+        Raw header value, e.g. "gzip, deflate, br;q=0.9"
+
+    Returns:
+    --------
+    str or None
+        "br", "gzip" or None (identity)
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    available = ["br", "gzip"] if brotli is not None else ["gzip"]
+    wildcard = weights.get("*")
+    best = None
+    best_q = 0.0
+    for encoding in available:
+        q = weights.get(encoding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_response(response, accept_encoding: str):
+    """
+    Compress a Flask response in place according to Accept-Encoding.
+
+    Streaming, already-encoded, non-2xx, non-text and tiny responses are left untouched.
+
+    Returns:
+    --------
+    Response
+        The same response object
+    """
+    if (response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not (200 <= response.status_code < 300)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=5)
+    else:
+        compressed = gzip.compress(data, compresslevel=6)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(compressed))
+
+    # Strong ETags must change with the representation; weak ones may stay
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+
+    return response
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+
+from services.cpic_tables import diplotype_key, get_cpic_tables
+from services.liftover import CHAIN_FILES
+from services.pharmacogene_index import REGIONS_FILE, VARIANTS_FILE, read_tsv
+from services.phenotype_engine import PHENOTYPE_MAP
+from services.response_builder import PROMPT_TEMPLATE_VERSION
+from services.star_allele_caller import ALLELE_DEFINITIONS_FILE
+from services.variant_qc import VCF_QC_FILTERS
+
+
+# One JSON snapshot per knowledge-base version, used to diff versions for re-analysis
+KB_SNAPSHOT_DIR = os.getenv("KB_SNAPSHOT_DIR", "data/kb_snapshots")
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def build_snapshot(kb_version: str, cpic_engine: dict, recommendations: dict = None) -> dict:
+    """
+    Capture the knowledge-base entries results depend on.
+
+    Parameters:
+    -----------
+    kb_version : str
+        Version the snapshot describes (result_store.knowledge_base_version())
+    cpic_engine : dict
+        Drug -> {"gene", "cpic_level", "guideline_url"} (initialize_cpic_engine())
+    recommendations : dict
+        CPIC recommendation table (load_recommendation_table())
+
+    Returns:
+    --------
+    dict
+        {
+            "version": "...",
+            "drugs": {"CODEINE": {"gene": "CYP2D6", "cpic_level": "A", "guideline_url": ...}},
+            "phenotypes": {"CYP2D6": {"*1/*4": "IM", ...}},   # effective diplotype -> phenotype
+            "alleles": {"CYP2D6": "<digest>"},                   # allele/variant/region/liftover definitions
+            "recommendations": {"CODEINE|PM": {...}},
+            "recommendation_version": "2026.10",
+            "qc_filters": "GT!=0/0",                              # VCF_QC_FILTERS
+            "prompt_template": "1"                                # PROMPT_TEMPLATE_VERSION
+        }
+    """
+    phenotypes = {}
+    for gene, diplotypes in PHENOTYPE_MAP.items():
+        for diplotype, phenotype in diplotypes.items():
+            phenotypes.setdefault(gene, {})[diplotype_key(diplotype)] = phenotype
+    tables = get_cpic_tables()
+    if tables is not None:
+        # The table store takes precedence over PHENOTYPE_MAP (see phenotype_engine.lookup_phenotype)
+        for gene, key, phenotype in tables.iter_phenotypes():
+            phenotypes.setdefault(gene, {})[key] = phenotype
+
+    allele_rows = {}
+    for path in (ALLELE_DEFINITIONS_FILE, VARIANTS_FILE, REGIONS_FILE, *CHAIN_FILES.values()):
+        for row in read_tsv(path):
+            allele_rows.setdefault(row["gene"].upper(), []).append(row)
+
+    table = (recommendations or {}).get("recommendations", {})
+    return {
+        "version": kb_version,
+        "drugs": {
+            drug: {key: info.get(key) for key in ("gene", "cpic_level", "guideline_url")}
+            for drug, info in cpic_engine.items()
+        },
+        "phenotypes": phenotypes,
+        "alleles": {gene: _digest(rows) for gene, rows in allele_rows.items()},
+        "recommendations": {f"{drug}|{phenotype}": entry for (drug, phenotype), entry in table.items()},
+        "recommendation_version": (recommendations or {}).get("version"),
+        "qc_filters": VCF_QC_FILTERS,
+        "prompt_template": PROMPT_TEMPLATE_VERSION
+    }
+
+
+def snapshot_path(kb_version: str) -> str:
+    return os.path.join(KB_SNAPSHOT_DIR, f"{kb_version}.json")
+
+
+def load_snapshot(kb_version: str):
+    """Return the saved snapshot of a knowledge-base version (None if it was never saved)."""
+    try:
+        with open(snapshot_path(kb_version), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_snapshot(kb_version: str, cpic_engine: dict, recommendations: dict = None) -> bool:
+    """
+    Save the snapshot of the running knowledge base unless it already exists.
+
+    Called at startup, so every version results were produced under can be
+    diffed against later ones. Failures are logged, never raised.
+
+    Returns:
+    --------
+    bool
+        True if a snapshot of this version is on disk
+    """
+    path = snapshot_path(kb_version)
+    if os.path.exists(path):
+        return True
+    try:
+        os.makedirs(KB_SNAPSHOT_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(build_snapshot(kb_version, cpic_engine, recommendations), f, sort_keys=True)
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        print(f"⚠ Could not save knowledge-base snapshot {kb_version}: {e}")
+        return False
+
+
+def diff_snapshots(old: dict, new: dict) -> dict:
+    """
+    Knowledge-base entries that differ between two snapshots.
+
+    Returns:
+    --------
+    dict
+        {
+            "drugs": [{"drug", "old", "new"}],                  # mapping, CPIC level or URL
+            "phenotypes": [{"gene", "diplotype", "old", "new"}],
+            "alleles": ["CYP2D6", ...],                          # genes whose definitions changed
+            "recommendations": [{"drug", "phenotype"}],
+            "qc_filters": {"old", "new"} or None,
+            "prompt_template": {"old", "new"} or None,
+            "entries": set of dependency entries (see analysis_dependencies());
+                       "*" if every result is affected, "llm" for every result
+                       whose recommendation came from the LLM
+        }
+    """
+    changes = {"drugs": [], "phenotypes": [], "alleles": [], "recommendations": [], "qc_filters": None,
+               "prompt_template": None, "entries": set()}
+
+    # Snapshots taken before QC filters were configurable used the fixed GT!=0/0 filter
+    before, after = old.get("qc_filters", "GT!=0/0"), new.get("qc_filters", "GT!=0/0")
+    if before != after:
+        # Which calls are kept can change the variants, and so the result, of any analysis
+        changes["qc_filters"] = {"old": before, "new": after}
+        changes["entries"].add("*")
+
+    # Snapshots taken before the template version was recorded all used version "1"
+    before, after = old.get("prompt_template", "1"), new.get("prompt_template", "1")
+    if before != after:
+        # A new prompt template can change every recommendation the LLM wrote
+        changes["prompt_template"] = {"old": before, "new": after}
+        changes["entries"].add("llm")
+
+    for drug in sorted(set(old["drugs"]) | set(new["drugs"])):
+        before, after = old["drugs"].get(drug), new["drugs"].get(drug)
+        if before != after:
+            changes["drugs"].append({"drug": drug, "old": before, "new": after})
+            changes["entries"].add(f"drug:{drug}")
+
+    for gene in sorted(set(old["phenotypes"]) | set(new["phenotypes"])):
+        before, after = old["phenotypes"].get(gene, {}), new["phenotypes"].get(gene, {})
+        for key in sorted(set(before) | set(after)):
+            if before.get(key) != after.get(key):
+                changes["phenotypes"].append({"gene": gene, "diplotype": key,
+                                              "old": before.get(key), "new": after.get(key)})
+                changes["entries"].add(f"phenotype:{gene}:{key}")
+
+    for gene in sorted(set(old["alleles"]) | set(new["alleles"])):
+        if old["alleles"].get(gene) != new["alleles"].get(gene):
+            changes["alleles"].append(gene)
+            changes["entries"].add(f"alleles:{gene}")
+
+    for key in sorted(set(old["recommendations"]) | set(new["recommendations"])):
+        if old["recommendations"].get(key) != new["recommendations"].get(key):
+            drug, phenotype = key.split("|", 1)
+            changes["recommendations"].append({"drug": drug, "phenotype": phenotype})
+            changes["entries"].add(f"recommendation:{drug}:{phenotype}")
+
+    return changes
+
+
+def analysis_dependencies(analysis: dict) -> list:
+    """
+    Knowledge-base entries an analysis was derived from.
+
+    - drug:<DRUG>                      drug -> gene mapping, CPIC level, guideline (or absence: fallback)
+    - alleles:<GENE>                   allele/variant definitions used to call the diplotype
+    - phenotype:<GENE>:<diplotype>     diplotype -> phenotype rule
+    - recommendation:<DRUG>:<PHENOTYPE>  CPIC recommendation table entry
+    """
+    entries = [f"drug:{analysis['drug']}"]
+    gene = analysis.get("gene")
+    if gene:
+        entries.append(f"alleles:{gene}")
+        diplotypes = {diplotype_key(analysis["diplotype"])} if analysis.get("diplotype") else set()
+        # With several tagged star alleles the chosen pair depends on the rules of every candidate pair
+        stars = list(dict.fromkeys(v["star"] for v in analysis.get("variants") or []
+                                   if isinstance(v, dict) and v.get("star")))
+        diplotypes.update(diplotype_key(f"{a}/{b}") for i, a in enumerate(stars) for b in stars[i + 1:])
+        entries.extend(f"phenotype:{gene}:{key}" for key in sorted(diplotypes))
+        entries.append(f"recommendation:{analysis['drug']}:{analysis.get('phenotype')}")
+    else:
+        # Fallback drugs are explained from the variants of every gene in the VCF
+        entries.extend(f"alleles:{g}" for g in analysis.get("genes") or [])
+    return entries
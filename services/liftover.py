@@ -0,0 +1,99 @@
+import threading
+from bisect import bisect_right
+
+from services.pharmacogene_index import DATA_DIR, normalize_chrom, read_tsv
+
+
+CANONICAL_BUILD = "GRCh38"
+
+# Chain tables shipped in data/, keyed by source build
+CHAIN_FILES = {
+    "GRCh37": DATA_DIR / "liftover_grch37_to_grch38.tsv"
+}
+
+# Lower-cased fragments of ##reference / ##contig assembly values per build
+BUILD_ALIASES = {
+    "GRCh37": ("grch37", "hg19", "b37", "hs37d5", "g1k_v37", "ncbi37"),
+    "GRCh38": ("grch38", "hg38", "b38", "hs38")
+}
+
+
+def detect_genome_build(header_line: str):
+    """
+    Detect the reference build from a VCF meta line.
+
+    Parameters:
+    -----------
+    header_line : str
+        A "##reference=..." or "##contig=<...,assembly=...>" line
+
+    Returns:
+    --------
+    str or None
+        "GRCh37", "GRCh38" or None if the line does not identify a build
+    """
+    value = header_line.lower()
+    if value.startswith("##contig") and "assembly=" not in value:
+        return None
+    # GRCh38 first: short aliases such as "b37" can occur inside unrelated path text
+    for build in ("GRCh38", "GRCh37"):
+        if any(alias in value for alias in BUILD_ALIASES[build]):
+            return build
+    return None
+
+
+class ChainIndex:
+    """
+    Liftover for the supported pharmacogene regions only.
+
+    Chain blocks (source interval + constant offset) are held per chromosome
+    in sorted arrays and found by binary search; positions outside every
+    block cannot be lifted and return None.
+    """
+
+    def __init__(self, blocks: list):
+        self._starts = {}
+        self._blocks = {}
+        by_chrom = {}
+        for block in blocks:
+            by_chrom.setdefault(normalize_chrom(block["chrom"]), []).append(
+                (int(block["source_start"]), int(block["source_end"]), int(block["offset"]))
+            )
+        for chrom, entries in by_chrom.items():
+            entries.sort()
+            self._starts[chrom] = [start for start, _, _ in entries]
+            self._blocks[chrom] = entries
+
+    def lift(self, chrom: str, pos: int):
+        """Return the canonical-build position for CHROM:POS, or None if unmapped."""
+        chrom = normalize_chrom(chrom)
+        starts = self._starts.get(chrom)
+        if not starts:
+            return None
+        i = bisect_right(starts, pos) - 1
+        if i < 0:
+            return None
+        start, end, offset = self._blocks[chrom][i]
+        if pos > end:
+            return None
+        return pos + offset
+
+
+_CHAINS = {}
+_CHAINS_LOCK = threading.Lock()
+
+
+def get_chain_index(source_build: str):
+    """
+    Return the chain index lifting `source_build` to the canonical build.
+
+    Returns None for the canonical build itself (no liftover needed) and for
+    builds without a bundled chain table.
+    """
+    if source_build == CANONICAL_BUILD or source_build not in CHAIN_FILES:
+        return None
+    if source_build not in _CHAINS:
+        with _CHAINS_LOCK:
+            if source_build not in _CHAINS:
+                _CHAINS[source_build] = ChainIndex(read_tsv(CHAIN_FILES[source_build]))
+    return _CHAINS[source_build]
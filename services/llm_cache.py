@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from services.llm_service import default_recommendation
+from services.response_builder import PROMPT_TEMPLATE_VERSION
+
+
+# Persistent cache of per-drug LLM recommendations (set LLM_CACHE=false to disable)
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+
+
+def recommendation_cache_key(drug: str, gene: str, phenotype: str, diplotype: str, cpic_level: str,
+                             model: str, template_version: str = PROMPT_TEMPLATE_VERSION) -> str:
+    """
+    Semantic cache key of a per-drug CPIC prompt.
+
+    Built from the fields that determine the answer rather than the prompt
+    text, so patients with the same drug/gene/diplotype/phenotype share an
+    entry. Bumping PROMPT_TEMPLATE_VERSION or switching model invalidates it.
+    """
+    fields = [str(value or "").strip().upper() for value in (drug, gene, phenotype, diplotype, cpic_level)]
+    semantic = "\x1f".join([template_version, model] + fields)
+    return hashlib.sha256(semantic.encode("utf-8")).hexdigest()
+
+
+def provider_model(llm_provider) -> str:
+    """Model name used in cache keys (composite providers report all their models)."""
+    return str(getattr(llm_provider, "model", None) or type(llm_provider).__name__)
+
+
+def is_cacheable(llm_result) -> bool:
+    """True for a real LLM answer (not the deterministic fallback)."""
+    if not isinstance(llm_result, dict) or llm_result == default_recommendation():
+        return False
+    explanation = llm_result.get("llm_generated_explanation")
+    recommendation = llm_result.get("clinical_recommendation")
+    return (isinstance(explanation, dict) and bool(explanation.get("summary"))
+            and isinstance(recommendation, dict))
+
+
+class RecommendationCache:
+    """
+    SQLite store of LLM recommendations shared by all workers on a host.
+
+    Uses WAL mode so workers read while the warm-up job (tools/warm_llm_cache.py)
+    or another worker writes; one connection per thread.
+    """
+
+    def __init__(self, path: str = None, ttl_days: float = None):
+        self.path = path or LLM_CACHE_PATH
+        self.ttl_seconds = (LLM_CACHE_TTL_DAYS if ttl_days is None else ttl_days) * 86400
+        self._local = threading.local()
+        self._counts = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_recommendations (
+                key TEXT PRIMARY KEY,
+                template_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                drug TEXT,
+                gene TEXT,
+                phenotype TEXT,
+                diplotype TEXT,
+                cpic_level TEXT,
+                response TEXT NOT NULL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def get(self, key: str):
+        """Return the cached LLM result for a key (None if absent or expired)."""
+        try:
+            row = self._connection().execute(
+                "SELECT response, created_at FROM llm_recommendations WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠ LLM cache read failed: {e}")
+            row = None
+        if row is None or (self.ttl_seconds > 0 and time.time() - row[1] > self.ttl_seconds):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(row[0])
+
+    def contains(self, key: str) -> bool:
+        """True if a fresh entry exists (does not count as a hit or miss)."""
+        row = self._connection().execute(
+            "SELECT created_at FROM llm_recommendations WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None and (self.ttl_seconds <= 0 or time.time() - row[0] <= self.ttl_seconds)
+
+    def put(self, key: str, llm_result: dict, model: str, drug: str = None, gene: str = None,
+            phenotype: str = None, diplotype: str = None, cpic_level: str = None, prompt_tokens: int = None,
+            completion_tokens: int = None, template_version: str = PROMPT_TEMPLATE_VERSION):
+        """Store an LLM result; failures are logged, never raised."""
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_recommendations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, template_version, model, drug, gene, phenotype, diplotype, cpic_level,
+                 json.dumps(llm_result), prompt_tokens, completion_tokens, time.time())
+            )
+            conn.commit()
+            self._count("writes")
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"⚠ LLM cache write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_recommendation_cache():
+    """Return the process-wide RecommendationCache (None when LLM_CACHE is off or unusable)."""
+    global _CACHE
+    if not LLM_CACHE:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                try:
+                    _CACHE = RecommendationCache()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"⚠ LLM cache unavailable ({e}) - LLM results will not be cached")
+                    _CACHE = False
+    return _CACHE or None
@@ -0,0 +1,295 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from services.deadline import DeadlineExceeded
+from services.llm_service import LLMProvider, RateLimited, default_recommendation, extract_json
+
+
+# Hedge once the primary has been slower than this percentile of its recent calls
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Hedge delay used until enough latencies have been observed
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "2.0"))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("LLM_CIRCUIT_COOLDOWN_SECONDS", "30"))
+
+# Latency samples kept per provider, and how many are needed before the percentile is trusted
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies for one provider."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        """Return the p-th percentile latency, or None with too few samples."""
+        with self._lock:
+            if len(self._samples) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and the
+    provider is skipped for `cooldown` seconds; then one trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = None, cooldown: float = None):
+        self.failure_threshold = failure_threshold or LLM_CIRCUIT_FAILURES
+        self.cooldown = LLM_CIRCUIT_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """True if a call may be sent now (claims the half-open trial slot)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a half-open trial slot without an outcome (e.g. the request ran out of time)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Process-wide pool for hedged calls (greenlets under gevent workers)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                pool_size = int(os.getenv("LLM_HTTP_POOL_SIZE", "100"))
+                _executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm-hedge")
+    return _executor
+
+
+class HedgedProvider(LLMProvider):
+    """
+    Composite provider that hedges slow primary calls with a secondary provider.
+
+    Each request goes to the primary first. If no valid answer has arrived
+    after the primary's learned LLM_HEDGE_PERCENTILE latency, the same prompt
+    is sent to the secondary and whichever valid answer arrives first wins.
+    A 429, error or unparseable answer fails over to the other provider
+    immediately, and a provider whose circuit is open is skipped altogether.
+
+    The wrapped providers make a single attempt per call (failover replaces
+    their own 429 backoff). A losing call that has not started yet is
+    cancelled; one already on the wire cannot be interrupted, so it runs to
+    its timeout and its answer is discarded.
+    """
+
+    def __init__(self, primary: LLMProvider, secondary: LLMProvider, percentile: float = None):
+        self.providers = [primary, secondary]
+        self.names = [type(primary).__name__, type(secondary).__name__]
+        if self.names[0] == self.names[1]:
+            self.names = [f"{self.names[0]}#1", f"{self.names[1]}#2"]
+        for provider in self.providers:
+            if hasattr(provider, "max_retries"):
+                provider.max_retries = 1
+        # Answers may come from either model
+        self.model = "+".join(str(getattr(p, "model", type(p).__name__)) for p in self.providers)
+        self.percentile = LLM_HEDGE_PERCENTILE if percentile is None else percentile
+        self.latency = {name: LatencyTracker() for name in self.names}
+        self.breakers = {name: CircuitBreaker() for name in self.names}
+        self._counts = {"requests": 0, "hedged": 0, "failovers": 0, "unanswered": 0}
+        self._wins = {name: 0 for name in self.names}
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on the primary before sending the hedge request."""
+        learned = self.latency[self.names[0]].percentile(self.percentile)
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS if learned is None else learned
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _attempt(self, index: int, prompt: str, deadline):
+        """Run one provider call; returns (text or None, exception or None)."""
+        name = self.names[index]
+        started = time.monotonic()
+        try:
+            text = self.providers[index]._request_text(prompt, deadline=deadline)
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded):
+                self.breakers[name].release()
+            else:
+                self.breakers[name].record_failure()
+            return None, e
+        if extract_json(text) is None:
+            self.breakers[name].record_failure()
+            return None, ValueError("No valid JSON in response")
+        self.breakers[name].record_success()
+        self.latency[name].record(time.monotonic() - started)
+        return text, None
+
+    def _request_text(self, prompt: str, deadline=None):
+        """
+        Return the first valid completion text from either provider.
+
+        Returns:
+        --------
+        str or None
+            None if neither provider produced a valid answer
+
+        Raises:
+        -------
+        DeadlineExceeded
+            If the budget ran out before any provider answered
+        """
+        self._count("requests")
+        executor = _get_executor()
+        pending = {}
+        remaining = list(range(len(self.providers)))
+
+        def launch_next() -> bool:
+            # The circuit is checked only at launch, so an unused provider never holds the half-open trial
+            while remaining:
+                index = remaining.pop(0)
+                if self.breakers[self.names[index]].allow():
+                    pending[executor.submit(self._attempt, index, prompt, deadline)] = index
+                    return True
+            return False
+
+        if not launch_next():
+            print("⚠ All LLM provider circuits are open")
+            self._count("unanswered")
+            return None
+        hedge_at = time.monotonic() + self.hedge_delay()
+        out_of_time = False
+
+        while pending:
+            if remaining:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            else:
+                timeout = deadline.remaining() if deadline else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if remaining and launch_next():
+                    self._count("hedged")
+                    print(f"Hedging LLM call: no answer after {self.hedge_delay():.2f}s, "
+                          f"sent to {self.names[pending[list(pending)[-1]]]}")
+                    continue
+                if not remaining and pending:
+                    if deadline is None or deadline.remaining() > 0:
+                        continue
+                break
+
+            for future in done:
+                index = pending.pop(future)
+                text, error = future.result()
+                if text is not None:
+                    for loser in pending:
+                        loser.cancel()
+                    with self._lock:
+                        self._wins[self.names[index]] += 1
+                    return text
+                if isinstance(error, DeadlineExceeded):
+                    out_of_time = True
+                elif isinstance(error, RateLimited):
+                    print(f"⚠ {self.names[index]} rate limited")
+                else:
+                    print(f"⚠ {self.names[index]} failed: {error}")
+                if not (deadline and deadline.expired()) and launch_next():
+                    self._count("failovers")
+
+        self._count("unanswered")
+        if out_of_time or (deadline and deadline.expired()):
+            raise DeadlineExceeded("No LLM provider answered within the deadline")
+        return None
+
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        """
+        Generate a clinical recommendation from whichever provider answers first.
+
+        Raises:
+        -------
+        DeadlineExceeded
+            If the budget runs out before a usable response is obtained
+        """
+        try:
+            parsed_response = extract_json(self._request_text(prompt, deadline=deadline))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Error calling hedged LLM providers: {e}")
+            parsed_response = None
+        if isinstance(parsed_response, dict):
+            return parsed_response
+        return default_recommendation()
+
+    def stream_text(self, prompt: str, deadline=None):
+        """Stream from the first provider whose circuit is closed (streams are not hedged)."""
+        for index, provider in enumerate(self.providers):
+            if self.breakers[self.names[index]].state != "open":
+                return provider.stream_text(prompt, deadline=deadline)
+        raise RateLimited("All LLM provider circuits are open")
+
+    def stats(self) -> dict:
+        """Hedging counters, per-provider wins, circuit states and learned latency."""
+        with self._lock:
+            counts = dict(self._counts)
+            wins = dict(self._wins)
+        return dict(
+            counts,
+            hedge_delay_seconds=round(self.hedge_delay(), 3),
+            providers={
+                name: {
+                    "wins": wins[name],
+                    "circuit": self.breakers[name].state,
+                    f"p{self.percentile:g}_seconds": self.latency[name].percentile(self.percentile)
+                }
+                for name in self.names
+            }
+        )
@@ -2,37 +2,183 @@ import os
 import json
 import time
 import random
+import threading
 from abc import ABC, abstractmethod
 
+from services.deadline import DeadlineExceeded
+from services.llm_stream import iter_sse_data
+
+
+# Shared HTTP session per process so LLM calls reuse pooled (TLS) connections.
+# Under gevent workers the pool is the limit on concurrent LLM calls per worker.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Return the process-wide requests.Session used for LLM API calls.
+
+    Created lazily so each gunicorn worker builds its own pool after forking
+    (and after gevent has patched sockets, when running gevent workers).
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                pool_size = int(os.getenv("LLM_HTTP_POOL_SIZE", "100"))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+class RateLimited(Exception):
+    """Raised when a provider keeps answering 429 (Too Many Requests)."""
+
+
+def default_recommendation() -> dict:
+    """
+    Deterministic recommendation used whenever an LLM response is unavailable
+    (API failure, rate limiting, or the request deadline running out).
+    """
+    return {
+        "clinical_recommendation": {
+            "dosage_adjustment": "Consult healthcare provider for personalized guidance",
+            "monitoring": "Standard monitoring recommended",
+            "alternative_drugs": [],
+            "urgency": "routine"
+        },
+        "llm_generated_explanation": {
+            "summary": "Your genetic profile has been analyzed for this medication. Consult with your healthcare provider for personalized dosing guidance.",
+            "mechanism": "Your body's ability to process this medication depends on your genetic makeup. This has been analyzed and will be discussed with your doctor.",
+            "interaction_notes": [
+                "Always inform your doctor about genetic test results",
+                "Discuss any medication changes with your pharmacist",
+                "Report any unusual side effects immediately"
+            ],
+            "evidence_basis": "Based on published clinical guidelines and genetic research"
+        }
+    }
+
+
+def extract_json(text: str):
+    """
+    Parse JSON from LLM output text.
+
+    Accepts bare JSON, JSON inside a ```json fenced block, or JSON surrounded
+    by stray prose (the outermost [...] or {...} span).
+
+    Returns:
+    --------
+    dict, list or None
+        The parsed value, or None if no valid JSON could be found
+    """
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    import re
+    json_match = re.search(r'```(?:json)?\s*\n?(.*?)\n?```', text, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group(1))
+        except json.JSONDecodeError:
+            pass
+
+    for opener, closer in (("[", "]"), ("{", "}")):
+        start, end = text.find(opener), text.rfind(closer)
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                continue
+    return None
+
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
     
     @abstractmethod
-    def generate_clinical_recommendation(self, prompt: str) -> dict:
-        """Generate clinical recommendation from prompt."""
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        """Generate clinical recommendation from prompt within an optional Deadline."""
         pass
 
+    def _request_text(self, prompt: str, deadline=None):
+        """Return the raw completion text for a prompt (None if unavailable)."""
+        raise NotImplementedError
+
+    def stream_text(self, prompt: str, deadline=None):
+        """
+        Yield completion text chunks as the model generates them.
+
+        Raises:
+        -------
+        NotImplementedError
+            If the provider has no streaming mode (callers fall back to
+            generate_clinical_recommendation)
+        DeadlineExceeded
+            If the budget runs out mid-stream
+        """
+        raise NotImplementedError
+
+    def generate_json(self, prompt: str, deadline=None):
+        """
+        Send a prompt and return its parsed JSON answer (object or array).
+
+        Used by batched prompting, where one completion carries results for
+        several drugs.
+
+        Returns:
+        --------
+        dict, list or None
+            None if the call failed or the answer was not valid JSON
+
+        Raises:
+        -------
+        DeadlineExceeded
+            If the budget runs out before a response is obtained
+        """
+        try:
+            return extract_json(self._request_text(prompt, deadline=deadline))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Error calling {type(self).__name__}: {e}")
+            return None
+
 
 class GeminiProvider(LLMProvider):
     """Google Gemini LLM provider."""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, model: str = None):
         """Initialize Gemini provider.
         
         Parameters:
         -----------
         api_key : str
             Google API key (if None, will look for GOOGLE_API_KEY env var)
+        model : str
+            Model name (default: GEMINI_MODEL env var, else gemini-2.5-flash)
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not provided or set in environment")
         
-        self.model = "gemini-2.5-flash"
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+        self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        # Attempts per call on 429 / connection errors (HedgedProvider sets 1 and fails over instead)
+        self.max_retries = 3
+        # Overridable so the app can be pointed at a local stand-in (tools/mock_llm_server.py)
+        self.base_url = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/models").rstrip("/")
     
-    def generate_clinical_recommendation(self, prompt: str) -> dict:
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
         """
         Generate clinical recommendation using Google Gemini with retry logic.
         
@@ -40,152 +186,179 @@ class GeminiProvider(LLMProvider):
         -----------
         prompt : str
             The prompt for the LLM
+        deadline : Deadline
+            Request time budget; HTTP timeouts and retry sleeps are shrunk to fit it
             
         Returns:
         --------
         dict
             Structured response with clinical_recommendation and llm_generated_explanation
+            
+        Raises:
+        -------
+        DeadlineExceeded
+            If the budget runs out before a usable response is obtained
         """
         try:
-            import requests
+            text = self._request_text(prompt, deadline=deadline)
+            if text is None:
+                return self._default_response()
             
-            max_retries = 3
-            retry_delay = 1  # Start with 1 second
+            # Try to parse as JSON (bare or in a markdown code block)
+            parsed_response = extract_json(text)
+            if isinstance(parsed_response, dict):
+                return parsed_response
             
-            for attempt in range(max_retries):
-                try:
-                    url = f"{self.base_url}/{self.model}:generateContent?key={self.api_key}"
-                    
-                    payload = {
-                        "contents": [
-                            {
-                                "parts": [
-                                    {"text": prompt}
-                                ]
-                            }
-                        ]
-                    }
-                    
-                    response = requests.post(url, json=payload, timeout=30)
-                    
-                    # Handle rate limiting with retry
-                    if response.status_code == 429:  # Too Many Requests
-                        if attempt < max_retries - 1:
-                            retry_after = response.headers.get("Retry-After")
-                            if retry_after:
-                                try:
-                                    retry_delay = max(retry_delay, int(retry_after))
-                                except ValueError:
-                                    pass
-                            jitter = random.uniform(0.2, 0.8)
-                            print(f"⚠ Rate limited (429). Retrying in {retry_delay + jitter:.1f}s... (attempt {attempt + 1}/{max_retries})")
-                            time.sleep(retry_delay + jitter)
-                            retry_delay *= 2  # Exponential backoff
-                            continue
-                        else:
-                            print(f"⚠ Rate limit exceeded after {max_retries} attempts. Using fallback response.")
-                            return self._default_response()
-                    
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    
-                    # Extract text from response
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            text = candidate["content"]["parts"][0]["text"]
-                            
-                            # Try to parse as JSON
-                            try:
-                                # First try direct JSON parsing
-                                parsed_response = json.loads(text)
-                                return parsed_response
-                            except json.JSONDecodeError:
-                                # Try to extract JSON from markdown code blocks
-                                try:
-                                    import re
-                                    # Look for JSON in code blocks (```json ... ```)
-                                    json_match = re.search(r'```(?:json)?\s*\n?(.*?)\n?```', text, re.DOTALL)
-                                    if json_match:
-                                        json_text = json_match.group(1)
-                                        parsed_response = json.loads(json_text)
-                                        return parsed_response
-                                except:
-                                    pass
-                                
-                                # If still can't parse, structure it
-                                return {
-                                    "clinical_recommendation": {
-                                        "dosage_adjustment": text[:200] if len(text) > 200 else text,
-                                        "monitoring": "Refer to clinical guidelines"
-                                    },
-                                    "llm_generated_explanation": {
-                                        "summary": text,
-                                        "mechanism": "Consult your healthcare provider for personalized guidance",
-                                        "interaction_notes": ["Discuss with your pharmacist", "Follow clinical guidelines"],
-                                        "evidence_basis": "Based on clinical research and guidelines"
-                                    }
-                                }
-                    
-                    return self._default_response()
+            # If still can't parse, structure it
+            return {
+                "clinical_recommendation": {
+                    "dosage_adjustment": text[:200] if len(text) > 200 else text,
+                    "monitoring": "Refer to clinical guidelines"
+                },
+                "llm_generated_explanation": {
+                    "summary": text,
+                    "mechanism": "Consult your healthcare provider for personalized guidance",
+                    "interaction_notes": ["Discuss with your pharmacist", "Follow clinical guidelines"],
+                    "evidence_basis": "Based on clinical research and guidelines"
+                }
+            }
+        
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Error calling Gemini API: {e}")
+            return self._default_response()
+    
+    def _request_text(self, prompt: str, deadline=None):
+        """
+        Call :generateContent with retry/backoff and return the completion text.
+        
+        Returns:
+        --------
+        str or None
+            None if the response had no text
+
+        Raises:
+        -------
+        RateLimited
+            If every attempt was answered with 429
+        """
+        import requests
+        
+        max_retries = self.max_retries
+        retry_delay = 1  # Start with 1 second
+        
+        for attempt in range(max_retries):
+            try:
+                url = f"{self.base_url}/{self.model}:generateContent?key={self.api_key}"
                 
-                except requests.exceptions.RequestException as e:
+                payload = {
+                    "contents": [
+                        {
+                            "parts": [
+                                {"text": prompt}
+                            ]
+                        }
+                    ]
+                }
+                
+                timeout = deadline.timeout(30) if deadline else 30
+                response = get_http_session().post(url, json=payload, timeout=timeout)
+                
+                # Handle rate limiting with retry
+                if response.status_code == 429:  # Too Many Requests
                     if attempt < max_retries - 1:
-                        print(f"⚠ Request error: {e}. Retrying in {retry_delay}s... (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
+                        retry_after = response.headers.get("Retry-After")
+                        if retry_after:
+                            try:
+                                retry_delay = max(retry_delay, int(retry_after))
+                            except ValueError:
+                                pass
+                        jitter = random.uniform(0.2, 0.8)
+                        if deadline and not deadline.can_sleep(retry_delay + jitter):
+                            raise DeadlineExceeded("Rate limited and no time left to back off")
+                        print(f"⚠ Rate limited (429). Retrying in {retry_delay + jitter:.1f}s... (attempt {attempt + 1}/{max_retries})")
+                        time.sleep(retry_delay + jitter)
+                        retry_delay *= 2  # Exponential backoff
                         continue
                     else:
-                        raise
+                        print(f"⚠ Rate limit exceeded after {max_retries} attempts. Using fallback response.")
+                        raise RateLimited(f"Gemini rate limit persisted after {max_retries} attempts")
+                
+                response.raise_for_status()
+                
+                result = response.json()
+                
+                # Extract text from response
+                if "candidates" in result and len(result["candidates"]) > 0:
+                    candidate = result["candidates"][0]
+                    if "content" in candidate and "parts" in candidate["content"]:
+                        return candidate["content"]["parts"][0]["text"]
+                
+                return None
             
-            return self._default_response()
+            except requests.exceptions.RequestException as e:
+                if attempt < max_retries - 1:
+                    if deadline and not deadline.can_sleep(retry_delay):
+                        raise DeadlineExceeded(f"Request error ({e}) and no time left to retry")
+                    print(f"⚠ Request error: {e}. Retrying in {retry_delay}s... (attempt {attempt + 1}/{max_retries})")
+                    time.sleep(retry_delay)
+                    retry_delay *= 2
+                    continue
+                else:
+                    raise
         
-        except Exception as e:
-            print(f"Error calling Gemini API: {e}")
-            return self._default_response()
+        return None
+    
+    def stream_text(self, prompt: str, deadline=None):
+        """Stream the completion from :streamGenerateContent (server-sent events)."""
+        url = f"{self.base_url}/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        payload = {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": prompt}
+                    ]
+                }
+            ]
+        }
+        timeout = deadline.timeout(30) if deadline else 30
+        with get_http_session().post(url, json=payload, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for event in iter_sse_data(response):
+                if deadline and deadline.remaining() <= 0:
+                    raise DeadlineExceeded("Deadline reached while streaming")
+                for candidate in event.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
     
     def _default_response(self) -> dict:
         """Return complete default response if API call fails."""
-        return {
-            "clinical_recommendation": {
-                "dosage_adjustment": "Consult healthcare provider for personalized guidance",
-                "monitoring": "Standard monitoring recommended",
-                "alternative_drugs": [],
-                "urgency": "routine"
-            },
-            "llm_generated_explanation": {
-                "summary": "Your genetic profile has been analyzed for this medication. Consult with your healthcare provider for personalized dosing guidance.",
-                "mechanism": "Your body's ability to process this medication depends on your genetic makeup. This has been analyzed and will be discussed with your doctor.",
-                "interaction_notes": [
-                    "Always inform your doctor about genetic test results",
-                    "Discuss any medication changes with your pharmacist",
-                    "Report any unusual side effects immediately"
-                ],
-                "evidence_basis": "Based on published clinical guidelines and genetic research"
-            }
-        }
+        return default_recommendation()
 
 
 class OpenAIProvider(LLMProvider):
     """OpenAI LLM provider."""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, model: str = None):
         """Initialize OpenAI provider.
         
         Parameters:
         -----------
         api_key : str
             OpenAI API key (if None, will look for OPENAI_API_KEY env var)
+        model : str
+            Model name (default: OPENAI_MODEL env var, else gpt-4)
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not provided or set in environment")
         
-        self.model = "gpt-4"
-        self.base_url = "https://api.openai.com/v1"
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-4")
+        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
     
-    def generate_clinical_recommendation(self, prompt: str) -> dict:
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
         """
         Generate clinical recommendation using OpenAI.
         
@@ -193,6 +366,8 @@ class OpenAIProvider(LLMProvider):
         -----------
         prompt : str
             The prompt for the LLM
+        deadline : Deadline
+            Request time budget; the HTTP timeout is shrunk to fit it
             
         Returns:
         --------
@@ -200,78 +375,96 @@ class OpenAIProvider(LLMProvider):
             Structured response with clinical_recommendation and llm_generated_explanation
         """
         try:
-            import requests
-            
-            url = f"{self.base_url}/chat/completions"
+            text = self._request_text(prompt, deadline=deadline)
+            if text is None:
+                return self._default_response()
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7
-            }
-            
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if "choices" in result and len(result["choices"]) > 0:
-                choice = result["choices"][0]
-                if "message" in choice:
-                    text = choice["message"]["content"]
-                    
-                    # Try to parse as JSON
-                    try:
-                        parsed_response = json.loads(text)
-                        return parsed_response
-                    except json.JSONDecodeError:
-                        # If not JSON, structure it
-                        return {
-                            "clinical_recommendation": {
-                                "dosage_adjustment": text[:200],
-                                "monitoring": "Refer to clinical guidelines"
-                            },
-                            "llm_generated_explanation": {
-                                "summary": text
-                            }
-                        }
-            
-            return self._default_response()
+            # Try to parse as JSON
+            try:
+                parsed_response = json.loads(text)
+                return parsed_response
+            except json.JSONDecodeError:
+                # If not JSON, structure it
+                return {
+                    "clinical_recommendation": {
+                        "dosage_adjustment": text[:200],
+                        "monitoring": "Refer to clinical guidelines"
+                    },
+                    "llm_generated_explanation": {
+                        "summary": text
+                    }
+                }
         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Error calling OpenAI API: {e}")
             return self._default_response()
     
+    def _request_text(self, prompt: str, deadline=None):
+        """Call /chat/completions and return the message content (None if absent)."""
+        url = f"{self.base_url}/chat/completions"
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7
+        }
+        
+        timeout = deadline.timeout(30) if deadline else 30
+        response = get_http_session().post(url, json=payload, headers=headers, timeout=timeout)
+        if response.status_code == 429:
+            raise RateLimited("OpenAI rate limit (429)")
+        response.raise_for_status()
+        
+        result = response.json()
+        
+        if "choices" in result and len(result["choices"]) > 0:
+            choice = result["choices"][0]
+            if "message" in choice:
+                return choice["message"]["content"]
+        
+        return None
+    
+    def stream_text(self, prompt: str, deadline=None):
+        """Stream the completion from /chat/completions with stream=true."""
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "stream": True
+        }
+        timeout = deadline.timeout(30) if deadline else 30
+        with get_http_session().post(url, json=payload, headers=headers, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for event in iter_sse_data(response):
+                if deadline and deadline.remaining() <= 0:
+                    raise DeadlineExceeded("Deadline reached while streaming")
+                for choice in event.get("choices", [])[:1]:
+                    content = choice.get("delta", {}).get("content")
+                    if content:
+                        yield content
+    
     def _default_response(self) -> dict:
         """Return complete default response if API call fails."""
-        return {
-            "clinical_recommendation": {
-                "dosage_adjustment": "Consult healthcare provider for personalized guidance",
-                "monitoring": "Standard monitoring recommended",
-                "alternative_drugs": [],
-                "urgency": "routine"
-            },
-            "llm_generated_explanation": {
-                "summary": "Your genetic profile has been analyzed for this medication. Consult with your healthcare provider for personalized dosing guidance.",
-                "mechanism": "Your body's ability to process this medication depends on your genetic makeup. This has been analyzed and will be discussed with your doctor.",
-                "interaction_notes": [
-                    "Always inform your doctor about genetic test results",
-                    "Discuss any medication changes with your pharmacist",
-                    "Report any unusual side effects immediately"
-                ],
-                "evidence_basis": "Based on published clinical guidelines and genetic research"
-            }
-        }
+        return default_recommendation()
 
 
-def get_llm_provider(provider_name: str = "gemini", api_key: str = None) -> LLMProvider:
+def get_llm_provider(provider_name: str = "gemini", api_key: str = None, model: str = None) -> LLMProvider:
     """
     Factory function to get an LLM provider instance.
     
@@ -281,6 +474,8 @@ def get_llm_provider(provider_name: str = "gemini", api_key: str = None) -> LLMP
         Name of the provider ("gemini" or "openai")
     api_key : str
         API key for the provider
+    model : str
+        Model name (default: the provider's GEMINI_MODEL / OPENAI_MODEL setting)
         
     Returns:
     --------
@@ -290,8 +485,8 @@ def get_llm_provider(provider_name: str = "gemini", api_key: str = None) -> LLMP
     provider_name = provider_name.lower()
     
     if provider_name == "gemini":
-        return GeminiProvider(api_key)
+        return GeminiProvider(api_key, model)
     elif provider_name == "openai":
-        return OpenAIProvider(api_key)
+        return OpenAIProvider(api_key, model)
     else:
         raise ValueError(f"Unknown LLM provider: {provider_name}")
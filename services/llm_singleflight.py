@@ -0,0 +1,214 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from services.deadline import DeadlineExceeded
+from services.llm_service import LLMProvider
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within the process
+    fcntl = None
+
+
+# Coalesce identical in-flight LLM calls (set to false to send every call)
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "true").lower() in ("1", "true", "yes")
+# Lock and result files shared by the gunicorn workers of one host
+LLM_SINGLEFLIGHT_DIR = os.getenv("LLM_SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "pharmaguard-singleflight"))
+# Result files older than this are ignored and swept
+LLM_SINGLEFLIGHT_RESULT_TTL = float(os.getenv("LLM_SINGLEFLIGHT_RESULT_TTL", "30"))
+
+# How often a waiting worker checks whether the leading worker has finished
+POLL_SECONDS = 0.05
+# Result-file writes between sweeps of expired files
+SWEEP_EVERY = 100
+
+
+class _Flight:
+    """One in-process call that other callers with the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.result = None
+
+
+class SingleFlightProvider(LLMProvider):
+    """
+    Wrapper that sends identical concurrent prompts to the LLM only once.
+
+    Within a worker, callers whose prompt is already in flight wait for the
+    first caller's result. Across the gunicorn workers of a host the leader
+    holds an fcntl lock file for the key and writes its result next to it;
+    workers that find the lock taken poll until it is released and read the
+    result instead of calling the API. Followers never wait past their own
+    deadline, and if the leader fails they make the call themselves.
+
+    Only completed calls are shared - this is not a cache: a result is used
+    by callers that were already waiting when it was produced.
+    """
+
+    def __init__(self, provider: LLMProvider, lock_dir: str = None):
+        self.provider = provider
+        self.lock_dir = lock_dir or LLM_SINGLEFLIGHT_DIR
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counts = {"calls": 0, "sent": 0, "coalesced_local": 0, "coalesced_shared": 0}
+        if fcntl is not None:
+            try:
+                os.makedirs(self.lock_dir, exist_ok=True)
+            except OSError as e:
+                print(f"⚠ Single-flight lock directory unavailable ({e}); coalescing within this worker only")
+                self.lock_dir = None
+
+    def __getattr__(self, name):
+        # stats(), model, etc. of the wrapped provider
+        if name == "provider":
+            raise AttributeError(name)
+        return getattr(self.provider, name)
+
+    def _key(self, method: str, prompt: str) -> str:
+        model = getattr(self.provider, "model", type(self.provider).__name__)
+        return hashlib.sha256(f"{method}\0{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _coalesce(self, method: str, prompt: str, deadline, call):
+        self._count("calls")
+        key = self._key(method, prompt)
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                try:
+                    flight.result = self._call_across_workers(key, deadline, call)
+                    flight.ok = True
+                    return flight.result
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            timeout = deadline.remaining() if deadline else None
+            if not flight.done.wait(timeout):
+                raise DeadlineExceeded("Deadline reached waiting for an identical in-flight LLM call")
+            if flight.ok:
+                self._count("coalesced_local")
+                # Callers own their result (the pipeline stores parts of it in analyses)
+                return copy.deepcopy(flight.result)
+            # The leader failed: make the call ourselves
+
+    def _call_across_workers(self, key: str, deadline, call):
+        if fcntl is None or not self.lock_dir:
+            self._count("sent")
+            return call()
+
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+        waiting_since = time.time()
+        with open(lock_path, "a") as lock_file:
+            while True:
+                try:
+                    # Non-blocking + sleep, so a gevent worker keeps serving other requests while waiting
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if deadline and deadline.remaining() <= POLL_SECONDS:
+                        raise DeadlineExceeded("Deadline reached waiting for another worker's LLM call")
+                    time.sleep(POLL_SECONDS)
+            try:
+                shared = self._read_result(result_path, waiting_since)
+                if shared is not None:
+                    self._count("coalesced_shared")
+                    return shared["result"]
+                self._count("sent")
+                result = call()
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_result(self, path: str, produced_after: float):
+        """Return {"result": ...} written by another worker since we started waiting, else None."""
+        try:
+            if os.path.getmtime(path) < produced_after:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path: str, result):
+        try:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"result": result}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠ Could not share LLM result with other workers: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % SWEEP_EVERY == 0
+        if sweep:
+            self._sweep()
+
+    def _sweep(self):
+        """
+        Delete result files (and abandoned temp files) that have outlived the result TTL.
+
+        Lock files are kept: their mtime never changes, so age says nothing
+        about whether one is held or waited on, and unlinking a held lock lets
+        the next caller lock a new inode and lead a second call. One empty
+        file per distinct prompt is cheap.
+        """
+        cutoff = time.time() - LLM_SINGLEFLIGHT_RESULT_TTL
+        try:
+            for name in os.listdir(self.lock_dir):
+                if not name.endswith((".json", ".tmp")):
+                    continue
+                path = os.path.join(self.lock_dir, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    continue
+        except OSError:
+            pass
+
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        """Coalesced generate_clinical_recommendation() of the wrapped provider."""
+        return self._coalesce(
+            "recommendation", prompt, deadline,
+            lambda: self.provider.generate_clinical_recommendation(prompt, deadline=deadline)
+        )
+
+    def generate_json(self, prompt: str, deadline=None):
+        """Coalesced generate_json() of the wrapped provider."""
+        return self._coalesce(
+            "json", prompt, deadline,
+            lambda: self.provider.generate_json(prompt, deadline=deadline)
+        )
+
+    def _request_text(self, prompt: str, deadline=None):
+        return self.provider._request_text(prompt, deadline=deadline)
+
+    def stream_text(self, prompt: str, deadline=None):
+        """Streams are passed through (each client needs its own chunks)."""
+        return self.provider.stream_text(prompt, deadline=deadline)
+
+    def singleflight_stats(self) -> dict:
+        """Calls seen, calls actually sent, and calls answered by another caller's request."""
+        with self._lock:
+            return dict(self._counts)
@@ -0,0 +1,114 @@
+import json
+import re
+
+
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class PartialJSONFieldExtractor:
+    """
+    Incrementally extract string fields from JSON text that is still arriving.
+
+    Fed with raw completion chunks, it finds `"<parent>": {... "<field>": "`
+    and decodes the string value as far as it has been received, so
+    `llm_generated_explanation.summary` can be shown before the JSON object
+    is complete. Escape sequences split across chunks are held back until
+    they are complete.
+    """
+
+    def __init__(self, fields=("summary", "mechanism"), parent: str = "llm_generated_explanation"):
+        self.fields = list(fields)
+        self.parent = parent
+        self.buffer = ""
+        self._parent_at = None
+        self._patterns = {field: re.compile(r'"%s"\s*:\s*"' % re.escape(field)) for field in self.fields}
+        self._position = {}   # field -> index of the next undecoded character
+        self._done = set()
+
+    def feed(self, chunk: str) -> list:
+        """
+        Add a chunk of completion text.
+
+        Returns:
+        --------
+        list
+            [(field, newly decoded text), ...] for every field that advanced
+        """
+        self.buffer += chunk
+        if self._parent_at is None:
+            match = re.search(r'"%s"\s*:\s*\{' % re.escape(self.parent), self.buffer)
+            if not match:
+                return []
+            self._parent_at = match.end()
+
+        deltas = []
+        for field in self.fields:
+            if field in self._done:
+                continue
+            if field not in self._position:
+                match = self._patterns[field].search(self.buffer, self._parent_at)
+                if not match:
+                    continue
+                self._position[field] = match.end()
+            text = self._decode(field)
+            if text:
+                deltas.append((field, text))
+        return deltas
+
+    def _decode(self, field: str) -> str:
+        position = self._position[field]
+        buffer = self.buffer
+        out = []
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self._done.add(field)
+                position += 1
+                break
+            if char != '\\':
+                out.append(char)
+                position += 1
+                continue
+            if position + 1 >= len(buffer):
+                break  # escape split across chunks
+            code = buffer[position + 1]
+            if code == 'u':
+                digits = buffer[position + 2:position + 6]
+                if len(digits) < 4:
+                    break
+                try:
+                    out.append(chr(int(digits, 16)))
+                except ValueError:
+                    pass
+                position += 6
+            else:
+                out.append(_SIMPLE_ESCAPES.get(code, code))
+                position += 2
+        self._position[field] = position
+        return "".join(out)
+
+
+def iter_sse_data(response):
+    """
+    Yield the parsed JSON payload of each `data:` line of a server-sent-events response.
+
+    Parameters:
+    -----------
+    response : requests.Response
+        Response opened with stream=True
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            continue
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
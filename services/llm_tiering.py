@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+from services.llm_hedging import LatencyTracker
+from services.llm_service import LLMProvider, default_recommendation
+from services.response_builder import _determine_risk_assessment
+
+
+# Cheaper, faster model for simple low-risk cases (unset = no tiering)
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "")
+# Cases routed to the fast tier: these risk severities at these CPIC levels
+LLM_FAST_TIER_SEVERITIES = {s.strip().lower() for s in os.getenv("LLM_FAST_TIER_SEVERITIES", "none,low").split(",") if s.strip()}
+LLM_FAST_TIER_CPIC_LEVELS = {s.strip().upper() for s in os.getenv("LLM_FAST_TIER_CPIC_LEVELS", "A,B").split(",") if s.strip()}
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+
+def choose_tier(phenotype: str, cpic_level: str = None, drug: str = None, gemini_fallback: bool = False) -> str:
+    """
+    Routing policy: which model tier should explain this case.
+
+    Simple, low-risk cases - a known phenotype whose risk severity (from
+    _determine_risk_assessment) is in LLM_FAST_TIER_SEVERITIES at a CPIC level
+    in LLM_FAST_TIER_CPIC_LEVELS - go to the fast tier. Critical/high/moderate
+    risk, unknown phenotypes, weak evidence and non-CPIC fallback drugs stay on
+    the strong model.
+
+    Returns:
+    --------
+    str
+        "fast" or "strong"
+    """
+    if gemini_fallback or not phenotype or phenotype == "Unknown":
+        return STRONG_TIER
+    if str(cpic_level or "").upper() not in LLM_FAST_TIER_CPIC_LEVELS:
+        return STRONG_TIER
+    severity = _determine_risk_assessment(phenotype, cpic_level, drug)["severity"]
+    return FAST_TIER if severity in LLM_FAST_TIER_SEVERITIES else STRONG_TIER
+
+
+class _TierProvider(LLMProvider):
+    """One tier's provider stack, with call latency and error counters."""
+
+    def __init__(self, tier: str, provider: LLMProvider):
+        self.tier = tier
+        self.provider = provider
+        self.model = str(getattr(provider, "model", None) or type(provider).__name__)
+        self.latency = LatencyTracker()
+        self._counts = {"calls": 0, "errors": 0, "fallbacks": 0, "total_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def _timed(self, call):
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            result = call()
+            if result is None or result == default_recommendation():
+                outcome = "fallbacks"
+            return result
+        except Exception:
+            outcome = "errors"
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._counts["calls"] += 1
+                self._counts["total_seconds"] += elapsed
+                if outcome != "ok":
+                    self._counts[outcome] += 1
+            if outcome == "ok":
+                self.latency.record(elapsed)
+
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        return self._timed(lambda: self.provider.generate_clinical_recommendation(prompt, deadline=deadline))
+
+    def generate_json(self, prompt: str, deadline=None):
+        return self._timed(lambda: self.provider.generate_json(prompt, deadline=deadline))
+
+    def _request_text(self, prompt: str, deadline=None):
+        return self.provider._request_text(prompt, deadline=deadline)
+
+    def stream_text(self, prompt: str, deadline=None):
+        return self.provider.stream_text(prompt, deadline=deadline)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        total_seconds = counts.pop("total_seconds")
+        return dict(
+            counts,
+            model=self.model,
+            mean_seconds=round(total_seconds / counts["calls"], 3) if counts["calls"] else None,
+            p50_seconds=self.latency.percentile(50),
+            p95_seconds=self.latency.percentile(95)
+        )
+
+
+class TieredProvider(LLMProvider):
+    """
+    Routes each case to a fast or a strong model (see choose_tier()).
+
+    Callers that know the case use for_case(); calls made directly on this
+    object (batched prompts, generic calls) use the strong tier.
+    """
+
+    def __init__(self, fast: LLMProvider, strong: LLMProvider):
+        self.tiers = {FAST_TIER: _TierProvider(FAST_TIER, fast), STRONG_TIER: _TierProvider(STRONG_TIER, strong)}
+        self.model = self.tiers[STRONG_TIER].model
+
+    def for_case(self, phenotype: str, cpic_level: str = None, drug: str = None,
+                 gemini_fallback: bool = False) -> LLMProvider:
+        """Return the provider of the tier chosen for this case."""
+        return self.tiers[choose_tier(phenotype, cpic_level, drug, gemini_fallback)]
+
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        return self.tiers[STRONG_TIER].generate_clinical_recommendation(prompt, deadline=deadline)
+
+    def generate_json(self, prompt: str, deadline=None):
+        return self.tiers[STRONG_TIER].generate_json(prompt, deadline=deadline)
+
+    def _request_text(self, prompt: str, deadline=None):
+        return self.tiers[STRONG_TIER]._request_text(prompt, deadline=deadline)
+
+    def stream_text(self, prompt: str, deadline=None):
+        return self.tiers[STRONG_TIER].stream_text(prompt, deadline=deadline)
+
+    def stats(self) -> dict:
+        """Per-tier call counts, error/fallback counts and latency."""
+        return {tier: provider.stats() for tier, provider in self.tiers.items()}
+
+
+def route_provider(llm_provider, phenotype: str, cpic_level: str = None, drug: str = None,
+                   gemini_fallback: bool = False):
+    """Pick the tier for a case when the provider is tiered; otherwise return it unchanged."""
+    if isinstance(llm_provider, TieredProvider):
+        return llm_provider.for_case(phenotype, cpic_level, drug, gemini_fallback)
+    return llm_provider
@@ -0,0 +1,242 @@
+import csv
+import threading
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+REGIONS_FILE = DATA_DIR / "pharmacogene_regions.tsv"
+VARIANTS_FILE = DATA_DIR / "pharmacogene_variants.tsv"
+
+
+def normalize_chrom(chrom: str) -> str:
+    """Normalize contig names so that "chr10", "CHR10" and "10" compare equal."""
+    chrom = str(chrom).strip()
+    if chrom[:3].lower() == "chr":
+        chrom = chrom[3:]
+    chrom = chrom.upper()
+    return "M" if chrom == "MT" else chrom
+
+
+def read_tsv(path: Path) -> list:
+    """Read a tab-separated table with a header row, ignoring '#' comment lines."""
+    with open(path, newline="", encoding="utf-8") as handle:
+        rows = (line for line in handle if line.strip() and not line.startswith("#"))
+        return list(csv.DictReader(rows, delimiter="\t"))
+
+
+class PharmacogeneIndex:
+    """
+    In-memory annotation index for pharmacogene regions and star-allele defining variants.
+
+    Star alleles themselves are called per gene from the combination of
+    defining variants (see star_allele_caller), not per record.
+
+    Per chromosome, gene regions and defining-variant positions are kept in
+    sorted arrays and looked up by binary search, so annotating a VCF record
+    costs O(log n) with no per-record allocation beyond the result dict.
+
+    Lookup order used by annotate():
+    1. exact CHROM:POS/REF/ALT match against a defining variant
+    2. rsID from the VCF ID column against the defining-variant table
+    3. CHROM:POS inside a gene region (gene only)
+    """
+
+    def __init__(self, regions: list, variants: list):
+        # chrom -> parallel sorted arrays: starts, running max of ends, (start, end, gene)
+        self._region_starts = {}
+        self._region_max_ends = {}
+        self._regions = {}
+        by_chrom = {}
+        for region in regions:
+            by_chrom.setdefault(normalize_chrom(region["chrom"]), []).append(
+                (int(region["start"]), int(region["end"]), region["gene"].upper())
+            )
+        for chrom, entries in by_chrom.items():
+            entries.sort()
+            max_ends = []
+            running = 0
+            for _, end, _ in entries:
+                running = max(running, end)
+                max_ends.append(running)
+            self._region_starts[chrom] = [start for start, _, _ in entries]
+            self._region_max_ends[chrom] = max_ends
+            self._regions[chrom] = entries
+
+        # chrom -> sorted positions and the defining variants at those positions
+        self._variant_positions = {}
+        self._variants = {}
+        self._by_rsid = {}
+        by_chrom = {}
+        for row in variants:
+            variant = {
+                "gene": row["gene"].upper(),
+                "rsid": row["rsid"],
+                "chrom": normalize_chrom(row["chrom"]),
+                "pos": int(row["pos"]),
+                "ref": row["ref"].upper(),
+                "alt": row["alt"].upper()
+            }
+            by_chrom.setdefault(variant["chrom"], []).append(variant)
+            if variant["rsid"]:
+                self._by_rsid[variant["rsid"].lower()] = variant
+        for chrom, entries in by_chrom.items():
+            entries.sort(key=lambda v: v["pos"])
+            self._variant_positions[chrom] = [v["pos"] for v in entries]
+            self._variants[chrom] = entries
+
+    @property
+    def genes(self) -> set:
+        return {gene for entries in self._regions.values() for _, _, gene in entries}
+
+    def gene_at(self, chrom: str, pos: int):
+        """Return the gene whose region contains CHROM:POS, or None."""
+        chrom = normalize_chrom(chrom)
+        starts = self._region_starts.get(chrom)
+        if not starts:
+            return None
+        max_ends = self._region_max_ends[chrom]
+        entries = self._regions[chrom]
+        i = bisect_right(starts, pos) - 1
+        # Walk left only while an earlier region could still reach this position
+        while i >= 0 and max_ends[i] >= pos:
+            start, end, gene = entries[i]
+            if start <= pos <= end:
+                return gene
+            i -= 1
+        return None
+
+    def variants_at(self, chrom: str, pos: int) -> list:
+        """Return the defining variants located at CHROM:POS."""
+        chrom = normalize_chrom(chrom)
+        positions = self._variant_positions.get(chrom)
+        if not positions:
+            return []
+        lo = bisect_left(positions, pos)
+        hi = bisect_right(positions, pos, lo)
+        return self._variants[chrom][lo:hi]
+
+    def variant_by_rsid(self, rsid: str):
+        """Return the defining variant for an rsID, or None."""
+        return self._by_rsid.get(str(rsid).strip().lower())
+
+    def annotate(self, chrom: str, pos, vcf_id: str = "", ref: str = "", alt: str = "", genotype: str = None):
+        """
+        Annotate one VCF record with its pharmacogene and rsID.
+
+        Parameters:
+        -----------
+        chrom, pos, vcf_id, ref, alt : str
+            The CHROM, POS, ID, REF and ALT columns of the record
+        genotype : str
+            GT value (e.g. "0/1"); when given, only ALT alleles present in the
+            genotype can match a defining variant
+
+        Returns:
+        --------
+        dict or None
+            {"gene": "CYP2C19", "rsid": "rs4244285"} - "rsid" is omitted when
+            unknown; None if the record is outside every pharmacogene
+        """
+        try:
+            pos = int(pos)
+        except (TypeError, ValueError):
+            pos = None  # e.g. not liftable to the canonical build - the rsID may still match
+
+        ref = str(ref).upper()
+        alts = str(alt).upper().split(",")
+        called = None
+        if genotype:
+            called = {a for a in genotype.replace("|", "/").split("/") if a not in (".", "0")}
+
+        for variant in (self.variants_at(chrom, pos) if pos is not None else []):
+            if variant["ref"] != ref:
+                continue
+            for index, allele in enumerate(alts, start=1):
+                if allele == variant["alt"] and (called is None or str(index) in called):
+                    return {"gene": variant["gene"], "rsid": variant["rsid"]}
+
+        ids = [i for i in str(vcf_id).split(";") if i.lower().startswith("rs")]
+        for rsid in ids:
+            variant = self.variant_by_rsid(rsid)
+            if variant:
+                return {"gene": variant["gene"], "rsid": variant["rsid"]}
+
+        gene = self.gene_at(chrom, pos) if pos is not None else None
+        if gene:
+            annotation = {"gene": gene}
+            if ids:
+                annotation["rsid"] = ids[0]
+            return annotation
+        return None
+
+    def panel(self, genes) -> "GenePanel":
+        """Return a record pre-filter for the given genes (see GenePanel)."""
+        genes = {str(g).upper() for g in genes}
+        regions = [(chrom, start, end) for chrom, entries in self._regions.items()
+                   for start, end, gene in entries if gene in genes]
+        rsids = {rsid for rsid, variant in self._by_rsid.items() if variant["gene"] in genes}
+        return GenePanel(regions, rsids)
+
+
+class GenePanel:
+    """
+    Cheap pre-filter for raw VCF records against a subset of pharmacogenes.
+
+    A record can only be annotated with one of the panel genes if its position
+    falls inside a panel gene region (every defining variant lies inside its
+    gene's region) or its ID column holds a defining rsID of a panel gene.
+    Everything else is rejected on CHROM/POS/ID alone, before the record is
+    decoded or its INFO and sample columns are parsed.
+    """
+
+    def __init__(self, regions: list, rsids: set):
+        by_chrom = {}
+        for chrom, start, end in regions:
+            by_chrom.setdefault(chrom, []).append((start, end))
+        # chrom -> sorted starts and running max of ends: a position is covered iff the
+        # running max end at the last start <= pos reaches it
+        self._starts = {}
+        self._max_ends = {}
+        for chrom, entries in by_chrom.items():
+            entries.sort()
+            running = 0
+            max_ends = []
+            for _, end in entries:
+                running = max(running, end)
+                max_ends.append(running)
+            self._starts[chrom] = [start for start, _ in entries]
+            self._max_ends[chrom] = max_ends
+        self._rsids = rsids
+        # Contig name as written in the VCF -> normalized name (a VCF uses only a few)
+        self._chroms = {}
+
+    def accepts(self, chrom: str, pos, vcf_id: str = "") -> bool:
+        """True if a record at CHROM:POS (canonical build, None if unknown) with this ID may be in the panel."""
+        if pos is not None:
+            normalized = self._chroms.get(chrom)
+            if normalized is None:
+                normalized = self._chroms[chrom] = normalize_chrom(chrom)
+            chrom = normalized
+            starts = self._starts.get(chrom)
+            if starts:
+                i = bisect_right(starts, pos) - 1
+                if i >= 0 and self._max_ends[chrom][i] >= pos:
+                    return True
+        if self._rsids and vcf_id and vcf_id != ".":
+            return any(i.lower() in self._rsids for i in vcf_id.split(";"))
+        return False
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_pharmacogene_index() -> PharmacogeneIndex:
+    """Return the process-wide index, building it from the bundled tables on first use."""
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = PharmacogeneIndex(read_tsv(REGIONS_FILE), read_tsv(VARIANTS_FILE))
+    return _INDEX
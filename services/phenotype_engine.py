@@ -1,6 +1,112 @@
+from services.cpic_tables import get_cpic_tables
+from services.star_allele_caller import get_star_allele_caller
+
+
+# Phenotype map for all supported genes
+PHENOTYPE_MAP = {
+    "CYP2D6": {
+        "*1/*1": "NM",
+        "*1/*2": "NM",
+        "*1/*3": "IM",
+        "*1/*4": "IM",
+        "*1/*5": "IM",
+        "*1/*6": "IM",
+        "*1/*10": "IM",
+        "*1/*41": "IM",
+        "*2/*2": "NM",
+        "*3/*4": "PM",
+        "*4/*4": "PM",
+        "*4/*5": "PM",
+        "*4/*6": "PM",
+        "*4/*10": "IM",
+        "*5/*5": "PM",
+        "*41/*41": "NM",
+        "*2/*4": "IM",
+        "*2/*10": "NM",
+        "*2/*41": "NM",
+        "*4/*41": "IM",
+        "*10/*10": "IM",
+        "*10/*41": "IM",
+        # Wildcard patterns for combinations
+    },
+    "CYP2C19": {
+        "*1/*1": "NM",
+        "*1/*2": "IM",
+        "*1/*3": "IM",
+        "*2/*2": "PM",
+        "*2/*3": "PM",
+        "*3/*3": "PM",
+        "*1/*17": "RM",
+        "*17/*17": "URM",
+        "*2/*17": "IM",
+        "*3/*17": "IM",
+    },
+    "CYP2C9": {
+        "*1/*1": "NM",
+        "*1/*2": "IM",
+        "*1/*3": "IM",
+        "*2/*2": "IM",
+        "*2/*3": "PM",
+        "*3/*3": "PM",
+    },
+    "SLCO1B1": {
+        "*1/*1": "NM",
+        "*1/*5": "IM",
+        "*5/*5": "PM",
+    },
+    "TPMT": {
+        "*1/*1": "NM",
+        "*1/*3": "IM",
+        "*3/*3": "PM",
+        "*1/*3A": "IM",
+        "*1/*3B": "IM",
+        "*1/*3C": "IM",
+        "*3A/*3A": "PM",
+        "*3A/*3B": "PM",
+        "*3A/*3C": "PM",
+        "*3B/*3B": "PM",
+        "*3B/*3C": "PM",
+        "*3C/*3C": "PM",
+    },
+    "DPYD": {
+        "*1/*1": "NM",
+        "*1/*2": "IM",
+        "*2/*2": "PM",
+        "*1/*13": "IM",
+        "*13/*13": "PM",
+        "*2/*13": "PM",
+        # Activity score: *2 and *13 are 0 (no function), c.2846A>T is 0.5 (decreased)
+        "*1/c.2846A>T": "IM",
+        "*2/c.2846A>T": "PM",
+        "*13/c.2846A>T": "PM",
+        "c.2846A>T/c.2846A>T": "IM",
+    }
+}
+
+
+def lookup_phenotype(gene: str, diplotype: str):
+    """
+    Phenotype code for an exact diplotype, or None if it is not known.
+
+    The indexed CPIC table store (services/cpic_tables.py, built by
+    tools/ingest_cpic_tables.py) is consulted first when present; PHENOTYPE_MAP
+    covers the supported genes when it is not, or when it lacks the entry.
+    """
+    tables = get_cpic_tables()
+    if tables is not None:
+        phenotype = tables.phenotype(gene, diplotype)
+        if phenotype is not None:
+            return phenotype
+    return PHENOTYPE_MAP.get(gene, {}).get(diplotype)
+
+
 def determine_phenotype(gene: str, variants: list) -> dict:
     """
     Determine metabolic phenotype from STAR alleles and build diplotype.
+
+    Variants carrying STAR labels (tagged VCFs) are paired directly. Untagged
+    variants with genotypes are called against the gene's allele-definition
+    table by the bitset star-allele caller.
     
     Parameters:
     -----------
@@ -22,60 +128,6 @@ def determine_phenotype(gene: str, variants: list) -> dict:
         }
     """
     
-    # Phenotype map for all supported genes
-    PHENOTYPE_MAP = {
-        "CYP2D6": {
-            "*1/*1": "NM",
-            "*1/*2": "NM",
-            "*1/*3": "IM",
-            "*1/*4": "IM",
-            "*1/*5": "IM",
-            "*1/*6": "IM",
-            "*1/*10": "IM",
-            "*1/*41": "IM",
-            "*2/*2": "NM",
-            "*3/*4": "PM",
-            "*4/*4": "PM",
-            "*4/*5": "PM",
-            "*4/*6": "PM",
-            "*4/*10": "IM",
-            "*5/*5": "PM",
-            "*41/*41": "NM",
-            # Wildcard patterns for combinations
-        },
-        "CYP2C19": {
-            "*1/*1": "NM",
-            "*1/*2": "IM",
-            "*1/*3": "IM",
-            "*2/*2": "PM",
-            "*2/*3": "PM",
-            "*3/*3": "PM",
-        },
-        "CYP2C9": {
-            "*1/*1": "NM",
-            "*1/*2": "IM",
-            "*1/*3": "IM",
-            "*2/*2": "IM",
-            "*2/*3": "PM",
-            "*3/*3": "PM",
-        },
-        "SLCO1B1": {
-            "*1/*1": "NM",
-            "*1/*5": "IM",
-            "*5/*5": "PM",
-        },
-        "TPMT": {
-            "*1/*1": "NM",
-            "*1/*3": "IM",
-            "*3/*3": "PM",
-        },
-        "DPYD": {
-            "*1/*1": "NM",
-            "*1/*2": "IM",
-            "*2/*2": "PM",
-        }
-    }
-    
     # Normalize gene name
     gene = str(gene).strip().upper()
     
@@ -93,6 +145,22 @@ def determine_phenotype(gene: str, variants: list) -> dict:
             result["phenotype"] = "Unknown"
             return result
         
+        # Untagged records: call the diplotype from genotypes at defining positions
+        if not any(isinstance(v, dict) and v.get("star") for v in variants):
+            caller = get_star_allele_caller(gene)
+            call = caller.call(variants) if caller else None
+            if call:
+                a1, a2 = call["diplotype"].split("/", 1)
+                for diplotype in (f"{a1}/{a2}", f"{a2}/{a1}"):
+                    phenotype = lookup_phenotype(gene, diplotype)
+                    if phenotype is not None:
+                        result["diplotype"] = diplotype
+                        result["phenotype"] = phenotype
+                        result["confidence"] = call["confidence"]
+                        return result
+                result["diplotype"] = call["diplotype"]
+                return result
+
         # Extract STAR alleles from variants
         star_alleles = []
         for variant in variants:
@@ -107,8 +175,6 @@ def determine_phenotype(gene: str, variants: list) -> dict:
             return result
         
         # Build diplotype candidates
-        gene_phenotype_map = PHENOTYPE_MAP.get(gene, {})
-
         unique_alleles = []
         for allele in star_alleles:
             if allele not in unique_alleles:
@@ -138,15 +204,10 @@ def determine_phenotype(gene: str, variants: list) -> dict:
             for a1, a2 in candidates:
                 direct = f"{a1}/{a2}"
                 reverse = f"{a2}/{a1}"
-                if direct in gene_phenotype_map:
-                    label = gene_phenotype_map[direct]
-                    if not best or phenotype_rank(label) > phenotype_rank(best_label):
-                        best = direct
-                        best_label = label
-                if reverse in gene_phenotype_map:
-                    label = gene_phenotype_map[reverse]
-                    if not best or phenotype_rank(label) > phenotype_rank(best_label):
-                        best = reverse
+                for candidate in (direct, reverse):
+                    label = lookup_phenotype(gene, candidate)
+                    if label is not None and (not best or phenotype_rank(label) > phenotype_rank(best_label)):
+                        best = candidate
                         best_label = label
 
             return best, best_label
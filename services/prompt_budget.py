@@ -0,0 +1,174 @@
+import os
+import threading
+
+
+# Token caps for the variant section of LLM prompts and for the gene list
+VARIANT_SECTION_TOKENS = int(os.getenv("LLM_VARIANT_SECTION_TOKENS", "250"))
+GENE_LIST_TOKENS = int(os.getenv("LLM_GENE_LIST_TOKENS", "60"))
+# rsIDs listed per gene before the rest is summarised as a count
+MAX_RSIDS_PER_GENE = 4
+
+# Upper edges (tokens) of the prompt-size buckets reported by PromptSizeStats
+PROMPT_SIZE_BUCKETS = (250, 500, 750, 1000, 1500, 2000, 4000)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of prompt text.
+
+    About 4 characters per token for English prose and JSON - close enough
+    for budgeting and for comparing prompt sizes, without a tokenizer.
+    """
+    return max(1, (len(text or "") + 3) // 4)
+
+
+def cap_lines(lines: list, max_tokens: int, overflow: str = "- ... {count} more not shown") -> list:
+    """
+    Keep leading lines while they fit in `max_tokens`.
+
+    Parameters:
+    -----------
+    lines : list
+        Lines in priority order
+    max_tokens : int
+        Token budget for the kept lines plus the overflow note
+    overflow : str
+        Note appended when lines are dropped ("{count}" = number dropped)
+
+    Returns:
+    --------
+    list
+        The kept lines, plus the overflow note if anything was dropped
+    """
+    kept = []
+    used = 0
+    reserve = estimate_tokens(overflow.format(count=len(lines)))
+    for index, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        last = index == len(lines) - 1
+        if used + cost > max_tokens - (0 if last else reserve):
+            kept.append(overflow.format(count=len(lines) - index))
+            return kept
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def _is_carried(variant: dict) -> bool:
+    genotype = str(variant.get("genotype") or "")
+    alleles = genotype.replace("|", "/").split("/")
+    if len(alleles) != 2 or "." in alleles:
+        return bool(variant.get("star")) and variant.get("star") not in ("*1", "Reference")
+    return alleles != ["0", "0"]
+
+
+def summarize_variants(variants_by_gene: dict, focus_genes=(), max_tokens: int = None) -> str:
+    """
+    Compact, ranked summary of a patient's variants for an LLM prompt.
+
+    Duplicate rsIDs and star alleles within a gene are collapsed. Genes are
+    ranked by relevance: the drug's own gene(s) first, then genes with a
+    non-reference star allele, then genes carrying non-reference alleles
+    (most first). Each gene lists at most
+    MAX_RSIDS_PER_GENE rsIDs (carried ones first). Lines that do not fit in
+    `max_tokens` are dropped with a note.
+
+    Parameters:
+    -----------
+    variants_by_gene : dict
+        Gene -> variant dicts, as in parse_vcf()["variants"]
+    focus_genes : iterable
+        Genes known to matter for the drug (listed first)
+    max_tokens : int
+        Budget for the section (default LLM_VARIANT_SECTION_TOKENS)
+
+    Returns:
+    --------
+    str
+        One line per gene, e.g. "- CYP2C19: *2 | rs4244285 1/1, rs4986893 0/1"
+    """
+    max_tokens = VARIANT_SECTION_TOKENS if max_tokens is None else max_tokens
+    focus = [str(g).upper() for g in focus_genes or ()]
+    ranked = []
+    for gene, variants in (variants_by_gene or {}).items():
+        stars = []
+        by_rsid = {}
+        for variant in variants if isinstance(variants, list) else []:
+            if not isinstance(variant, dict):
+                continue
+            star = variant.get("star")
+            if star and star not in stars:
+                stars.append(star)
+            rsid = variant.get("rsid") or "novel"
+            # Collapse duplicate rsIDs, preferring a record that carries the alt allele
+            if rsid not in by_rsid or (_is_carried(variant) and not _is_carried(by_rsid[rsid])):
+                by_rsid[rsid] = variant
+        if not by_rsid and not stars:
+            continue
+        entries = sorted(by_rsid.items(), key=lambda item: (not _is_carried(item[1]), item[0]))
+        carried = sum(1 for _, variant in entries if _is_carried(variant))
+        star_called = any(star not in ("*1", "Reference") for star in stars)
+        ranked.append((gene.upper() not in focus, not star_called, -carried, gene, stars, entries))
+    ranked.sort(key=lambda item: item[:4])
+
+    lines = []
+    for _, _, _, gene, stars, entries in ranked:
+        markers = [f"{rsid} {variant.get('genotype')}" if variant.get("genotype") else rsid
+                   for rsid, variant in entries[:MAX_RSIDS_PER_GENE]]
+        if len(entries) > MAX_RSIDS_PER_GENE:
+            markers.append(f"+{len(entries) - MAX_RSIDS_PER_GENE} more")
+        parts = [", ".join(stars)] if stars else []
+        parts.append(", ".join(markers))
+        lines.append(f"- {gene}: {' | '.join(parts)}")
+
+    if not lines:
+        return "- No variants detected in the supported genes"
+    return "\n".join(cap_lines(lines, max_tokens, "- ... {count} more genes not shown"))
+
+
+def summarize_genes(genes: list, max_tokens: int = None) -> str:
+    """Comma-separated, de-duplicated gene list capped at `max_tokens`."""
+    max_tokens = GENE_LIST_TOKENS if max_tokens is None else max_tokens
+    unique = list(dict.fromkeys(str(g).upper() for g in genes or () if g))
+    kept = cap_lines(unique, max_tokens, "{count} more")
+    if len(kept) < len(unique):
+        return ", ".join(kept[:-1]) + f" (+{kept[-1]})"
+    return ", ".join(kept)
+
+
+class PromptSizeStats:
+    """Per-bucket call counts and mean LLM latency by estimated prompt size."""
+
+    def __init__(self, buckets=PROMPT_SIZE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._seconds = [0.0] * (len(self.buckets) + 1)
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, prompt_tokens: int, seconds: float):
+        index = next((i for i, edge in enumerate(self.buckets) if prompt_tokens <= edge), len(self.buckets))
+        with self._lock:
+            self._counts[index] += 1
+            self._seconds[index] += seconds
+            self._tokens += prompt_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            seconds = list(self._seconds)
+            tokens = self._tokens
+        labels = [f"<={edge}" for edge in self.buckets] + [f">{self.buckets[-1]}"]
+        calls = sum(counts)
+        return {
+            "calls": calls,
+            "mean_prompt_tokens": round(tokens / calls, 1) if calls else None,
+            "by_prompt_tokens": {
+                label: {"calls": count, "mean_seconds": round(total / count, 3)}
+                for label, count, total in zip(labels, counts, seconds) if count
+            }
+        }
+
+
+# Process-wide prompt size vs. latency, exposed by /api/llm/stats
+PROMPT_STATS = PromptSizeStats()
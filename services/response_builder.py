@@ -2,6 +2,12 @@ import json
 from datetime import datetime
 import uuid
 
+from services.prompt_budget import summarize_genes, summarize_variants
+
+
+# Bump when prepare_llm_prompt() changes in a way that changes answers (invalidates the LLM cache)
+PROMPT_TEMPLATE_VERSION = "1"
+
 
 def build_response_json(
     drug: str,
@@ -15,7 +21,11 @@ def build_response_json(
     patient_id: str = None,
     clinical_recommendation: dict = None,
     llm_explanation: dict = None,
-    guideline_url: str = None
+    guideline_url: str = None,
+    degraded: bool = False,
+    recommendation_source: str = None,
+    prompt_tokens: int = None,
+    qc_rejected: dict = None
 ) -> dict:
     """
     Build the structured JSON response matching the required schema.
@@ -46,6 +56,14 @@ def build_response_json(
         LLM-generated explanation
     guideline_url : str
         Link to clinical guideline for this drug
+    degraded : bool
+        True if the LLM step was skipped because the request deadline ran out
+    recommendation_source : str
+        Where clinical_recommendation came from ("cpic_table:<version>" or "llm")
+    prompt_tokens : int
+        Estimated size of the prompt sent to the LLM (None if no call was made)
+    qc_rejected : dict
+        Calls dropped by the VCF QC filters, {gene: {filter: count}} (optional)
         
     Returns:
     --------
@@ -77,6 +95,15 @@ def build_response_json(
         "variant_count": variant_count,
         "data_completeness": "high" if variant_count > 0 else "low"
     }
+    if degraded:
+        quality_metrics["degraded"] = True
+        quality_metrics["degradation_reason"] = "deadline_exceeded"
+    if recommendation_source:
+        quality_metrics["recommendation_source"] = recommendation_source
+    if prompt_tokens:
+        quality_metrics["prompt_tokens"] = prompt_tokens
+    if qc_rejected:
+        quality_metrics["qc_rejected"] = qc_rejected
     
     # Build main response in exact field order as required by schema
     response = {
@@ -107,6 +134,169 @@ def build_response_json(
     return response
 
 
+def build_responses_from_analyses(analyses: list, vcf_parsing_success: bool, patient_id: str = None) -> list:
+    """
+    Build the per-drug response list (the default schema) from pipeline analyses.
+
+    Parameters:
+    -----------
+    analyses : list
+        Output of analysis_pipeline.analyze_drugs()
+    vcf_parsing_success : bool
+        Whether VCF parsing was successful
+    patient_id : str
+        Patient ID (auto-generated per analysis if not provided)
+
+    Returns:
+    --------
+    list
+        One build_response_json() result per analysis
+    """
+    responses = []
+    for analysis in analyses:
+        responses.append(build_response_json(
+            drug=analysis["drug"],
+            gene=analysis["gene"] or "Unknown (Gemini analysis)",
+            phenotype=analysis["phenotype"],
+            diplotype=analysis["diplotype"],
+            variant_count=analysis["variant_count"],
+            variants=analysis["variants"],
+            vcf_parsing_success=vcf_parsing_success,
+            cpic_level=analysis["cpic_level"],
+            patient_id=patient_id,
+            clinical_recommendation=analysis["clinical_recommendation"],
+            llm_explanation=analysis["llm_explanation"],
+            guideline_url=analysis["guideline_url"],
+            degraded=analysis.get("degraded", False),
+            recommendation_source=analysis.get("recommendation_source"),
+            prompt_tokens=analysis.get("prompt_tokens"),
+            qc_rejected=analysis.get("qc_rejected")
+        ))
+    return responses
+
+
+def build_compact_response(analyses: list, vcf_data: dict, patient_id: str = None) -> dict:
+    """
+    Build the compact multi-drug response with a single patient-level profile.
+
+    Variants, diplotypes and quality metrics are emitted once per gene in
+    "patient_profile"; per-drug entries reference genes by name instead of
+    repeating them, so payload size no longer grows with drugs x variants.
+
+    Parameters:
+    -----------
+    analyses : list
+        Output of analysis_pipeline.analyze_drugs()
+    vcf_data : dict
+        Parsed VCF data from vcf_parser.parse_vcf()
+    patient_id : str
+        Patient ID (auto-generated if not provided)
+
+    Returns:
+    --------
+    dict
+        Structure:
+        {
+            "format": "compact",
+            "patient_id": "PATIENT_XXX",
+            "timestamp": "...",
+            "patient_profile": {
+                "genes": {"CYP2D6": {"diplotype", "phenotype", "variant_count", "detected_variants"}},
+                "quality_metrics": {...}
+            },
+            "total_analyses": 2,
+            "analyses": [{"drug", "primary_gene", "genes", "risk_assessment", ...}]
+        }
+    """
+
+    if not patient_id:
+        patient_id = f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
+
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    variants_by_gene = vcf_data.get("variants", {})
+
+    # One profile entry per referenced gene
+    genes = {}
+    for analysis in analyses:
+        if analysis["gene"] and analysis["gene"] not in genes:
+            genes[analysis["gene"]] = {
+                "diplotype": analysis["diplotype"],
+                "phenotype": analysis["phenotype"],
+                "variant_count": analysis["variant_count"],
+                "detected_variants": analysis["variants"] or []
+            }
+    for analysis in analyses:
+        for gene in analysis["genes"]:
+            if gene not in genes:
+                # Only referenced by Gemini fallback analyses - not phenotyped
+                gene_variants = variants_by_gene.get(gene, [])
+                genes[gene] = {
+                    "diplotype": None,
+                    "phenotype": None,
+                    "variant_count": len(gene_variants),
+                    "detected_variants": gene_variants
+                }
+
+    total_variants = sum(entry["variant_count"] for entry in genes.values())
+
+    quality_metrics = {
+        "vcf_parsing_success": vcf_data.get("vcf_parsing_success"),
+        "variant_count": total_variants,
+        "data_completeness": "high" if total_variants > 0 else "low"
+    }
+    qc = vcf_data.get("qc") or {}
+    qc_rejected = {gene: counts for gene, counts in (qc.get("rejected") or {}).items() if gene in genes and counts}
+    if qc_rejected:
+        quality_metrics["qc_filters"] = qc.get("filters")
+        quality_metrics["qc_rejected"] = qc_rejected
+
+    compact_analyses = []
+    for analysis in analyses:
+        entry = {
+            "drug": analysis["drug"],
+            "primary_gene": analysis["gene"],
+            "genes": analysis["genes"],
+            "risk_assessment": _determine_risk_assessment(analysis["phenotype"], analysis["cpic_level"], analysis["drug"]),
+            "cpic_level": analysis["cpic_level"],
+            "clinical_recommendation": analysis["clinical_recommendation"] or {
+                "dosage_adjustment": "Pending LLM analysis",
+                "monitoring": "Standard monitoring recommended",
+                "alternative_drugs": [],
+                "urgency": "routine"
+            },
+            "llm_generated_explanation": analysis["llm_explanation"] or {
+                "summary": "Awaiting LLM analysis",
+                "mechanism": "Not available",
+                "interaction_notes": [],
+                "evidence_basis": "Pending"
+            }
+        }
+        if analysis["gemini_fallback"]:
+            entry["phenotype"] = analysis["phenotype"]
+        if analysis.get("degraded"):
+            entry["degraded"] = True
+            entry["degradation_reason"] = "deadline_exceeded"
+        if analysis.get("recommendation_source"):
+            entry["recommendation_source"] = analysis["recommendation_source"]
+        if analysis.get("prompt_tokens"):
+            entry["prompt_tokens"] = analysis["prompt_tokens"]
+        if analysis["guideline_url"]:
+            entry["guideline_url"] = analysis["guideline_url"]
+        compact_analyses.append(entry)
+
+    return {
+        "format": "compact",
+        "patient_id": patient_id,
+        "timestamp": timestamp,
+        "patient_profile": {
+            "genes": genes,
+            "quality_metrics": quality_metrics
+        },
+        "total_analyses": len(compact_analyses),
+        "analyses": compact_analyses
+    }
+
+
 def _determine_risk_assessment(phenotype: str, cpic_level: str = None, drug: str = None) -> dict:
     """
     Determine risk assessment based on phenotype and CPIC level.
@@ -247,6 +437,142 @@ Remember: Write for a patient who has no medical background. Use 'you' and 'your
     return prompt
 
 
+def prepare_fallback_llm_prompt(drug: str, genes: list, variant_count: int, variants_by_gene: dict = None,
+                                focus_genes=()) -> str:
+    """
+    Prepare the patient-friendly prompt for drugs that are not in the CPIC dataset.
+
+    The gene list and the variant summary are compacted to a fixed token
+    budget (services/prompt_budget.py), so the prompt does not grow with the VCF.
+    Only the drug's own genes get a markers section; without any in the VCF
+    the prompt lists the gene names alone.
+
+    Parameters:
+    -----------
+    drug : str
+        Drug name
+    genes : list
+        Gene symbols present in the patient's VCF
+    variant_count : int
+        Total number of variants detected across all genes
+    variants_by_gene : dict
+        Gene -> variant dicts; the focus genes' variants are summarised
+        (ranked, de-duplicated, capped) as the key genetic markers section
+    focus_genes : iterable
+        Genes CPIC pairs with the drug (cpic_engine.get_drug_genes()), most relevant first
+
+    Returns:
+    --------
+    str
+        Formatted prompt for LLM with patient-friendly language
+    """
+    markers = ""
+    focus = {gene: variants_by_gene[gene] for gene in focus_genes or () if (variants_by_gene or {}).get(gene)}
+    if focus:
+        markers = f"Key genetic markers (most relevant first):\n{summarize_variants(focus, focus_genes=list(focus))}\n"
+
+    return f"""You are a healthcare expert explaining medication genetics to a patient in simple, easy-to-understand language.
+
+PATIENT'S GENETIC PROFILE FOR: {drug}
+Patient's identified genes and genetic markers: {summarize_genes(genes) or 'Multiple genes detected'}
+Total genetic variants found: {variant_count}
+{markers}
+IMPORTANT: This medication is not in our standard database, but we can still analyze it using the patient's genetic profile.
+
+Please provide information in this JSON format, using simple language that a patient can understand:
+{{
+  "clinical_recommendation": {{
+    "dosage_adjustment": "In simple terms, whether the patient should take more, less, or standard amounts based on their genetics",
+    "monitoring": "What the patient and their doctor should watch for or check regularly",
+    "alternative_drugs": ["Other medications that might work better based on this patient's genetics"],
+    "urgency": "How important it is to discuss this with a doctor: routine|important|urgent"
+  }},
+  "llm_generated_explanation": {{
+    "summary": "A simple 1-2 sentence explanation of how the patient's genetics might affect {drug}",
+    "mechanism": "In plain English, how the patient's genetic profile affects how their body processes {drug}",
+    "interaction_notes": ["Important practical tips about taking {drug}", "What to discuss with their doctor"],
+    "evidence_basis": "How confident we are in this information based on available research"
+  }}
+}}
+
+Remember: Write for a patient with no medical background. Be supportive, encouraging, and clear."""
+
+
+def prepare_batch_llm_prompt(patient_genes: dict, items: list) -> str:
+    """
+    Prepare one patient-friendly prompt covering several drugs.
+
+    The patient's genetic profile is stated once and every drug is listed
+    against it, instead of repeating the context in one prompt per drug.
+
+    Parameters:
+    -----------
+    patient_genes : dict
+        Gene -> {"diplotype", "phenotype", "variant_count"} for the genes the drugs use
+    items : list
+        One dict per drug: {"drug", "gene" (None if not in CPIC), "cpic_level",
+        "guideline_url", "explanation_only"}; explanation_only drugs already
+        have a CPIC recommendation and only need the explanation
+
+    Returns:
+    --------
+    str
+        Formatted prompt asking for a JSON array with one object per drug
+    """
+    profile_lines = []
+    for gene, info in patient_genes.items():
+        profile_lines.append(
+            f"- {gene}: genetic combination {info.get('diplotype') or 'unknown'}, "
+            f"metabolism type {info.get('phenotype') or 'Unknown'}, "
+            f"{info.get('variant_count', 0)} genetic markers found"
+        )
+
+    drug_lines = []
+    for item in items:
+        if item.get("gene"):
+            line = (f"- {item['drug']}: processed by {item['gene']}, "
+                    f"{item.get('cpic_level') or 'Standard'} level evidence, "
+                    f"CPIC guideline: {item.get('guideline_url') or 'Not available'}")
+        else:
+            line = f"- {item['drug']}: not in our standard database - assess it from the whole profile above"
+        if item.get("explanation_only"):
+            line += " (explanation only - omit clinical_recommendation)"
+        drug_lines.append(line)
+
+    return f"""You are a healthcare expert explaining medication genetics to a patient in simple, easy-to-understand language.
+Your response MUST align with CPIC guidelines and be clinically actionable.
+
+PATIENT'S GENETIC PROFILE:
+{chr(10).join(profile_lines) or '- No pharmacogenes detected'}
+
+MEDICATIONS TO EXPLAIN:
+{chr(10).join(drug_lines)}
+
+IMPORTANT:
+- Follow CPIC guidance for each drug-gene pair. Do not contradict CPIC recommendations.
+- Use simple language, avoid medical jargon, and be encouraging.
+- Output MUST be a valid JSON array only (no markdown, no extra text), with exactly one object per medication, in the order listed.
+
+Each array element must use this format:
+{{
+  "drug": "The medication name exactly as listed above",
+  "clinical_recommendation": {{
+    "dosage_adjustment": "In simple terms, whether you should take more, less, or standard amounts",
+    "monitoring": "What you and your doctor should watch for or check regularly",
+    "alternative_drugs": ["Other medications that might work better for you based on your genetics"],
+    "urgency": "How important it is to discuss this with your doctor: routine|important|urgent"
+  }},
+  "llm_generated_explanation": {{
+    "summary": "A simple 1-2 sentence explanation of what your genetics mean for this medication",
+    "mechanism": "In plain English, how your genes affect how this medication works in your body",
+    "interaction_notes": ["Simple practical tips you should know", "Other important things to discuss with your doctor"],
+    "evidence_basis": "How confident doctors are in this information, and cite CPIC level and guideline link if available"
+  }}
+}}
+
+Remember: Write for a patient who has no medical background. Use 'you' and 'your'. Be supportive and clear."""
+
+
 def format_response_for_json_output(response_dict: dict) -> str:
     """
     Format the response dictionary as pretty JSON string.
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from services.knowledge_base import analysis_dependencies
+
+
+# Persistent store of per-drug analysis results (set RESULT_STORE=false to disable)
+RESULT_STORE = os.getenv("RESULT_STORE", "true").lower() in ("1", "true", "yes")
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "data/results.sqlite3")
+# Keep uploaded VCFs (patient genetic data) so tools/reanalyze.py can recompute results (opt-in)
+RESULT_STORE_KEEP_VCF = os.getenv("RESULT_STORE_KEEP_VCF", "false").lower() in ("1", "true", "yes")
+# Days a kept VCF is retained after its last upload (0 = no limit)
+RESULT_STORE_VCF_TTL_DAYS = float(os.getenv("RESULT_STORE_VCF_TTL_DAYS", "30"))
+# Upper bound on rows returned by one query
+MAX_QUERY_ROWS = 1000
+
+
+def knowledge_base_version(*sources) -> str:
+    """
+    Short fingerprint of everything results are derived from.
+
+    Parameters:
+    -----------
+    *sources : str, dict, list or None
+        File paths (hashed by content) or in-memory tables/labels (hashed as JSON)
+
+    Returns:
+    --------
+    str
+        16-character hex digest; changes whenever any source changes
+    """
+    digest = hashlib.sha256()
+    for source in sources:
+        if isinstance(source, str) and os.path.isfile(source):
+            with open(source, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        else:
+            digest.update(json.dumps(source, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()[:16]
+
+
+def parse_time(value) -> float:
+    """Epoch seconds from an epoch number or an ISO-8601 date/datetime (UTC if no offset)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class ResultStore:
+    """
+    SQLite store of analysis results shared by all workers on a host.
+
+    One row per (VCF content hash, drug, knowledge-base version) holds the
+    pipeline analysis (to rebuild any response format) and the per-drug
+    response. Indexed by patient and by drug/phenotype/time for history
+    queries. Each result's knowledge-base dependencies
+    (knowledge_base.analysis_dependencies()) are kept too, so a knowledge-base
+    update only re-runs the affected results (tools/reanalyze.py). That needs
+    the uploaded VCF, which is only kept with RESULT_STORE_KEEP_VCF and for
+    RESULT_STORE_VCF_TTL_DAYS after its last upload. WAL mode lets workers
+    read while another writes; one connection per thread.
+    """
+
+    def __init__(self, path: str = None, keep_vcf: bool = None, vcf_ttl_days: float = None):
+        self.path = path or RESULT_STORE_PATH
+        self.keep_vcf = RESULT_STORE_KEEP_VCF if keep_vcf is None else keep_vcf
+        self.vcf_ttl_days = RESULT_STORE_VCF_TTL_DAYS if vcf_ttl_days is None else vcf_ttl_days
+        self._local = threading.local()
+        self._counts = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                vcf_hash TEXT NOT NULL,
+                drug TEXT NOT NULL,
+                kb_version TEXT NOT NULL,
+                patient_id TEXT,
+                gene TEXT,
+                phenotype TEXT,
+                diplotype TEXT,
+                cpic_level TEXT,
+                recommendation_source TEXT,
+                llm_enriched INTEGER NOT NULL,
+                analysis TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (vcf_hash, drug, kb_version)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_patient ON analysis_results (patient_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_drug ON analysis_results (drug, phenotype, created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_dependencies (
+                kb_version TEXT NOT NULL,
+                entry TEXT NOT NULL,
+                vcf_hash TEXT NOT NULL,
+                drug TEXT NOT NULL,
+                PRIMARY KEY (kb_version, entry, vcf_hash, drug)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dependencies_result "
+                     "ON result_dependencies (vcf_hash, drug, kb_version)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS vcf_inputs (
+                vcf_hash TEXT PRIMARY KEY,
+                content BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counts[key] += amount
+
+    def get_analyses(self, vcf_hash: str, drugs: list, kb_version: str, require_llm: bool = False) -> dict:
+        """
+        Stored analyses of a VCF for the given drugs under one knowledge-base version.
+
+        Parameters:
+        -----------
+        vcf_hash : str
+            SHA-256 of the uploaded VCF
+        drugs : list
+            Drug names (matched case-insensitively)
+        kb_version : str
+            Current knowledge_base_version()
+        require_llm : bool
+            Skip results stored without an LLM explanation
+
+        Returns:
+        --------
+        dict
+            Drug (uppercase) -> analysis dict, for the drugs found
+        """
+        names = list(dict.fromkeys(str(d).strip().upper() for d in drugs))
+        if not names:
+            return {}
+        try:
+            rows = self._connection().execute(
+                f"SELECT drug, analysis FROM analysis_results WHERE vcf_hash = ? AND kb_version = ? "
+                f"AND drug IN ({','.join('?' * len(names))}) AND (llm_enriched = 1 OR ? = 0)",
+                [vcf_hash, kb_version] + names + [int(require_llm)]
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠ Result store read failed: {e}")
+            rows = []
+        self._count("hits", len(rows))
+        self._count("misses", len(names) - len(rows))
+        return {drug: json.loads(analysis) for drug, analysis in rows}
+
+    def put_results(self, vcf_hash: str, kb_version: str, analyses: list, responses: list,
+                    vcf_content: bytes = None):
+        """
+        Store analyses with their per-drug responses; failures are logged, never raised.
+
+        Degraded analyses (LLM skipped for time) are not stored. `vcf_content`
+        (the uploaded file) is kept once per hash for re-analysis when keep_vcf
+        is set; a repeat upload restarts its retention period.
+        """
+        now = time.time()
+        rows = []
+        dependencies = []
+        for analysis, response in zip(analyses, responses):
+            if analysis.get("degraded"):
+                continue
+            dependencies.extend((kb_version, entry, vcf_hash, analysis["drug"])
+                                for entry in analysis_dependencies(analysis))
+            rows.append((
+                vcf_hash, analysis["drug"], kb_version, response.get("patient_id"),
+                analysis.get("gene"), analysis.get("phenotype"), analysis.get("diplotype"),
+                analysis.get("cpic_level"), analysis.get("recommendation_source"),
+                int(bool(analysis.get("llm_explanation"))),
+                json.dumps(analysis, default=str), json.dumps(response, default=str), now
+            ))
+        if not rows:
+            return
+        try:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany("INSERT OR IGNORE INTO result_dependencies VALUES (?, ?, ?, ?)", dependencies)
+            if vcf_content is not None and self.keep_vcf:
+                conn.execute("INSERT INTO vcf_inputs VALUES (?, ?, ?) "
+                             "ON CONFLICT (vcf_hash) DO UPDATE SET created_at = excluded.created_at",
+                             (vcf_hash, zlib.compress(vcf_content), now))
+            conn.commit()
+            self._count("writes", len(rows))
+        except sqlite3.Error as e:
+            print(f"⚠ Result store write failed: {e}")
+
+    def query(self, patient_id: str = None, vcf_hash: str = None, drug: str = None, phenotype: str = None,
+              since: float = None, until: float = None, kb_version: str = None, limit: int = 100) -> list:
+        """
+        Stored per-drug responses matching all given filters, newest first.
+
+        e.g. query(patient_id="PATIENT_1A2B3C4D5E6F7A8B") or
+        query(drug="CLOPIDOGREL", phenotype="PM", since=<start of month>)
+
+        Returns:
+        --------
+        list
+            {"vcf_hash", "kb_version", "created_at" (ISO-8601), "response"} dicts
+        """
+        filters = []
+        params = []
+        for column, value in (("patient_id", patient_id), ("vcf_hash", vcf_hash), ("kb_version", kb_version),
+                              ("drug", drug.strip().upper() if drug else None),
+                              ("phenotype", phenotype.strip().upper() if phenotype else None)):
+            if value:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            filters.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            filters.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        params.append(max(1, min(int(limit), MAX_QUERY_ROWS)))
+        rows = self._connection().execute(
+            f"SELECT vcf_hash, kb_version, created_at, response FROM analysis_results {where} "
+            f"ORDER BY created_at DESC LIMIT ?", params
+        ).fetchall()
+        return [{
+            "vcf_hash": vcf_hash_value,
+            "kb_version": kb_version_value,
+            "created_at": datetime.fromtimestamp(created_at, timezone.utc).isoformat().replace("+00:00", "Z"),
+            "response": json.loads(response)
+        } for vcf_hash_value, kb_version_value, created_at, response in rows]
+
+    def _vcf_cutoff(self) -> float:
+        """Upload time before which kept VCFs are expired (0 when retention is unlimited)."""
+        return time.time() - self.vcf_ttl_days * 86400 if self.vcf_ttl_days > 0 else 0.0
+
+    def get_vcf(self, vcf_hash: str):
+        """The uploaded VCF content of a stored result (None if it was not kept or has expired)."""
+        row = self._connection().execute(
+            "SELECT content FROM vcf_inputs WHERE vcf_hash = ? AND created_at >= ?", (vcf_hash, self._vcf_cutoff())
+        ).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def purge_vcf_inputs(self, older_than: float = None) -> int:
+        """
+        Delete kept VCFs uploaded before `older_than` (epoch seconds).
+
+        Parameters:
+        -----------
+        older_than : float
+            Cut-off time (default: the RESULT_STORE_VCF_TTL_DAYS retention;
+            float("inf") deletes every kept VCF)
+
+        Returns:
+        --------
+        int
+            Number of VCFs deleted
+        """
+        cutoff = self._vcf_cutoff() if older_than is None else older_than
+        if not cutoff:
+            return 0
+        conn = self._connection()
+        # Overwrite the freed pages, so deleted genetic data does not linger in the file
+        conn.execute("PRAGMA secure_delete = ON")
+        try:
+            deleted = conn.execute("DELETE FROM vcf_inputs WHERE created_at < ?", (cutoff,)).rowcount
+            conn.commit()
+        finally:
+            conn.execute("PRAGMA secure_delete = OFF")
+        return deleted
+
+    def versions(self) -> list:
+        """Knowledge-base versions with stored results, most recently written first."""
+        return [version for (version,) in self._connection().execute(
+            "SELECT kb_version FROM analysis_results GROUP BY kb_version ORDER BY MAX(created_at) DESC"
+        )]
+
+    def count(self, kb_version: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM analysis_results WHERE kb_version = ?", (kb_version,)
+        ).fetchone()[0]
+
+    def affected_results(self, kb_version: str, entries) -> set:
+        """
+        (vcf_hash, drug) of results under `kb_version` that depend on any of the entries.
+
+        "*" selects every result and "llm" every result whose recommendation_source
+        is "llm" (read from the result itself, so results stored before the entry existed match too).
+        """
+        affected = set()
+        conn = self._connection()
+        if "*" in entries:
+            return set(conn.execute(
+                "SELECT vcf_hash, drug FROM analysis_results WHERE kb_version = ?", (kb_version,)
+            ).fetchall())
+        if "llm" in entries:
+            affected.update(conn.execute(
+                "SELECT vcf_hash, drug FROM analysis_results WHERE kb_version = ? AND recommendation_source = 'llm'",
+                (kb_version,)
+            ).fetchall())
+        for entry in entries:
+            affected.update(conn.execute(
+                "SELECT vcf_hash, drug FROM result_dependencies WHERE kb_version = ? AND entry = ?",
+                (kb_version, entry)
+            ).fetchall())
+        return affected
+
+    def get_result(self, vcf_hash: str, drug: str, kb_version: str):
+        """{"patient_id", "analysis", "response"} of one stored result (None if absent)."""
+        row = self._connection().execute(
+            "SELECT patient_id, analysis, response FROM analysis_results "
+            "WHERE vcf_hash = ? AND drug = ? AND kb_version = ?", (vcf_hash, drug, kb_version)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"patient_id": row[0], "analysis": json.loads(row[1]), "response": json.loads(row[2])}
+
+    def carry_forward(self, old_version: str, new_version: str, exclude: set) -> int:
+        """
+        Re-key results of `old_version` to `new_version`, except the excluded (vcf_hash, drug) pairs.
+
+        Used after a knowledge-base update for results it does not affect;
+        results already stored under the new version are kept. Results
+        without dependency rows are not carried forward.
+
+        Returns:
+        --------
+        int
+            Number of results carried forward
+        """
+        conn = self._connection()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS excluded_results (vcf_hash TEXT, drug TEXT, PRIMARY KEY (vcf_hash, drug))")
+        conn.execute("DELETE FROM temp.excluded_results")
+        conn.executemany("INSERT OR IGNORE INTO temp.excluded_results VALUES (?, ?)", list(exclude))
+        # Results without a dependency index (stored before it existed) cannot be proven unaffected
+        not_excluded = ("NOT EXISTS (SELECT 1 FROM temp.excluded_results x "
+                        "WHERE x.vcf_hash = r.vcf_hash AND x.drug = r.drug) AND EXISTS (SELECT 1 FROM "
+                        "result_dependencies d WHERE d.kb_version = r.kb_version AND d.vcf_hash = r.vcf_hash "
+                        "AND d.drug = r.drug)")
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO analysis_results "
+            "SELECT vcf_hash, drug, ?, patient_id, gene, phenotype, diplotype, cpic_level, recommendation_source, "
+            f"llm_enriched, analysis, response, created_at FROM analysis_results r WHERE kb_version = ? AND {not_excluded}",
+            (new_version, old_version)
+        )
+        carried = cursor.rowcount
+        conn.execute(
+            "INSERT OR IGNORE INTO result_dependencies "
+            f"SELECT ?, entry, vcf_hash, drug FROM result_dependencies r WHERE kb_version = ? AND {not_excluded}",
+            (new_version, old_version)
+        )
+        conn.commit()
+        return carried
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_result_store():
+    """Return the process-wide ResultStore (None when RESULT_STORE is off or unusable)."""
+    global _STORE
+    if not RESULT_STORE:
+        return None
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                try:
+                    _STORE = ResultStore()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"⚠ Result store unavailable ({e}) - analysis results will not be stored")
+                    _STORE = False
+                if _STORE:
+                    # Kept VCFs past their retention are removed at startup (and by tools/purge_vcf_inputs.py)
+                    try:
+                        purged = _STORE.purge_vcf_inputs()
+                        if purged:
+                            print(f"✓ Purged {purged} kept VCF(s) older than {_STORE.vcf_ttl_days:g} days")
+                    except sqlite3.Error as e:
+                        print(f"⚠ Could not purge expired VCF inputs: {e}")
+    return _STORE or None
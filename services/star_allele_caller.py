@@ -0,0 +1,209 @@
+import threading
+
+import numpy as np
+
+from services.pharmacogene_index import DATA_DIR, read_tsv
+
+
+ALLELE_DEFINITIONS_FILE = DATA_DIR / "allele_definitions.tsv"
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        """Set bits per row of a (rows, words) uint64 array."""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:  # numpy < 2.0
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        """Set bits per row of a (rows, words) uint64 array."""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _BYTE_POPCOUNT[as_bytes].sum(axis=-1)
+
+
+def _parse_genotype(genotype: str):
+    """
+    Split a GT value into (carries_alt_on_each_allele, phased).
+
+    Returns:
+    --------
+    tuple or None
+        ((bool, bool), phased) - None for missing or non-diploid calls
+    """
+    if not genotype:
+        return None
+    phased = "|" in genotype
+    alleles = genotype.replace("|", "/").split("/")
+    if len(alleles) != 2 or "." in alleles:
+        return None
+    return (alleles[0] != "0", alleles[1] != "0"), phased
+
+
+class StarAlleleCaller:
+    """
+    Diplotype caller for one gene, built from its allele-definition table.
+
+    Each star allele is a bitset over the gene's defining-variant positions.
+    All candidate diplotypes (every unordered allele pair) are precomputed as
+    AND/OR bitsets, so scoring an observed genotype is a handful of vectorized
+    bit operations plus a popcount over the whole candidate matrix.
+
+    The mismatch score is the number of alternate-allele copies a diplotype
+    gets wrong: at unphased positions it compares the expected dosage
+    (a & b = two copies, a | b = at least one copy) with the observed one; at
+    phased heterozygous positions each haplotype is compared directly, in the
+    better of the two orientations.
+    """
+
+    def __init__(self, gene: str, alleles: list):
+        """
+        Parameters:
+        -----------
+        gene : str
+            Gene symbol
+        alleles : list
+            [(allele_name, [defining rsIDs]), ...] in tie-break preference order;
+            an allele with no defining variants is the reference allele
+        """
+        self.gene = gene
+        self.positions = []
+        self.bit_of = {}
+        for _, rsids in alleles:
+            for rsid in rsids:
+                if rsid not in self.bit_of:
+                    self.bit_of[rsid] = len(self.positions)
+                    self.positions.append(rsid)
+
+        if not any(not rsids for _, rsids in alleles):
+            alleles = [("*1", [])] + list(alleles)
+        self.allele_names = [name for name, _ in alleles]
+
+        self.word_count = max(1, (len(self.positions) + 63) // 64)
+        self.allele_bits = np.zeros((len(alleles), self.word_count), dtype=np.uint64)
+        for row, (_, rsids) in enumerate(alleles):
+            self.allele_bits[row] = self._encode(rsids)
+
+        # Candidate diplotypes: all pairs i <= j
+        self.pair_a, self.pair_b = np.triu_indices(len(alleles))
+        a_bits = self.allele_bits[self.pair_a]
+        b_bits = self.allele_bits[self.pair_b]
+        self.pair_and = a_bits & b_bits
+        self.pair_or = a_bits | b_bits
+        is_reference = ~self.allele_bits.any(axis=1)
+        self.pair_non_reference = (~is_reference[self.pair_a]).astype(np.int64) + (~is_reference[self.pair_b])
+
+    def _encode(self, rsids) -> np.ndarray:
+        words = np.zeros(self.word_count, dtype=np.uint64)
+        for rsid in rsids:
+            bit = self.bit_of.get(rsid)
+            if bit is not None:
+                words[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return words
+
+    def call(self, variants: list):
+        """
+        Call the best-matching diplotype for a sample's variants in this gene.
+
+        Defining positions without a record are taken as homozygous reference,
+        as usual for variant-only VCFs.
+
+        Parameters:
+        -----------
+        variants : list
+            Variant dicts with "rsid" and "genotype" (e.g. {"rsid": "rs4244285", "genotype": "0/1"})
+
+        Returns:
+        --------
+        dict or None
+            {
+                "diplotype": "*1/*2",
+                "score": 0,              # mismatching alternate-allele copies
+                "tied": 1,               # diplotypes sharing the best score
+                "confidence": "high"     # high (exact, unique), medium (exact, ambiguous), low
+            }
+            None if no variant carries a usable genotype at a defining position
+        """
+        hom, carried, phased_het, hap1, hap2 = [], [], [], [], []
+        observed = 0
+        for variant in variants or []:
+            if not isinstance(variant, dict):
+                continue
+            rsid = variant.get("rsid")
+            parsed = _parse_genotype(variant.get("genotype"))
+            if rsid not in self.bit_of or parsed is None:
+                continue
+            observed += 1
+            (first, second), phased = parsed
+            if first and second:
+                hom.append(rsid)
+                carried.append(rsid)
+            elif first or second:
+                carried.append(rsid)
+                if phased:
+                    phased_het.append(rsid)
+                    (hap1 if first else hap2).append(rsid)
+
+        if not observed:
+            return None
+
+        hom_bits = self._encode(hom)
+        carried_bits = self._encode(carried)
+        phased_bits = self._encode(phased_het)
+        unphased_mask = ~phased_bits
+
+        scores = (_popcount((self.pair_and ^ hom_bits) & unphased_mask)
+                  + _popcount((self.pair_or ^ carried_bits) & unphased_mask))
+
+        if phased_het:
+            hap1_bits = self._encode(hap1)
+            hap2_bits = self._encode(hap2)
+            a_bits = self.allele_bits[self.pair_a] & phased_bits
+            b_bits = self.allele_bits[self.pair_b] & phased_bits
+            forward = _popcount(a_bits ^ hap1_bits) + _popcount(b_bits ^ hap2_bits)
+            reverse = _popcount(a_bits ^ hap2_bits) + _popcount(b_bits ^ hap1_bits)
+            scores = scores + np.minimum(forward, reverse)
+
+        # Best score, then fewest observed alt alleles left unexplained (absent
+        # records are weaker evidence than present ones), then fewest
+        # non-reference alleles, then table order
+        unexplained = _popcount(carried_bits & ~self.pair_or)
+        order = np.lexsort((np.arange(len(scores)), self.pair_non_reference, unexplained, scores))
+        best = order[0]
+        best_score = int(scores[best])
+        tied = int(np.count_nonzero(scores == best_score))
+
+        if best_score > 0:
+            confidence = "low"
+        elif tied > 1:
+            confidence = "medium"
+        else:
+            confidence = "high"
+
+        return {
+            "diplotype": f"{self.allele_names[self.pair_a[best]]}/{self.allele_names[self.pair_b[best]]}",
+            "score": best_score,
+            "tied": tied,
+            "confidence": confidence
+        }
+
+
+_CALLERS = None
+_CALLERS_LOCK = threading.Lock()
+
+
+def load_star_allele_callers(path=ALLELE_DEFINITIONS_FILE) -> dict:
+    """Build one StarAlleleCaller per gene from an allele-definition table."""
+    by_gene = {}
+    for row in read_tsv(path):
+        rsids = [r.strip() for r in (row.get("defining_variants") or "").split(",") if r.strip()]
+        by_gene.setdefault(row["gene"].strip().upper(), []).append((row["allele"].strip(), rsids))
+    return {gene: StarAlleleCaller(gene, alleles) for gene, alleles in by_gene.items()}
+
+
+def get_star_allele_caller(gene: str):
+    """Return the caller for a gene (None if it has no allele definitions)."""
+    global _CALLERS
+    if _CALLERS is None:
+        with _CALLERS_LOCK:
+            if _CALLERS is None:
+                _CALLERS = load_star_allele_callers()
+    return _CALLERS.get(str(gene).strip().upper())
@@ -0,0 +1,143 @@
+import os
+import re
+
+
+# Record-level QC applied while parsing VCFs, e.g. "FILTER=PASS; QUAL>=30; DP>=10; GQ>=20; GT!=0/0"
+VCF_QC_FILTERS = os.getenv("VCF_QC_FILTERS", "GT!=0/0")
+
+_CLAUSE = re.compile(r"^(FILTER|QUAL|DP|GQ|GT)\s*(==|!=|>=|<=|=|>|<)\s*(\S+)$", re.IGNORECASE)
+_COMPARISONS = {
+    ">=": lambda value, limit: value >= limit,
+    ">": lambda value, limit: value > limit,
+    "<=": lambda value, limit: value <= limit,
+    "<": lambda value, limit: value < limit,
+}
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _unphased(genotype: str) -> str:
+    return genotype.replace("|", "/")
+
+
+class QCFilter:
+    """
+    Record-level QC filter compiled from an expression such as
+    "FILTER=PASS; QUAL>=30; DP>=10; GQ>=20; GT!=0/0".
+
+    Clauses are separated by ";" and all must hold:
+    - FILTER=PASS[,...] / FILTER!=LowQual[,...]   FILTER column ("." - not filtered - passes)
+    - QUAL>=n, DP>=n, GQ>=n (also >, <=, <)       DP from the sample, else from INFO
+    - GT=0/1,1/1 / GT!=0/0                         allowed / rejected genotypes, phase-insensitive
+
+    A record missing a value (".", no FORMAT key) is not rejected by that
+    clause. The expression is parsed once; check() then works on the split
+    columns of a record, locating GT/DP/GQ through a per-FORMAT-string index
+    cache instead of building a dict per record.
+    """
+
+    def __init__(self, expression: str = None):
+        self.expression = VCF_QC_FILTERS if expression is None else expression
+        self.clauses = []  # (label, column, test)
+        for clause in (c.strip() for c in self.expression.split(";")):
+            if clause:
+                self.clauses.append(self._compile_clause(clause))
+        self._columns = {column for _, column, _ in self.clauses}
+        # FORMAT string -> (GT, DP, GQ) sample indexes (-1 if absent or not read)
+        self._layouts = {}
+
+    def _compile_clause(self, clause: str) -> tuple:
+        match = _CLAUSE.match(re.sub(r"\s+", "", clause))
+        if not match:
+            raise ValueError(f"Invalid VCF QC clause '{clause}' (expected e.g. FILTER=PASS, DP>=10, GT!=0/0)")
+        column, operator, argument = match.group(1).upper(), match.group(2), match.group(3)
+        operator = "=" if operator == "==" else operator
+        label = f"{column}{operator}{argument}"
+
+        if column in ("FILTER", "GT"):
+            if operator not in ("=", "!="):
+                raise ValueError(f"Invalid VCF QC clause '{clause}': {column} supports = and != only")
+            values = frozenset(_unphased(v) if column == "GT" else v for v in argument.split(",") if v)
+            if column == "FILTER":
+                if operator == "=":
+                    return label, column, lambda value: value in values
+                return label, column, lambda value: not set(value.split(";")) & values
+            if operator == "=":
+                return label, column, lambda value: _unphased(value) in values
+            return label, column, lambda value: _unphased(value) not in values
+
+        if operator not in _COMPARISONS:
+            raise ValueError(f"Invalid VCF QC clause '{clause}': {column} supports >=, >, <= and < only")
+        limit = _number(argument)
+        if limit is None:
+            raise ValueError(f"Invalid VCF QC clause '{clause}': '{argument}' is not a number")
+        compare = _COMPARISONS[operator]
+
+        def test(value):
+            number = _number(value)
+            return number is None or compare(number, limit)
+        return label, column, test
+
+    def _layout(self, format_field: str) -> tuple:
+        keys = format_field.split(":")
+        return tuple(
+            keys.index(key) if key in keys and (key == "GT" or key in self._columns) else -1
+            for key in ("GT", "DP", "GQ")
+        )
+
+    def check(self, fields: list, info: dict = None) -> tuple:
+        """
+        Evaluate the clauses on one record.
+
+        Parameters:
+        -----------
+        fields : list
+            The tab-split columns of a VCF data line
+        info : dict
+            Parsed INFO column (only read for DP when the sample has none)
+
+        Returns:
+        --------
+        tuple
+            (label of the first failing clause or None, GT of the first sample or None)
+        """
+        genotype = depth = quality = None
+        if len(fields) > 9 and fields[8] and fields[9]:
+            layout = self._layouts.get(fields[8])
+            if layout is None:
+                layout = self._layouts[fields[8]] = self._layout(fields[8])
+            values = fields[9].split(":")
+            count = len(values)
+            gt_index, dp_index, gq_index = layout
+            if 0 <= gt_index < count:
+                genotype = values[gt_index]
+            if 0 <= dp_index < count:
+                depth = values[dp_index]
+            if 0 <= gq_index < count:
+                quality = values[gq_index]
+
+        for label, column, test in self.clauses:
+            if column == "GT":
+                value = genotype
+            elif column == "FILTER":
+                value = fields[6]
+            elif column == "QUAL":
+                value = fields[5]
+            elif column == "DP":
+                value = depth if depth not in (None, ".") else (info.get("DP") if info else None)
+            else:
+                value = quality
+            if value is None or value == "." or value is True:
+                continue
+            if not test(value):
+                return label, genotype
+        return None, genotype
+
+
+# Compiled once per process; an invalid VCF_QC_FILTERS fails at startup
+QC_FILTER = QCFilter()
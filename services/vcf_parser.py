@@ -1,11 +1,47 @@
-def parse_vcf(file) -> dict:
+import re
+
+from services.liftover import CANONICAL_BUILD, detect_genome_build, get_chain_index
+from services.pharmacogene_index import get_pharmacogene_index
+from services.variant_qc import QC_FILTER
+
+
+# GENE tag in a raw INFO column, checked before the record is decoded
+_GENE_TAG = re.compile(rb"(?:^|;)GENE=([^;]*)")
+
+
+def parse_vcf(file, genome_build: str = None, genes=None, qc=None) -> dict:
     """
     Parse a VCF v4.2 file and extract pharmacogenomic variants.
+
+    Records carrying GENE/RS/STAR INFO tags are used as-is; raw records without
+    them are annotated in the same pass from the bundled pharmacogene tables
+    (CHROM:POS/REF/ALT first, then the rsID in the ID column, then gene region);
+    their star alleles are called later from the recorded genotypes.
+
+    The reference build is taken from the ##reference / ##contig assembly
+    header (GRCh38 if absent); GRCh37 positions are lifted to GRCh38 before
+    position lookup using the bundled pharmacogene chain table.
+
+    With `genes`, only those genes are collected: records of other genes are
+    rejected on their raw bytes (GENE tag, or CHROM/POS/ID against the panel
+    regions and rsIDs) before they are decoded or their INFO and sample
+    columns parsed.
+
+    Calls failing the record-level QC filters (VCF_QC_FILTERS, see
+    services.variant_qc) are dropped before annotation and counted per gene
+    and failing clause.
     
     Parameters:
     -----------
     file : file-like object
         The VCF file uploaded via Flask (e.g., file from request.files)
+    genome_build : str
+        "GRCh37" or "GRCh38" to override header detection (optional)
+    genes : iterable
+        Genes to collect, e.g. from analysis_pipeline.required_genes()
+        (optional, default: all supported genes)
+    qc : QCFilter
+        Record-level QC filter (optional, default: compiled VCF_QC_FILTERS)
         
     Returns:
     --------
@@ -13,13 +49,19 @@ def parse_vcf(file) -> dict:
         Structure:
         {
             "vcf_parsing_success": True/False,
+            "genome_build": "GRCh38",
             "variants": {
-                "CYP2D6": [{"rsid": "rs...", "star": "*4"}, ...],
+                "CYP2D6": [{"rsid": "rs...", "star": "*4", "genotype": "0/1"}, ...],
                 "CYP2C19": [...],
                 ...
             },
+            "gene_panel": ["CYP2C19"] (only when `genes` is given),
+            "qc": {"filters": "GT!=0/0", "rejected": {"CYP2C19": {"GT!=0/0": 12}}},
             "error": "..." (if parsing failed)
         }
+
+        With `genes`, "variants" only has those genes. A VCF whose variants
+        are all outside the panel still parses successfully.
     """
     
     # Supported pharmacogenomic genes
@@ -32,11 +74,20 @@ def parse_vcf(file) -> dict:
         "DPYD"
     }
     
+    panel_genes = SUPPORTED_GENES if genes is None else SUPPORTED_GENES & {str(g).upper() for g in genes}
+
     # Result structure
     result = {
         "vcf_parsing_success": False,
         "variants": {}
     }
+    if genes is not None:
+        result["gene_panel"] = sorted(panel_genes)
+    if qc is None:
+        qc = QC_FILTER
+    # gene -> failing clause label -> records rejected (panel genes only)
+    qc_rejected = {}
+    result["qc"] = {"filters": qc.expression, "rejected": qc_rejected}
     
     try:
         # Read entire file content to check if empty
@@ -53,8 +104,17 @@ def parse_vcf(file) -> dict:
             from io import BytesIO
             file = BytesIO(content)
         
+        # Annotation index for raw (untagged) records - built once per process
+        annotation_index = get_pharmacogene_index()
+        panel_filter = annotation_index.panel(panel_genes)
+        restricted = panel_genes != SUPPORTED_GENES
+        binary = isinstance(content, bytes)
+        supported_filter = annotation_index.panel(SUPPORTED_GENES) if restricted else None
+        detected_build = None
+        chain_index = None
+
         # Initialize gene dictionaries
-        for gene in SUPPORTED_GENES:
+        for gene in panel_genes:
             result["variants"][gene] = []
         
         # Track file validation
@@ -62,11 +122,40 @@ def parse_vcf(file) -> dict:
         has_column_header = False
         has_data_lines = False
         total_variants_found = 0
+        # A variant of a supported gene outside the panel was seen (the VCF is still a
+        # pharmacogenomic one); until then such records take the full path to find out
+        other_genes_found = False
+        # Supported-gene calls rejected by QC, panel or not (see the no-variant error below)
+        qc_rejected_calls = 0
         line_count = 0
         
         # Read file line by line
         for line in file:
             line_count += 1
+
+            # Records outside the gene panel are dropped on their raw bytes (tagged records
+            # of any supported gene pass when the panel is unrestricted, so skip the check)
+            if binary and (restricted or b"GENE=" not in line) and not line.startswith(b"#"):
+                head = line.split(b"\t", 3)
+                if len(head) == 4:
+                    has_data_lines = True
+                    if b"GENE=" in head[3]:
+                        # Tagged record: its GENE tag decides
+                        columns = head[3].split(b"\t", 5)
+                        tag = _GENE_TAG.search(columns[4]) if len(columns) > 4 else None
+                        tagged_gene = tag.group(1).strip().decode("utf-8", "replace").upper() if tag else ""
+                        if tagged_gene and tagged_gene not in panel_genes and (
+                                other_genes_found or tagged_gene not in SUPPORTED_GENES):
+                            continue
+                    else:
+                        chrom = head[0].decode("utf-8", "replace")
+                        vcf_id = head[2].decode("utf-8", "replace")
+                        pos = int(head[1]) if head[1].isdigit() else None
+                        if pos is not None and chain_index is not None:
+                            pos = chain_index.lift(chrom, pos)
+                        if not panel_filter.accepts(chrom, pos, vcf_id) and (
+                                other_genes_found or not restricted or not supported_filter.accepts(chrom, pos, vcf_id)):
+                            continue
             
             # Handle both bytes and string
             if isinstance(line, bytes):
@@ -83,9 +172,16 @@ def parse_vcf(file) -> dict:
                 has_vcf_header = True
                 continue
             
+            # Reference build (first declaration wins)
+            if detected_build is None and line.startswith(("##reference=", "##contig=")):
+                detected_build = detect_genome_build(line)
+                continue
+
             # Check for column header line
             if line.startswith("#CHROM"):
                 has_column_header = True
+                result["genome_build"] = genome_build or detected_build or CANONICAL_BUILD
+                chain_index = get_chain_index(result["genome_build"])
                 continue
             
             # Skip other metadata lines
@@ -104,8 +200,6 @@ def parse_vcf(file) -> dict:
                     continue
                 
                 info_field = fields[7]
-                format_field = fields[8] if len(fields) > 8 else ""
-                sample_field = fields[9] if len(fields) > 9 else ""
                 
                 # Parse INFO field (KEY=VALUE;KEY=VALUE;...)
                 info_dict = {}
@@ -120,15 +214,35 @@ def parse_vcf(file) -> dict:
                 gene = info_dict.get("GENE", "").upper()
                 rsid = info_dict.get("RS", "")
                 star = info_dict.get("STAR", "")
+                if gene and gene not in SUPPORTED_GENES:
+                    continue
 
-                # Skip reference-only genotypes when possible
-                if format_field and sample_field:
-                    format_keys = format_field.split(':')
-                    sample_values = sample_field.split(':')
-                    format_map = dict(zip(format_keys, sample_values))
-                    genotype = format_map.get("GT")
-                    if genotype and genotype in {"0/0", "0|0"}:
-                        continue
+                # Record-level QC (the default GT!=0/0 drops reference-only calls)
+                pos = None
+                if not gene:
+                    pos = fields[1]
+                    if chain_index is not None:
+                        pos = chain_index.lift(fields[0], int(pos)) if pos.isdigit() else None
+                rejected_by, genotype = qc.check(fields, info_dict)
+                if rejected_by:
+                    if not gene:
+                        annotation = annotation_index.annotate(fields[0], pos, fields[2], fields[3], fields[4])
+                        gene = annotation["gene"] if annotation else ""
+                    if gene in SUPPORTED_GENES:
+                        qc_rejected_calls += 1
+                    if gene in panel_genes:
+                        counts = qc_rejected.setdefault(gene, {})
+                        counts[rejected_by] = counts.get(rejected_by, 0) + 1
+                    continue
+
+                # Raw VCFs have no GENE tag - annotate by position / ID
+                if not gene:
+                    annotation = annotation_index.annotate(
+                        fields[0], pos, fields[2], fields[3], fields[4], genotype
+                    )
+                    if annotation:
+                        gene = annotation["gene"]
+                        rsid = rsid or annotation.get("rsid", "")
                 
                 # Only process if gene is supported
                 if gene not in SUPPORTED_GENES:
@@ -142,9 +256,16 @@ def parse_vcf(file) -> dict:
                 
                 if star:
                     variant["star"] = star
+
+                # Genotype drives star-allele calling for untagged records
+                if genotype and variant:
+                    variant["genotype"] = genotype
                 
-                # Only add if we have at least rsid or star
+                # Only add if we have at least rsid or star (and only for the panel)
                 if variant:
+                    if gene not in panel_genes:
+                        other_genes_found = True
+                        continue
                     result["variants"][gene].append(variant)
                     total_variants_found += 1
             
@@ -169,8 +290,10 @@ def parse_vcf(file) -> dict:
             result["error"] = "VCF file has no data lines - only headers present"
             return result
         
-        if total_variants_found == 0:
+        if total_variants_found == 0 and not other_genes_found:
             result["error"] = "No pharmacogenomic variants found in VCF file for supported genes (CYP2D6, CYP2C19, CYP2C9, SLCO1B1, TPMT, DPYD)"
+            if qc_rejected_calls:
+                result["error"] += f" - {qc_rejected_calls} call(s) rejected by VCF QC filters ({qc.expression})"
             return result
         
         result["vcf_parsing_success"] = True
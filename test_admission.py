@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Admission control: per-client token buckets, the cost-weighted queue and 429/503 shedding."""
+
+import contextlib
+import io
+import threading
+import time
+import types
+from contextlib import ExitStack
+
+import pytest
+
+from services import admission
+from services.admission import AdmissionController, AdmissionRejected
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    # Token buckets, queue deadlines and service-time averages all read admission.time.monotonic
+    monkeypatch.setattr(admission, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+def _controller(**overrides) -> AdmissionController:
+    settings = dict(capacity=4, max_queue=1, max_wait=5, client_rate=1, client_burst=3, llm_weight=2)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def _run(controller, client_id: str = "10.0.0.1", cost: float = 1):
+    with controller.admit(client_id, cost):
+        pass
+
+
+def test_client_quota_admits_burst_then_sheds_with_429(clock):
+    controller = _controller(capacity=100)
+    for _ in range(3):
+        _run(controller)
+    with pytest.raises(AdmissionRejected) as rejected:
+        _run(controller)
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after == 1
+
+    clock.advance(1.0)
+    _run(controller)
+    with pytest.raises(AdmissionRejected):
+        _run(controller)
+
+
+def test_client_quotas_are_independent(clock):
+    controller = _controller(capacity=100)
+    for _ in range(3):
+        _run(controller, "10.0.0.1")
+    with pytest.raises(AdmissionRejected):
+        _run(controller, "10.0.0.1")
+    _run(controller, "10.0.0.2")
+
+
+def test_retry_after_reflects_refill_time(clock):
+    controller = _controller(capacity=100, client_rate=0.5, client_burst=2)
+    _run(controller, cost=2)
+    with pytest.raises(AdmissionRejected) as rejected:
+        _run(controller, cost=2)
+    assert rejected.value.retry_after == 4
+
+
+def test_estimate_cost_is_weighted_and_capped():
+    controller = _controller(capacity=40)
+    assert controller.estimate_cost(0, 3, False) == 3
+    assert controller.estimate_cost(1024 * 1024, 3, True) == 12
+    assert controller.estimate_cost(50 * 1024 * 1024, 10, True) == controller.max_request_cost == 20
+
+
+def test_requests_are_admitted_queued_then_shed(clock):
+    controller = _controller(client_burst=100)
+    admitted = threading.Event()
+    with ExitStack() as running:
+        # Two requests of cost 2 fill the capacity of 4
+        running.enter_context(controller.admit("10.0.0.1", 2))
+        running.enter_context(controller.admit("10.0.0.2", 2))
+        assert controller.stats()["in_use"] == 4
+
+        def queued():
+            with controller.admit("10.0.0.3", 2):
+                admitted.set()
+
+        waiter = threading.Thread(target=queued)
+        waiter.start()
+        for _ in range(200):
+            if controller.stats()["waiting"] == 1:
+                break
+            time.sleep(0.005)
+        assert controller.stats()["waiting"] == 1
+        assert not admitted.is_set()
+
+        # The queue (max_queue=1) is full: the next request is shed at once
+        with pytest.raises(AdmissionRejected) as rejected:
+            _run(controller, "10.0.0.4", 2)
+        assert rejected.value.status == 503
+        assert "queue full" in rejected.value.reason
+
+    # Capacity freed: the queued request runs
+    waiter.join(timeout=5)
+    assert admitted.is_set()
+    assert controller.stats()["in_use"] == 0
+    assert controller.stats()["waiting"] == 0
+
+
+def test_queued_request_times_out_with_503(clock):
+    controller = _controller(client_burst=100, max_wait=0)
+    with controller.admit("10.0.0.1", 2), controller.admit("10.0.0.2", 2):
+        with pytest.raises(AdmissionRejected) as rejected:
+            _run(controller, "10.0.0.3", 2)
+    assert rejected.value.status == 503
+    assert "timed out" in rejected.value.reason
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()["waiting"] == 0
+
+
+def test_rejected_quota_does_not_hold_capacity(clock):
+    controller = _controller(client_burst=1)
+    _run(controller)
+    with pytest.raises(AdmissionRejected):
+        _run(controller)
+    assert controller.stats()["in_use"] == 0
+
+
+def test_quota_keys_on_client_address_only(clock, monkeypatch):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+
+    with app_module.app.test_request_context(
+        "/api/genotypes", environ_base={"REMOTE_ADDR": "198.51.100.7"},
+        headers={"X-Client-Id": "rotated-1", "X-Forwarded-For": "203.0.113.9"}
+    ):
+        assert app_module.client_identifier() == "198.51.100.7"
+
+    monkeypatch.setattr(app_module, "ADMISSION", _controller(capacity=100, client_burst=1))
+    client = app_module.app.test_client()
+    payload = {"genotypes": {"CYP2D6": "*1/*4"}, "drugs": ["CODEINE"]}
+
+    def post(address: str, client_id: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return client.post("/api/genotypes", json=payload, environ_base={"REMOTE_ADDR": address},
+                               headers={"X-Client-Id": client_id, "X-Forwarded-For": client_id})
+
+    assert post("198.51.100.7", "a").status_code == 200
+    # A new X-Client-Id / X-Forwarded-For from the same address does not reset the quota
+    shed = post("198.51.100.7", "b")
+    assert shed.status_code == 429
+    assert shed.headers["Retry-After"] == "1"
+    assert post("198.51.100.8", "b").status_code == 200
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Streamed LLM enrichment in analysis_pipeline.stream_analysis_events()."""
+
+import json
+import os
+
+from services.analysis_pipeline import stream_analysis_events
+from services.vcf_parser import parse_vcf
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CPIC_ENGINE = {"CODEINE": {"gene": "CYP2D6", "cpic_level": "A"}}
+
+ANSWER = {
+    "clinical_recommendation": {
+        "dosage_adjustment": "Avoid codeine",
+        "monitoring": "Pain control",
+        "alternative_drugs": ["Morphine"],
+        "urgency": "urgent"
+    },
+    "llm_generated_explanation": {
+        "summary": "Codeine will not work for you",
+        "mechanism": "CYP2D6 does not activate it",
+        "interaction_notes": [],
+        "evidence_basis": "CPIC level A"
+    }
+}
+
+
+class StreamingProvider:
+    """Streams fixed chunks; the normal call returns `answer` (or raises if it is an exception)."""
+
+    def __init__(self, chunks: list, answer=None):
+        self.chunks = chunks
+        self.answer = answer
+        self.normal_calls = 0
+
+    def stream_text(self, prompt: str, deadline=None):
+        yield from self.chunks
+
+    def generate_clinical_recommendation(self, prompt: str, deadline=None) -> dict:
+        self.normal_calls += 1
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+
+def _result(provider) -> dict:
+    with open(os.path.join(ROOT_DIR, "data", "sample_poor_metabolizer.vcf"), "rb") as handle:
+        vcf_data = parse_vcf(handle)
+    events = list(stream_analysis_events(vcf_data, ["CODEINE"], CPIC_ENGINE, provider))
+    results = [data for event, data in events if event == "result"]
+    assert len(results) == 1
+    return results[0]
+
+
+def test_streamed_json_answer_is_used():
+    text = json.dumps(ANSWER)
+    provider = StreamingProvider([text[:40], text[40:]])
+    result = _result(provider)
+    assert provider.normal_calls == 0
+    assert result["clinical_recommendation"] == ANSWER["clinical_recommendation"]
+    assert result["quality_metrics"]["recommendation_source"] == "llm"
+
+
+def test_unparseable_stream_falls_back_to_normal_call():
+    provider = StreamingProvider(["Sorry, ", "I cannot answer in JSON."], answer=ANSWER)
+    result = _result(provider)
+    assert provider.normal_calls == 1
+    assert result["clinical_recommendation"] == ANSWER["clinical_recommendation"]
+    assert result["quality_metrics"]["recommendation_source"] == "llm"
+
+
+def test_unparseable_stream_is_never_labelled_llm_when_the_retry_fails():
+    provider = StreamingProvider(["not json"], answer=RuntimeError("API down"))
+    result = _result(provider)
+    assert provider.normal_calls == 1
+    assert "recommendation_source" not in result["quality_metrics"]
+    assert not result["quality_metrics"].get("degraded")
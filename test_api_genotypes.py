@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""/api/genotypes: single-patient and batch request shapes, and per-entry errors."""
+
+import contextlib
+import io
+
+import pytest
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _post(client, payload):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.post("/api/genotypes", json=payload)
+
+
+def test_single_patient(client):
+    response = _post(client, {"patient_id": "P1", "genotypes": {"CYP2D6": "*1/*4"}, "drugs": ["CODEINE"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["patient_id"] == "P1"
+    assert body["total_analyses"] == 1
+    analysis = body["analyses"][0]
+    assert analysis["patient_id"] == "P1"
+    assert analysis["drug"] == "CODEINE"
+    assert analysis["pharmacogenomic_profile"]["diplotype"] == "*1/*4"
+    assert analysis["pharmacogenomic_profile"]["phenotype"] == "IM"
+
+
+def test_single_patient_compact_format(client):
+    response = _post(client, {"patient_id": "P1", "genotypes": {"CYP2C19": ["*2", "*2"]},
+                              "drugs": "CLOPIDOGREL", "format": "compact"})
+    assert response.status_code == 200
+    assert response.get_json()["patient_id"] == "P1"
+
+
+def test_single_invalid_patient_is_rejected(client):
+    response = _post(client, {"patient_id": "P1", "genotypes": {"CYP2D6": "*1"}, "drugs": ["CODEINE"]})
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body["patient_id"] == "P1"
+    assert body["error"] == "Invalid genotype payload"
+    assert "two alleles" in body["details"]
+
+
+def test_unknown_gene(client):
+    response = _post(client, {"patient_id": "P1", "genotypes": {"NOTAGENE": "*1/*2"}, "drugs": ["CODEINE"]})
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body["error"] == "Invalid genotype payload"
+    assert "Unsupported gene 'NOTAGENE'" in body["details"]
+
+
+def test_batch_with_one_invalid_entry(client):
+    response = _post(client, {
+        "drugs": "CODEINE,CLOPIDOGREL",
+        "patients": [
+            {"patient_id": "P1", "genotypes": {"CYP2D6": "*4/*4", "CYP2C19": "*1/*17"}},
+            {"patient_id": "P2", "genotypes": {"CYP2D6": "*1/*4/*10"}},
+            {"patient_id": "P3", "genotypes": {"CYP2C19": "*2/*2"}, "drugs": ["CLOPIDOGREL"]},
+        ]
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["total_patients"] == 3
+    assert body["failed"] == 1
+
+    first, second, third = body["results"]
+    assert first["patient_id"] == "P1"
+    assert [a["drug"] for a in first["analyses"]] == ["CODEINE", "CLOPIDOGREL"]
+    assert first["analyses"][0]["pharmacogenomic_profile"]["phenotype"] == "PM"
+
+    assert set(second) == {"patient_id", "error", "details"}
+    assert second["patient_id"] == "P2"
+    assert second["error"] == "Invalid genotype payload"
+
+    # Per-patient drugs override the shared list
+    assert [a["drug"] for a in third["analyses"]] == ["CLOPIDOGREL"]
+    assert third["analyses"][0]["pharmacogenomic_profile"]["phenotype"] == "PM"
+
+
+def test_batch_entry_that_is_not_an_object(client):
+    response = _post(client, {"drugs": "CODEINE", "patients": ["P1"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["failed"] == 1
+    assert body["results"][0]["error"] == "Invalid genotype payload"
+    assert body["results"][0]["patient_id"].startswith("PATIENT_")
+
+
+@pytest.mark.parametrize("payload", [["not", "an", "object"], {"patients": []}, {"patients": "P1"}])
+def test_malformed_bodies(client, payload):
+    assert _post(client, payload).status_code == 400
+
+
+def test_batch_too_large(client, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_GENOTYPE_BATCH", 2)
+    patients = [{"patient_id": f"P{i}", "genotypes": {"CYP2D6": "*1/*1"}} for i in range(3)]
+    assert _post(client, {"drugs": "CODEINE", "patients": patients}).status_code == 413
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Vectorized cohort phenotyping must agree with per-patient determine_phenotype()."""
+
+import numpy as np
+import pytest
+
+from services.cohort_phenotyping import (
+    CONFIDENCE_LABELS, PHENOTYPE_LABELS, CohortPhenotyper, get_cohort_phenotyper, phenotype_cohort
+)
+from services.phenotype_engine import PHENOTYPE_MAP, determine_phenotype
+
+
+def _expected(gene: str, first: str, second: str) -> tuple:
+    result = determine_phenotype(gene, [{"star": first}, {"star": second}])
+    return result["phenotype"], result["confidence"], result["diplotype"]
+
+
+def _cohort(gene: str, pairs: list) -> list:
+    phenotyper = get_cohort_phenotyper(gene)
+    first = phenotyper.encode([a for a, _ in pairs])
+    second = phenotyper.encode([b for _, b in pairs])
+    result = phenotype_cohort(gene, first, second)
+    return [
+        (PHENOTYPE_LABELS[p], CONFIDENCE_LABELS[c], d)
+        for p, c, d in zip(result["phenotype_code"], result["confidence_code"], result["diplotype"])
+    ]
+
+
+@pytest.mark.parametrize("gene", sorted(PHENOTYPE_MAP))
+def test_every_mapped_diplotype_matches_determine_phenotype(gene):
+    pairs = []
+    for diplotype in PHENOTYPE_MAP[gene]:
+        first, second = diplotype.split("/", 1)
+        pairs.extend([(first, second), (second, first)])
+    assert _cohort(gene, pairs) == [_expected(gene, a, b) for a, b in pairs]
+
+
+@pytest.mark.parametrize("gene", sorted(PHENOTYPE_MAP))
+def test_every_vocabulary_pair_matches_determine_phenotype(gene):
+    alleles = get_cohort_phenotyper(gene).alleles
+    pairs = [(a, b) for a in alleles for b in alleles]
+    assert _cohort(gene, pairs) == [_expected(gene, a, b) for a, b in pairs]
+
+
+def test_mapped_phenotypes_are_reported():
+    phenotypes = {code for code, _, _ in _cohort("DPYD", [("*2", "c.2846A>T"), ("*1", "*1")])}
+    assert phenotypes == {"PM", "NM"}
+
+
+def test_unknown_and_unparseable_codes():
+    phenotyper = get_cohort_phenotyper("CYP2C19")
+    size = len(phenotyper.alleles)
+    assert phenotyper.encode(["*99", "not an allele", ""]).tolist() == [-1, -1, -1]
+
+    result = phenotyper.phenotype([-1, size, 0, -5], [0, 0, size + 3, -1])
+    assert result["phenotype_code"].tolist() == [0, 0, 0, 0]
+    assert result["confidence_code"].tolist() == [0, 0, 0, 0]
+    assert result["diplotype_code"].tolist() == [-1, -1, -1, -1]
+    assert result["diplotype"].tolist() == [None, None, None, None]
+
+
+def test_unknown_codes_do_not_affect_valid_patients():
+    phenotyper = get_cohort_phenotyper("CYP2C19")
+    codes = phenotyper.encode(["*2", "*99", "*17"])
+    result = phenotyper.phenotype(codes, phenotyper.encode(["*2", "*1", "*1"]))
+    assert [PHENOTYPE_LABELS[c] for c in result["phenotype_code"]] == ["PM", "Unknown", "RM"]
+    assert result["diplotype"].tolist() == ["*2/*2", None, "*1/*17"]
+
+
+def test_gene_without_alleles_is_unknown():
+    result = CohortPhenotyper("NUDT15").phenotype([0, -1], [0, 1])
+    assert result["phenotype_code"].tolist() == [0, 0]
+    assert result["diplotype"].tolist() == [None, None]
+
+
+def test_mismatched_shapes_raise():
+    with pytest.raises(ValueError):
+        phenotype_cohort("CYP2D6", np.array([0, 1]), np.array([0]))
+
+
+def test_phenotyper_follows_phenotype_map_edits(monkeypatch):
+    monkeypatch.setitem(PHENOTYPE_MAP, "DPYD", dict(PHENOTYPE_MAP["DPYD"], **{"*2/c.2846A>T": "IM"}))
+    phenotyper = CohortPhenotyper("DPYD")
+    codes = phenotyper.encode(["*2"]), phenotyper.encode(["c.2846A>T"])
+    assert PHENOTYPE_LABELS[phenotyper.phenotype(*codes)["phenotype_code"][0]] == "IM"
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Knowledge-base snapshot diffs and the stored results they mark as affected."""
+
+from services.knowledge_base import build_snapshot, diff_snapshots
+from services.result_store import ResultStore
+
+
+CPIC_ENGINE = {
+    "CODEINE": {"gene": "CYP2D6", "cpic_level": "A"},
+    "CLOPIDOGREL": {"gene": "CYP2C19", "cpic_level": "A"},
+}
+
+
+def _analysis(drug: str, gene: str, source: str) -> dict:
+    return {"drug": drug, "gene": gene, "genes": [gene], "phenotype": "PM", "diplotype": "*2/*2",
+            "variants": [], "cpic_level": "A", "recommendation_source": source, "llm_explanation": None}
+
+
+def test_unchanged_snapshot_has_no_entries():
+    snapshot = build_snapshot("v1", CPIC_ENGINE)
+    assert diff_snapshots(snapshot, snapshot)["entries"] == set()
+
+
+def test_prompt_template_change_affects_llm_results_only(tmp_path):
+    old = build_snapshot("v1", CPIC_ENGINE)
+    new = dict(old, prompt_template=str(int(old["prompt_template"]) + 1))
+    diff = diff_snapshots(old, new)
+    assert diff["prompt_template"] == {"old": old["prompt_template"], "new": new["prompt_template"]}
+    assert diff["entries"] == {"llm"}
+
+    store = ResultStore(str(tmp_path / "results.sqlite3"), keep_vcf=False)
+    analyses = [_analysis("CODEINE", "CYP2D6", "cpic_table:2026.10"), _analysis("CLOPIDOGREL", "CYP2C19", "llm")]
+    store.put_results("h1", "v1", analyses, [{"patient_id": "P1"}, {"patient_id": "P1"}])
+    assert store.affected_results("v1", diff["entries"]) == {("h1", "CLOPIDOGREL")}
+
+
+def test_snapshots_without_prompt_template_match_version_1():
+    snapshot = build_snapshot("v1", CPIC_ENGINE)
+    legacy = {key: value for key, value in snapshot.items() if key != "prompt_template"}
+    assert diff_snapshots(legacy, dict(snapshot, prompt_template="1"))["prompt_template"] is None
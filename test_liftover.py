@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""GRCh37 input: build detection and liftover to the GRCh38 pharmacogene tables."""
+
+import os
+from io import BytesIO
+
+import pytest
+
+from services.liftover import detect_genome_build, get_chain_index
+from services.phenotype_engine import determine_phenotype
+from services.vcf_parser import parse_vcf
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def _read(name: str) -> bytes:
+    with open(os.path.join(DATA_DIR, name), "rb") as handle:
+        return handle.read()
+
+
+def _diplotypes(vcf_data: dict) -> dict:
+    return {gene: determine_phenotype(gene, variants)["diplotype"]
+            for gene, variants in vcf_data["variants"].items()}
+
+
+@pytest.mark.parametrize("line, build", [
+    ("##reference=GRCh37", "GRCh37"),
+    ("##reference=file:///references/human_g1k_v37.fasta", "GRCh37"),
+    ("##reference=hg19", "GRCh37"),
+    ("##reference=GRCh38", "GRCh38"),
+    ("##reference=file:///ref/Homo_sapiens_assembly38.fasta.hs38", "GRCh38"),
+    ("##contig=<ID=1,length=249250621,assembly=b37>", "GRCh37"),
+    ("##contig=<ID=chr1,length=248956422,assembly=hg38>", "GRCh38"),
+    ("##contig=<ID=chr1,length=248956422>", None),
+    ("##reference=unknown.fasta", None),
+])
+def test_detect_genome_build(line, build):
+    assert detect_genome_build(line) == build
+
+
+def test_grch37_lifts_to_grch38_annotations_and_diplotypes():
+    grch38 = parse_vcf(BytesIO(_read("sample_raw_grch38.vcf")))
+    grch37 = parse_vcf(BytesIO(_read("sample_raw_grch37.vcf")))
+
+    assert grch38["genome_build"] == "GRCh38"
+    assert grch37["genome_build"] == "GRCh37"
+    assert grch37["variants"] == grch38["variants"]
+    assert _diplotypes(grch37) == _diplotypes(grch38) == {
+        "CYP2D6": "*1/*4",
+        "CYP2C19": "*2/*2",
+        "CYP2C9": "*1/*3",
+        "SLCO1B1": "*1/*5",
+        "TPMT": "*3B/*3C",
+        "DPYD": "*1/c.2846A>T",
+    }
+
+
+def test_grch37_liftover_with_gene_panel():
+    genes = ["CYP2C19", "TPMT"]
+    grch38 = parse_vcf(BytesIO(_read("sample_raw_grch38.vcf")), genes=genes)
+    grch37 = parse_vcf(BytesIO(_read("sample_raw_grch37.vcf")), genes=genes)
+    assert set(grch37["variants"]) == set(genes)
+    assert grch37["variants"] == grch38["variants"]
+
+
+def test_contig_assembly_header_selects_grch37():
+    content = _read("sample_raw_grch37.vcf").replace(
+        b"##reference=file:///references/human_g1k_v37.fasta",
+        b"##contig=<ID=22,length=51304566,assembly=GRCh37>"
+    )
+    result = parse_vcf(BytesIO(content))
+    assert result["genome_build"] == "GRCh37"
+    assert _diplotypes(result)["CYP2D6"] == "*1/*4"
+
+
+def test_missing_header_defaults_to_grch38_and_override_wins():
+    content = _read("sample_raw_grch37.vcf").replace(
+        b"##reference=file:///references/human_g1k_v37.fasta\n", b""
+    )
+    # Without a build declaration GRCh37 positions miss the GRCh38 tables
+    unlifted = parse_vcf(BytesIO(content))
+    assert unlifted["genome_build"] == "GRCh38"
+    assert not any(unlifted["variants"].values())
+
+    lifted = parse_vcf(BytesIO(content), genome_build="GRCh37")
+    assert lifted["genome_build"] == "GRCh37"
+    assert lifted["variants"] == parse_vcf(BytesIO(_read("sample_raw_grch38.vcf")))["variants"]
+
+
+def test_positions_outside_chain_blocks_are_not_lifted():
+    chain = get_chain_index("GRCh37")
+    assert chain.lift("chr22", 42524947) == 42128945
+    assert chain.lift("22", 42524947) == 42128945
+    assert chain.lift("22", 1000) is None
+    assert chain.lift("2", 1000000) is None
+    assert get_chain_index("GRCh38") is None
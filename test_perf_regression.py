@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Performance regression gate: compare core pipeline timings with stored baselines."""
+
+import random
+import statistics
+import subprocess
+import sys
+from io import BytesIO
+
+from tools.perf_regression import (
+    ROOT_DIR,
+    compare_case,
+    build_synthetic_vcf,
+    load_baselines,
+    measure,
+    print_report,
+    run_gate,
+    DEFAULT_THRESHOLD,
+    DEFAULT_ALPHA,
+)
+
+
+def _synthetic_measurement(scale: float = 1.0, noise: float = 0.03, count: int = 15) -> dict:
+    """measure()-shaped result with fixed pseudo-random noise, so gate logic tests are deterministic."""
+    rng = random.Random(27)
+    samples = [scale * (1.0 + rng.gauss(0, noise)) for _ in range(count)]
+    median = statistics.median(samples)
+    return {
+        "loops": 1,
+        "samples": samples,
+        "median": median,
+        "mad": statistics.median(abs(s - median) for s in samples),
+        "raw_median": median / 1000
+    }
+
+
+def test_pipeline_within_baselines():
+    """Core pipeline functions are not significantly slower than benchmarks/baselines.json."""
+    report = run_gate(["parse_vcf", "determine_phenotype", "build_response_json", "end_to_end"], repeats=10)
+    print_report(report, DEFAULT_THRESHOLD, DEFAULT_ALPHA)
+    assert report["passed"], "Performance regression detected - see report above"
+
+
+def test_gate_flags_slower_parsing():
+    """A 20% slowdown must be flagged, while an identical rerun must not."""
+    measured = _synthetic_measurement()
+    slowed = _synthetic_measurement(scale=1.2)
+
+    assert compare_case(measured, measured, threshold=0.1)["status"] == "pass"
+    assert compare_case(slowed, measured, threshold=0.1)["status"] == "regression"
+
+
+def test_gate_flags_slowdown_against_other_process(tmp_path):
+    """A ~60% slower parse_vcf is flagged against a baseline recorded in a separate process."""
+    from services.vcf_parser import parse_vcf
+
+    baseline_path = tmp_path / "baselines.json"
+    subprocess.run(
+        [sys.executable, "-m", "tools.perf_regression", "--cases", "parse_vcf",
+         "--update-baseline", "--baseline", str(baseline_path), "--repeats", "10"],
+        cwd=ROOT_DIR, check=True, capture_output=True
+    )
+    baseline = load_baselines(baseline_path)["cases"]["parse_vcf"]
+
+    # Same records, 60% more of them
+    content = build_synthetic_vcf(3200)
+    slowed = measure(lambda: parse_vcf(BytesIO(content)), repeats=10, loops=baseline["loops"])
+
+    assert compare_case(slowed, baseline)["status"] == "regression"
+
+
+if __name__ == "__main__":
+    test_pipeline_within_baselines()
+    test_gate_flags_slower_parsing()
+    print("✓ Performance gate passed")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Phenotype assignment through determine_phenotype() for tagged and genotype-called diplotypes."""
+
+import pytest
+
+from services.phenotype_engine import PHENOTYPE_MAP, determine_phenotype
+
+
+# rsIDs of the DPYD alleles in data/allele_definitions.tsv
+DPYD_RSIDS = {"*2": "rs3918290", "*13": "rs55886062", "c.2846A>T": "rs67376798"}
+
+# CPIC activity score: *2 and *13 are 0, c.2846A>T is 0.5; PM below 1, IM 1 to 1.5
+DPYD_PHENOTYPES = [
+    ("*2", "*13", "PM"),
+    ("*2", "c.2846A>T", "PM"),
+    ("*13", "c.2846A>T", "PM"),
+    ("c.2846A>T", "c.2846A>T", "IM"),
+    ("*1", "c.2846A>T", "IM"),
+]
+
+
+def _genotyped(first: str, second: str) -> list:
+    copies = {}
+    for allele in (first, second):
+        if allele in DPYD_RSIDS:
+            copies[DPYD_RSIDS[allele]] = copies.get(DPYD_RSIDS[allele], 0) + 1
+    return [{"rsid": rsid, "genotype": "1/1" if count == 2 else "0/1"} for rsid, count in copies.items()]
+
+
+@pytest.mark.parametrize("first, second, phenotype", DPYD_PHENOTYPES)
+def test_dpyd_phenotype_from_star_tags(first, second, phenotype):
+    result = determine_phenotype("DPYD", [{"rsid": DPYD_RSIDS.get(a, "."), "star": a} for a in (first, second)])
+    assert result["phenotype"] == phenotype
+    assert result["diplotype"] in (f"{first}/{second}", f"{second}/{first}")
+
+
+@pytest.mark.parametrize("first, second, phenotype", DPYD_PHENOTYPES)
+def test_dpyd_phenotype_from_genotypes(first, second, phenotype):
+    result = determine_phenotype("DPYD", _genotyped(first, second))
+    assert result["phenotype"] == phenotype
+    assert result["diplotype"] in (f"{first}/{second}", f"{second}/{first}")
+    assert result["confidence"] == "high"
+
+
+def test_no_dpyd_diplotype_with_a_no_function_allele_is_normal():
+    for diplotype, phenotype in PHENOTYPE_MAP["DPYD"].items():
+        if {"*2", "*13"} & set(diplotype.split("/")):
+            assert phenotype in ("IM", "PM"), diplotype
+
+
+def test_unknown_diplotype_is_unknown():
+    result = determine_phenotype("DPYD", [{"rsid": ".", "star": "*99"}])
+    assert result["phenotype"] == "Unknown"
+    assert result["confidence"] == "low"
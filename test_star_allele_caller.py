@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Star-allele diplotype calls from the bundled allele-definition table."""
+
+from services.star_allele_caller import StarAlleleCaller, get_star_allele_caller
+
+
+def _variants(**genotypes) -> list:
+    return [{"rsid": rsid, "genotype": genotype} for rsid, genotype in genotypes.items()]
+
+
+def _call(gene: str, **genotypes):
+    return get_star_allele_caller(gene).call(_variants(**genotypes))
+
+
+def test_heterozygous_call():
+    result = _call("CYP2C19", rs4244285="0/1")
+    assert result == {"diplotype": "*1/*2", "score": 0, "tied": 1, "confidence": "high"}
+
+
+def test_homozygous_call():
+    assert _call("CYP2C19", rs4244285="1/1")["diplotype"] == "*2/*2"
+    assert _call("CYP2D6", rs1065852="1/1", rs3892097="1/1")["diplotype"] == "*4/*4"
+
+
+def test_compound_heterozygous_call():
+    assert _call("CYP2C19", rs4244285="0/1", rs12248560="0/1")["diplotype"] == "*2/*17"
+
+
+def test_reference_genotypes_call_reference_diplotype():
+    assert _call("CYP2C9", rs1799853="0/0", rs1057910="0/0")["diplotype"] == "*1/*1"
+
+
+def test_phased_calls_follow_haplotypes():
+    # TPMT*3A carries both variants; *3B and *3C one each
+    assert _call("TPMT", rs1800460="0/1", rs1142345="0/1")["diplotype"] == "*1/*3A"
+    assert _call("TPMT", rs1800460="0|1", rs1142345="0|1")["diplotype"] == "*1/*3A"
+    trans = _call("TPMT", rs1800460="0|1", rs1142345="1|0")
+    assert trans["diplotype"] == "*3B/*3C"
+    assert trans["confidence"] == "high"
+
+
+def test_phased_and_unphased_orientation_agree():
+    assert _call("TPMT", rs1800460="1|0", rs1142345="0|1") == _call("TPMT", rs1800460="0|1", rs1142345="1|0")
+
+
+def test_overlapping_cyp2d6_4_and_10():
+    # *4 is rs1065852 + rs3892097, *10 is rs1065852 alone
+    assert _call("CYP2D6", rs1065852="0/1")["diplotype"] == "*1/*10"
+    assert _call("CYP2D6", rs1065852="0/1", rs3892097="0/1")["diplotype"] == "*1/*4"
+    assert _call("CYP2D6", rs1065852="1/1", rs3892097="0/1")["diplotype"] == "*4/*10"
+
+
+def test_inexact_match_prefers_diplotype_explaining_observed_alleles():
+    # A lone 1846G>A has no exact match; *1/*4 and *1/*1 both miss one copy,
+    # but only *1/*4 explains the observed alternate allele
+    result = _call("CYP2D6", rs3892097="0/1")
+    assert result["diplotype"] == "*1/*4"
+    assert result["score"] == 1
+    assert result["tied"] == 2
+    assert result["confidence"] == "low"
+
+
+def test_table_order_breaks_remaining_ties():
+    caller = StarAlleleCaller("TEST", [("*1", []), ("*A", ["rs1", "rs2"]), ("*B", ["rs1", "rs2"])])
+    result = caller.call(_variants(rs1="0/1", rs2="0/1"))
+    assert result["diplotype"] == "*1/*A"
+    assert result["confidence"] == "medium"
+
+
+def test_reference_allele_added_when_table_has_none():
+    caller = StarAlleleCaller("TEST", [("*2", ["rs1"])])
+    assert caller.call(_variants(rs1="0/1"))["diplotype"] == "*1/*2"
+
+
+def test_no_defining_variant_observed_returns_none():
+    caller = get_star_allele_caller("CYP2C19")
+    assert caller.call([]) is None
+    assert caller.call(None) is None
+    assert caller.call(_variants(rs1065852="1/1")) is None  # CYP2D6 position
+    assert caller.call(_variants(rs4244285="./.")) is None
+    assert caller.call(_variants(rs4244285="1")) is None  # haploid call
+
+
+def test_unknown_gene_has_no_caller():
+    assert get_star_allele_caller("NUDT15") is None
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""Record-level VCF QC filters (services/variant_qc.py) and their counts in parse_vcf()."""
+
+from io import BytesIO
+
+import pytest
+
+from services.variant_qc import QCFilter
+from services.vcf_parser import parse_vcf
+
+
+def _record(filter_value="PASS", qual="60", info="DP=40", format_field="GT:DP:GQ", sample="0/1:40:99") -> list:
+    return ["22", "42128945", ".", "C", "T", qual, filter_value, info, format_field, sample]
+
+
+def _info(fields: list) -> dict:
+    return dict(pair.split("=", 1) for pair in fields[7].split(";") if "=" in pair)
+
+
+def _check(expression: str, **record) -> str:
+    fields = _record(**record)
+    return QCFilter(expression).check(fields, _info(fields))[0]
+
+
+def test_filter_equals():
+    assert _check("FILTER=PASS") is None
+    assert _check("FILTER=PASS", filter_value="LowQual") == "FILTER=PASS"
+    assert _check("FILTER=PASS,LowGQ", filter_value="LowGQ") is None
+
+
+def test_filter_not_equals():
+    assert _check("FILTER!=LowQual") is None
+    assert _check("FILTER!=LowQual", filter_value="LowQual") == "FILTER!=LowQual"
+    # Any listed filter in a ";"-separated FILTER column rejects the record
+    assert _check("FILTER!=LowQual,StrandBias", filter_value="q10;StrandBias") == "FILTER!=LowQual,StrandBias"
+
+
+def test_unfiltered_record_passes_filter_clauses():
+    assert _check("FILTER=PASS", filter_value=".") is None
+    assert _check("FILTER!=PASS", filter_value=".") is None
+
+
+@pytest.mark.parametrize("expression, qual, rejected", [
+    ("QUAL>=30", "30", False),
+    ("QUAL>=30", "29.9", True),
+    ("QUAL>30", "30", True),
+    ("QUAL<=30", "30", False),
+    ("QUAL<30", "30", True),
+    ("QUAL>=30", "1e3", False),
+])
+def test_qual_comparisons(expression, qual, rejected):
+    assert (_check(expression, qual=qual) == expression) is rejected
+
+
+def test_sample_depth_and_genotype_quality():
+    assert _check("DP>=10; GQ>=20") is None
+    assert _check("DP>=10; GQ>=20", sample="0/1:9:99") == "DP>=10"
+    assert _check("DP>=10; GQ>=20", sample="0/1:40:19") == "GQ>=20"
+
+
+def test_depth_falls_back_to_info():
+    assert _check("DP>=10", format_field="GT", sample="0/1", info="DP=5") == "DP>=10"
+    assert _check("DP>=10", format_field="GT", sample="0/1", info="DP=50") is None
+    assert _check("DP>=10", sample="0/1:.:99", info="DP=5") == "DP>=10"
+    # The sample's own depth wins over INFO
+    assert _check("DP>=10", sample="0/1:40:99", info="DP=5") is None
+
+
+def test_missing_values_are_not_rejected():
+    assert _check("QUAL>=30", qual=".") is None
+    assert _check("GQ>=20", sample="0/1:40:.") is None
+    assert _check("GQ>=20", format_field="GT:DP", sample="0/1:40") is None
+    assert _check("DP>=10", format_field="GT", sample="0/1", info="AF=0.5") is None
+    # Trailing FORMAT fields may be dropped from the sample column
+    assert _check("GQ>=20", sample="0/1:40") is None
+    assert _check("GT!=0/0", format_field="DP", sample="40") is None
+    fields = _record()[:8]
+    assert QCFilter("GT!=0/0; DP>=10").check(fields, _info(fields)) == (None, None)
+
+
+def test_genotype_clauses_are_phase_insensitive():
+    assert _check("GT!=0/0", sample="0|0:40:99") == "GT!=0/0"
+    assert _check("GT!=0|0", sample="0/0:40:99") == "GT!=0|0"
+    assert _check("GT=0/1,1/1", sample="1|0:40:99") == "GT=0/1,1/1"
+    assert _check("GT=0/1,1/1", sample="0|1:40:99") is None
+
+
+def test_check_returns_first_failing_clause_and_genotype():
+    fields = _record(filter_value="LowQual", sample="0|1:5:99")
+    assert QCFilter("FILTER=PASS; DP>=10").check(fields, _info(fields)) == ("FILTER=PASS", "0|1")
+    assert QCFilter("DP>=10; FILTER=PASS").check(fields, _info(fields)) == ("DP>=10", "0|1")
+
+
+def test_layout_cache_handles_differing_format_strings():
+    qc = QCFilter("DP>=10")
+    assert qc.check(_record(format_field="GT:DP", sample="0/1:5"), {})[0] == "DP>=10"
+    assert qc.check(_record(format_field="DP:GT", sample="50:0/1"), {}) == (None, "0/1")
+
+
+@pytest.mark.parametrize("expression", [
+    "QUAL=30", "FILTER>=PASS", "DP>=ten", "AF>=0.1", "GT",
+])
+def test_invalid_clauses_raise(expression):
+    with pytest.raises(ValueError):
+        QCFilter(expression)
+
+
+def test_clause_labels_are_normalized():
+    assert [label for label, _, _ in QCFilter(" filter == PASS ;dp >= 10;").clauses] == ["FILTER=PASS", "DP>=10"]
+
+
+VCF = b"""##fileformat=VCFv4.2
+##reference=GRCh38
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1
+22\t42128945\t.\tC\tT\t60\tPASS\tDP=40\tGT:DP\t0/1:40
+22\t42130692\t.\tG\tA\t60\tLowQual\tDP=40\tGT:DP\t0/1:40
+22\t42127941\t.\tG\tA\t60\tPASS\tDP=40\tGT:DP\t0/1:4
+10\t94781859\t.\tG\tA\t60\tPASS\tDP=4\tGT\t1/1
+10\t94780653\t.\tG\tA\t60\tPASS\tDP=40\tGT:DP\t0|0:40
+chr10\t94942290\t.\tC\tT\t60\tPASS\tGENE=CYP2C9;RS=rs1799853;STAR=*2\tGT:DP\t0/1:3
+2\t1000000\t.\tC\tT\t60\tLowQual\tDP=40\tGT:DP\t0/1:40
+"""
+
+
+def test_parse_vcf_counts_rejected_calls_per_gene_and_clause():
+    result = parse_vcf(BytesIO(VCF), qc=QCFilter("FILTER=PASS; DP>=10; GT!=0/0"))
+    assert result["vcf_parsing_success"]
+    assert result["qc"] == {
+        "filters": "FILTER=PASS; DP>=10; GT!=0/0",
+        "rejected": {
+            "CYP2D6": {"FILTER=PASS": 1, "DP>=10": 1},
+            "CYP2C19": {"DP>=10": 1, "GT!=0/0": 1},
+            "CYP2C9": {"DP>=10": 1},
+        },
+    }
+    assert [v["rsid"] for v in result["variants"]["CYP2D6"]] == ["rs3892097"]
+    assert result["variants"]["CYP2C19"] == []
+
+
+def test_parse_vcf_counts_only_panel_genes():
+    result = parse_vcf(BytesIO(VCF), genes=["CYP2C19"], qc=QCFilter("FILTER=PASS; DP>=10; GT!=0/0"))
+    assert result["qc"]["rejected"] == {"CYP2C19": {"DP>=10": 1, "GT!=0/0": 1}}
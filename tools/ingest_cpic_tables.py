@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Build the indexed CPIC table store (services/cpic_tables.py) from CPIC files.
+
+Accepts CPIC's published per-gene tables as .xlsx, .csv or .tsv:
+  - diplotype-phenotype tables ("<GENE>_Diplotype_Phenotype_Table"), with a
+    "<GENE> Diplotype" column, a phenotype column ("Coded Diplotype/Phenotype
+    Summary", "Phenotype", ...) and optionally "Activity Score"
+  - allele functionality tables ("<GENE>_allele_functionality_reference"),
+    with "Allele", a function column ("Allele Clinical Functional Status")
+    and optionally "Activity Value"
+
+The gene is taken from --gene, the "<GENE> Diplotype" header, or the file
+name prefix. The built-in phenotype_engine.PHENOTYPE_MAP is loaded first
+(unless --no-builtin), so the store always covers the supported genes;
+entries from files override it. CSV/TSV input is streamed; the store is
+written to a temporary file and swapped in atomically, so it can be rebuilt
+while the app is running (workers pick it up on restart).
+
+Usage:
+    python -m tools.ingest_cpic_tables \\
+        --diplotypes CYP2D6_Diplotype_Phenotype_Table.xlsx \\
+        --alleles CYP2D6_allele_functionality_reference.xlsx
+    python -m tools.ingest_cpic_tables --output data/cpic_tables.sqlite3   # built-in map only
+"""
+
+import argparse
+import csv
+import os
+import time
+
+from services.cpic_tables import CPIC_TABLES_PATH, CPICTableStore, normalize_phenotype, write_cpic_tables
+from services.phenotype_engine import PHENOTYPE_MAP
+from services.result_store import knowledge_base_version
+
+
+def _clean(value) -> str:
+    text = "" if value is None else str(value).strip()
+    return "" if text.lower() in ("nan", "none") else text
+
+
+def iter_table_rows(path: str, header_hint: str):
+    """
+    Yield each data row of a table file as a dict keyed by its header.
+
+    CPIC spreadsheets often start with title lines; the header is the first
+    row with a cell that is `header_hint` or ends with it (case-insensitive),
+    e.g. "Allele" or "CYP2D6 Diplotype".
+    """
+    extension = os.path.splitext(path)[1].lower()
+    handle = None
+    if extension in (".xlsx", ".xls"):
+        import pandas as pd
+
+        rows = (list(row) for row in pd.read_excel(path, header=None, dtype=str).itertuples(index=False))
+    else:
+        handle = open(path, newline="", encoding="utf-8-sig")
+        rows = csv.reader(handle, delimiter="," if extension == ".csv" else "\t")
+
+    header = None
+    try:
+        for row in rows:
+            cells = [_clean(cell) for cell in row]
+            if header is None:
+                if any(cell.lower() == header_hint or cell.lower().endswith(" " + header_hint) for cell in cells):
+                    header = cells
+                continue
+            if any(cells):
+                yield dict(zip(header, cells))
+    finally:
+        if handle is not None:
+            handle.close()
+    if header is None:
+        raise ValueError(f"{path}: no header row containing '{header_hint}'")
+
+
+def _column(row: dict, *needles, exclude=()):
+    """First header containing a needle, trying the needles in priority order."""
+    for needle in needles:
+        for name in row:
+            lowered = name.lower()
+            if needle in lowered and not any(x in lowered for x in exclude):
+                return name
+    return None
+
+
+def _gene_for(path: str, row: dict, gene: str = None) -> str:
+    if gene:
+        return gene.upper()
+    column = _column(row, "diplotype", exclude=("summary", "phenotype"))
+    if column and " " in column.strip():
+        return column.split()[0].upper()
+    return os.path.basename(path).split("_", 1)[0].upper()
+
+
+def diplotype_rows(path: str, gene: str = None, skipped: dict = None):
+    """(gene, diplotype, phenotype_code, activity_score) rows of a diplotype-phenotype table."""
+    columns = None
+    for row in iter_table_rows(path, "diplotype"):
+        if columns is None:
+            columns = (
+                _gene_for(path, row, gene),
+                _column(row, "diplotype", exclude=("summary", "phenotype")),
+                _column(row, "phenotype summary", "phenotype", "metabolizer status", exclude=("ehr",)),
+                _column(row, "activity score")
+            )
+            if not columns[1] or not columns[2]:
+                raise ValueError(f"{path}: diplotype or phenotype column not found in {list(row)}")
+        row_gene, diplotype_col, phenotype_col, activity_col = columns
+        diplotype = row.get(diplotype_col, "")
+        phenotype = normalize_phenotype(row.get(phenotype_col))
+        if "/" not in diplotype:
+            if skipped is not None:
+                skipped["diplotypes"] = skipped.get("diplotypes", 0) + 1
+            continue
+        yield row_gene, diplotype, phenotype, row.get(activity_col) if activity_col else None
+
+
+def allele_rows(path: str, gene: str = None):
+    """(gene, allele, function, activity_value) rows of an allele functionality table."""
+    columns = None
+    for row in iter_table_rows(path, "allele"):
+        if columns is None:
+            columns = (
+                gene.upper() if gene else os.path.basename(path).split("_", 1)[0].upper(),
+                _column(row, "allele", exclude=("function", "status", "activity", "evidence", "finding")),
+                _column(row, "clinical functional status", "clinical function", "function"),
+                _column(row, "activity value")
+            )
+            if not columns[1]:
+                raise ValueError(f"{path}: allele column not found in {list(row)}")
+        row_gene, allele_col, function_col, activity_col = columns
+        allele = row.get(allele_col, "")
+        if allele:
+            yield (row_gene, allele, row.get(function_col) if function_col else None,
+                   row.get(activity_col) if activity_col else None)
+
+
+def builtin_rows():
+    for gene, diplotypes in PHENOTYPE_MAP.items():
+        for diplotype, phenotype in diplotypes.items():
+            yield gene, diplotype, phenotype, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest CPIC allele and diplotype tables into the indexed store")
+    parser.add_argument("--diplotypes", action="append", default=[], help="Diplotype-phenotype table (repeatable)")
+    parser.add_argument("--alleles", action="append", default=[], help="Allele functionality table (repeatable)")
+    parser.add_argument("--gene", help="Gene of all input files (default: from header or file name)")
+    parser.add_argument("--output", default=CPIC_TABLES_PATH, help="SQLite store to (re)build")
+    parser.add_argument("--no-builtin", action="store_true", help="Do not include the built-in PHENOTYPE_MAP")
+    args = parser.parse_args()
+
+    skipped = {}
+
+    def all_diplotypes():
+        if not args.no_builtin:
+            yield from builtin_rows()
+        for path in args.diplotypes:
+            yield from diplotype_rows(path, args.gene, skipped)
+
+    def all_alleles():
+        for path in args.alleles:
+            yield from allele_rows(path, args.gene)
+
+    started = time.monotonic()
+    sources = [os.path.basename(p) for p in args.diplotypes + args.alleles]
+    counts = write_cpic_tables(args.output, all_diplotypes(), all_alleles(), meta={
+        "sources": ",".join(sources) or "builtin",
+        "builtin": str(not args.no_builtin).lower(),
+        # Lets the app warn when PHENOTYPE_MAP has changed since this build
+        "builtin_version": "" if args.no_builtin else knowledge_base_version(PHENOTYPE_MAP)
+    })
+    print(f"✓ Wrote {counts['diplotypes']} diplotype rows and {counts['alleles']} allele rows "
+          f"to {args.output} in {time.monotonic() - started:.1f}s")
+    if skipped.get("diplotypes"):
+        print(f"⚠ Skipped {skipped['diplotypes']} rows without a two-allele diplotype")
+
+    stats = CPICTableStore(args.output).stats()
+    print(f"  Genes: {', '.join(stats['genes'])}")
+    print(f"  Distinct diplotypes: {stats['diplotypes']}, alleles: {stats['alleles']}")
+
+
+if __name__ == "__main__":
+    main()
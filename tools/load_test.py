@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Concurrent load driver for the /api/analysis endpoint.
+
+Sends multi-drug analysis requests from a pool of client threads and reports
+throughput, latency percentiles and an estimate of worker saturation. Pair it
+with tools/mock_llm_server.py to exercise the LLM retry/backoff path without
+live API keys.
+
+Usage:
+    gunicorn app:app --workers 2 --bind 127.0.0.1:5000
+    python -m tools.load_test --url http://127.0.0.1:5000 --concurrency 16 \\
+        --requests 200 --drugs CODEINE,CLOPIDOGREL,WARFARIN --workers 2 \\
+        --mock-url http://127.0.0.1:8085
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+SERVER_TIMING_PATTERN = re.compile(r"app;dur=([0-9.]+)")
+
+
+def percentile(values: list, pct: float) -> float:
+    """Return the pct-th percentile (0-100) of values using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class LoadResults:
+    """Thread-safe collector for per-request measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.server_times = []
+        self.status_counts = {}
+        self.errors = {}
+
+    def record(self, status, latency: float, server_time: float = None):
+        with self._lock:
+            self.latencies.append(latency)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if server_time is not None:
+                self.server_times.append(server_time)
+
+    def record_error(self, error: Exception, latency: float):
+        name = type(error).__name__
+        with self._lock:
+            self.latencies.append(latency)
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def run_load(url: str, vcf_content: bytes, drugs: str, concurrency: int,
+             total_requests: int = None, duration: float = None, timeout: float = 300) -> tuple:
+    """
+    Drive concurrent /api/analysis requests.
+
+    Parameters:
+    -----------
+    url : str
+        Base URL of the running app (e.g. http://127.0.0.1:5000)
+    vcf_content : bytes
+        VCF file body uploaded with every request
+    drugs : str
+        Comma-separated drug list sent with every request
+    concurrency : int
+        Number of client threads
+    total_requests : int
+        Stop after this many requests (if duration is not given)
+    duration : float
+        Stop after this many seconds
+
+    Returns:
+    --------
+    tuple
+        (LoadResults, elapsed_seconds)
+    """
+    results = LoadResults()
+    endpoint = url.rstrip("/") + "/api/analysis"
+    counter_lock = threading.Lock()
+    issued = [0]
+    started = time.perf_counter()
+
+    def should_continue() -> bool:
+        if duration is not None:
+            return time.perf_counter() - started < duration
+        with counter_lock:
+            if issued[0] >= total_requests:
+                return False
+            issued[0] += 1
+            return True
+
+    def client_loop():
+        session = requests.Session()
+        while should_continue():
+            request_started = time.perf_counter()
+            try:
+                response = session.post(
+                    endpoint,
+                    data={"drugs": drugs},
+                    files={"vcf_file": ("load_test.vcf", vcf_content)},
+                    timeout=timeout
+                )
+                latency = time.perf_counter() - request_started
+                server_time = None
+                match = SERVER_TIMING_PATTERN.search(response.headers.get("Server-Timing", ""))
+                if match:
+                    server_time = float(match.group(1)) / 1000.0
+                results.record(response.status_code, latency, server_time)
+            except requests.exceptions.RequestException as e:
+                results.record_error(e, time.perf_counter() - request_started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client_loop)
+
+    return results, time.perf_counter() - started
+
+
+def build_report(results: LoadResults, elapsed: float, workers: int = None) -> dict:
+    """Summarize a load run as a plain dict (see print_report for the text form)."""
+    completed = len(results.latencies)
+    latencies_ms = [v * 1000 for v in results.latencies]
+    server_ms = [v * 1000 for v in results.server_times]
+
+    report = {
+        "requests": completed,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "status_counts": {str(k): v for k, v in sorted(results.status_counts.items())},
+        "client_errors": results.errors,
+        "latency_ms": {
+            "p50": round(percentile(latencies_ms, 50), 1),
+            "p90": round(percentile(latencies_ms, 90), 1),
+            "p95": round(percentile(latencies_ms, 95), 1),
+            "p99": round(percentile(latencies_ms, 99), 1),
+            "max": round(max(latencies_ms), 1) if latencies_ms else 0.0
+        },
+        "server_time_ms": {
+            "p50": round(percentile(server_ms, 50), 1),
+            "p99": round(percentile(server_ms, 99), 1)
+        }
+    }
+
+    # Time spent outside the app (queued behind busy workers, network) per request
+    if server_ms and len(server_ms) == len(latencies_ms):
+        queue_ms = [max(0.0, c - s) for c, s in zip(latencies_ms, server_ms)]
+        report["queue_wait_ms"] = {
+            "p50": round(percentile(queue_ms, 50), 1),
+            "p99": round(percentile(queue_ms, 99), 1)
+        }
+
+    # Busy worker-seconds over available worker-seconds
+    if workers and elapsed > 0:
+        busy = sum(results.server_times)
+        report["worker_saturation"] = round(min(1.0, busy / (workers * elapsed)), 3)
+
+    return report
+
+
+def print_report(report: dict, mock_stats: dict = None):
+    """Print a load report in a human-readable layout."""
+    print("=" * 60)
+    print("LOAD TEST REPORT")
+    print("=" * 60)
+    print(f"Requests completed: {report['requests']} in {report['elapsed_s']}s")
+    print(f"Throughput:         {report['throughput_rps']} req/s")
+    print(f"Status codes:       {report['status_counts']}")
+    if report["client_errors"]:
+        print(f"Client errors:      {report['client_errors']}")
+    lat = report["latency_ms"]
+    print(f"Latency (ms):       p50={lat['p50']} p90={lat['p90']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    srv = report["server_time_ms"]
+    print(f"In-app time (ms):   p50={srv['p50']} p99={srv['p99']}")
+    if "queue_wait_ms" in report:
+        queue = report["queue_wait_ms"]
+        print(f"Queue wait (ms):    p50={queue['p50']} p99={queue['p99']}")
+    if "worker_saturation" in report:
+        print(f"Worker saturation:  {report['worker_saturation'] * 100:.1f}%")
+    if mock_stats:
+        print(f"Mock LLM server:    {mock_stats}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/analysis")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--vcf", default="data/sample_poor_metabolizer.vcf")
+    parser.add_argument("--drugs", default="CODEINE,CLOPIDOGREL,WARFARIN,SIMVASTATIN")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request client timeout")
+    parser.add_argument("--workers", type=int, default=None, help="Server worker count, for saturation")
+    parser.add_argument("--mock-url", default=None, help="Mock LLM server base URL, to include its stats")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    with open(args.vcf, "rb") as f:
+        vcf_content = f.read()
+
+    print(f"Load testing {args.url} with {args.concurrency} clients ({args.drugs})...")
+    results, elapsed = run_load(args.url, vcf_content, args.drugs, args.concurrency,
+                                total_requests=args.requests, duration=args.duration, timeout=args.timeout)
+    report = build_report(results, elapsed, args.workers)
+
+    mock_stats = None
+    if args.mock_url:
+        try:
+            mock_stats = requests.get(args.mock_url.rstrip("/") + "/stats", timeout=5).json()
+            report["mock_llm"] = mock_stats
+        except requests.exceptions.RequestException as e:
+            print(f"⚠ Could not fetch mock LLM stats: {e}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, mock_stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Gemini and OpenAI HTTP APIs used by services/llm_service.py.
+
+Lets /api/analysis be load-tested without live LLM keys. Latency, rate limiting
+(429 + Retry-After), malformed JSON bodies and hung requests are all configurable,
+so the retry/backoff behaviour of the providers can be observed under concurrency.
+Streaming requests (:streamGenerateContent, or "stream": true for OpenAI) get the
+same completion as server-sent events, one small chunk every --chunk-delay seconds.
+
+Usage:
+    python -m tools.mock_llm_server --port 8085 --latency lognormal:0.8,0.5 \\
+        --rate-429 0.1 --retry-after 2 --malformed-rate 0.02 --timeout-rate 0.01
+
+Point the app at it with:
+    GEMINI_BASE_URL=http://127.0.0.1:8085/v1beta/models GOOGLE_API_KEY=mock
+    (or LLM_PROVIDER=openai OPENAI_BASE_URL=http://127.0.0.1:8085/v1 OPENAI_API_KEY=mock)
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MOCK_RECOMMENDATION = {
+    "clinical_recommendation": {
+        "dosage_adjustment": "Standard dosing is appropriate for your genetic profile (mock response)",
+        "monitoring": "Routine monitoring",
+        "alternative_drugs": [],
+        "urgency": "routine"
+    },
+    "llm_generated_explanation": {
+        "summary": "Mock explanation generated by the local LLM stand-in.",
+        "mechanism": "Mock mechanism text.",
+        "interaction_notes": ["Mock note"],
+        "evidence_basis": "Mock evidence basis"
+    }
+}
+
+
+def mock_completion_text(prompt: str) -> str:
+    """
+    Build the completion text for a prompt.
+
+    Batched prompts (a "MEDICATIONS TO EXPLAIN:" section) get a JSON array
+    with one mock recommendation per listed drug; all others get one object.
+    """
+    marker = "MEDICATIONS TO EXPLAIN:"
+    if marker not in prompt:
+        return json.dumps(MOCK_RECOMMENDATION)
+    drugs = []
+    for line in prompt.split(marker, 1)[1].splitlines()[1:]:
+        if not line.startswith("- "):
+            break
+        drugs.append(line[2:].split(":", 1)[0].strip())
+    return json.dumps([dict(MOCK_RECOMMENDATION, drug=drug) for drug in drugs])
+
+
+def extract_prompt(api: str, body: bytes) -> str:
+    """Pull the prompt text out of a Gemini or OpenAI request body."""
+    try:
+        payload = json.loads(body or b"{}")
+        if api == "gemini":
+            return payload["contents"][0]["parts"][0]["text"]
+        return payload["messages"][-1]["content"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ""
+
+
+def parse_latency_spec(spec: str):
+    """
+    Parse a latency distribution spec into a zero-argument sampler (seconds).
+
+    Parameters:
+    -----------
+    spec : str
+        One of "fixed:S", "uniform:LO,HI", "normal:MEAN,STD",
+        "lognormal:MEDIAN,SIGMA" or "exponential:MEAN" (all in seconds)
+
+    Returns:
+    --------
+    callable
+        Function returning a non-negative latency sample
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    kind = kind.strip().lower()
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        import math
+        mu = math.log(values[0]) if values[0] > 0 else 0.0
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda: random.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class MockStats:
+    """Thread-safe counters for the outcomes the server has produced."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "malformed": 0, "timeout": 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def enter(self):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self, outcome: str):
+        with self._lock:
+            self.in_flight -= 1
+            self.counts[outcome] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts, in_flight=self.in_flight, max_in_flight=self.max_in_flight)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """Serves Gemini :generateContent / :streamGenerateContent and OpenAI /chat/completions lookalikes."""
+
+    server_version = "PharmaGuardMockLLM/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.config.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        path = self.path.split("?", 1)[0]
+        if ":generateContent" in path or ":streamGenerateContent" in path:
+            api = "gemini"
+            streaming = ":streamGenerateContent" in path
+        elif path.rstrip("/").endswith("/chat/completions"):
+            api = "openai"
+            try:
+                streaming = bool(json.loads(body or b"{}").get("stream"))
+            except (ValueError, AttributeError):
+                streaming = False
+        else:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        config = self.server.config
+        stats = self.server.stats
+        stats.enter()
+        outcome = "ok"
+        try:
+            roll = random.random()
+            if roll < config.rate_429:
+                outcome = "rate_limited"
+                self._send_json(429, {"error": {"code": 429, "message": "Resource exhausted (mock)"}},
+                                headers={"Retry-After": str(config.retry_after)})
+                return
+
+            if roll < config.rate_429 + config.timeout_rate:
+                # Hold the connection past the client's timeout, then give up
+                outcome = "timeout"
+                time.sleep(config.timeout_seconds)
+                self.close_connection = True
+                return
+
+            time.sleep(self.server.latency())
+
+            if roll < config.rate_429 + config.timeout_rate + config.malformed_rate:
+                outcome = "malformed"
+                body = b'{"candidates": [{"content": {"parts": [{"text": "{\\"clinical_'
+                self._send_raw(200, body, "application/json")
+                return
+
+            text = mock_completion_text(extract_prompt(api, body))
+            if streaming:
+                self._send_stream(api, text)
+                return
+            if api == "gemini":
+                payload = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+            else:
+                payload = {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+            self._send_json(200, payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stats.leave(outcome)
+
+    def _send_stream(self, api: str, text: str):
+        """Send a completion as server-sent events, a few characters per event."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.close_connection = True
+        size = max(1, self.server.config.chunk_size)
+        for start in range(0, len(text), size):
+            piece = text[start:start + size]
+            if api == "gemini":
+                event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+            else:
+                event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.config.chunk_delay)
+        if api == "openai":
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        self._send_raw(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send_raw(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def build_server(host: str, port: int, config: argparse.Namespace) -> ThreadingHTTPServer:
+    """Create (but do not start) a mock server bound to host:port."""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.stats = MockStats()
+    server.latency = parse_latency_spec(config.latency)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gemini/OpenAI API server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", default="fixed:0.5",
+                        help="fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MEDIAN,SIGMA | exponential:MEAN")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of truncated JSON bodies")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--timeout-seconds", type=float, default=35.0, help="How long hung requests hang")
+    parser.add_argument("--chunk-size", type=int, default=24, help="Characters per streamed event")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Seconds between streamed events")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = build_server(args.host, args.port, args)
+    print(f"✓ Mock LLM server listening on http://{args.host}:{args.port}")
+    print(f"  Gemini: GEMINI_BASE_URL=http://{args.host}:{args.port}/v1beta/models")
+    print(f"  OpenAI: OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    print(f"  Stats:  http://{args.host}:{args.port}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Final stats: {json.dumps(server.stats.snapshot())}")
+
+
+if __name__ == "__main__":
+    main()
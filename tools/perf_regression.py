@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+"""
+Performance regression gate for the core analysis pipeline.
+
+Benchmarks parse_vcf, determine_phenotype, build_response_json, the CPIC load
+and an end-to-end /api/analysis request (with a stub LLM provider), then compares
+the results against baselines stored in benchmarks/baselines.json.
+
+A case only fails when it is both slower than the threshold (default 15%) and
+the slowdown is statistically significant (one-sided Mann-Whitney U test), so
+run-to-run noise does not trip the gate. Timings are normalized by a fixed
+calibration workload run alongside every sample, so baselines remain comparable
+across machines and CPU frequency drift is cancelled out. The workload does the
+same kind of work as the pipeline (decoding, splitting and dict-building VCF-like
+lines): a dict/sort loop tracked the process's speed poorly enough that
+normalized parse_vcf timings varied ~10% between processes on the same machine.
+
+Usage:
+    python -m tools.perf_regression                    # check against baselines
+    python -m tools.perf_regression --update-baseline  # record new baselines
+    python -m tools.perf_regression --cases parse_vcf --threshold 0.1
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE_PATH = ROOT_DIR / "benchmarks" / "baselines.json"
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_ALPHA = 0.01
+DEFAULT_REPEATS = 15
+TARGET_SAMPLE_SECONDS = 0.02
+CALIBRATION_LOOPS = 5
+CALIBRATION_LINE = b"chr10\t94781859\trs4244285\tG\tA\t100\tPASS\tGENE=CYP2C19;RS=rs4244285;STAR=*2\tGT:DP\t0/1:50\n"
+
+SAMPLE_VCF_RECORDS = [
+    ("chr22", "42126611", "rs1065852", "G", "A", "GENE=CYP2D6;RS=rs1065852;STAR=*4", "0/1"),
+    ("chr22", "42128945", "rs3892097", "G", "A", "GENE=CYP2D6;RS=rs3892097;STAR=*4", "1/1"),
+    ("chr10", "94781859", "rs4244285", "G", "A", "GENE=CYP2C19;RS=rs4244285;STAR=*2", "0/1"),
+    ("chr10", "94942290", "rs1799853", "C", "T", "GENE=CYP2C9;RS=rs1799853;STAR=*2", "0/1"),
+    ("chr12", "21178615", "rs4149056", "T", "C", "GENE=SLCO1B1;RS=rs4149056;STAR=*5", "0/1"),
+    ("chr6", "18138997", "rs1800460", "C", "T", "GENE=TPMT;RS=rs1800460;STAR=*3", "0/1"),
+    ("chr1", "97450058", "rs3918290", "C", "T", "GENE=DPYD;RS=rs3918290;STAR=*2", "0/0"),
+    ("chr2", "1000000", "rs0000001", "A", "G", "DP=40", "0/1"),
+]
+
+
+def build_synthetic_vcf(record_count: int = 2000) -> bytes:
+    """Build a deterministic VCF body cycling through representative records."""
+    lines = [
+        "##fileformat=VCFv4.2",
+        "##reference=GRCh38",
+        "##INFO=<ID=GENE,Number=1,Type=String,Description=\"Gene symbol\">",
+        "##INFO=<ID=STAR,Number=1,Type=String,Description=\"Star allele\">",
+        "##INFO=<ID=RS,Number=1,Type=String,Description=\"rsID\">",
+        "##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">",
+        "##FORMAT=<ID=DP,Number=1,Type=Integer,Description=\"Read Depth\">",
+        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tBENCH",
+    ]
+    for i in range(record_count):
+        chrom, pos, rsid, ref, alt, info, gt = SAMPLE_VCF_RECORDS[i % len(SAMPLE_VCF_RECORDS)]
+        lines.append(f"{chrom}\t{int(pos) + i}\t{rsid}\t{ref}\t{alt}\t100\tPASS\t{info}\tGT:DP\t{gt}:50")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class StubLLMProvider:
+    """LLM stand-in returning a fixed recommendation without network access."""
+
+    def generate_clinical_recommendation(self, prompt: str, **kwargs) -> dict:
+        return {
+            "clinical_recommendation": {
+                "dosage_adjustment": "Standard dosing (stub)",
+                "monitoring": "Routine monitoring",
+                "alternative_drugs": [],
+                "urgency": "routine"
+            },
+            "llm_generated_explanation": {
+                "summary": "Stub explanation",
+                "mechanism": "Stub mechanism",
+                "interaction_notes": [],
+                "evidence_basis": "Stub"
+            }
+        }
+
+
+def _calibration_workload():
+    """Fixed workload that every benchmark sample is normalized against (independent of the repo's code)."""
+    data = {}
+    for i in range(300):
+        fields = CALIBRATION_LINE.decode("utf-8").strip().split("\t")
+        info = dict(pair.split("=", 1) for pair in fields[7].split(";"))
+        key = f"{fields[0]}:{int(fields[1]) + i % 97}"
+        data[key] = data.get(key, 0) + len(info)
+    return sorted(data.items(), key=lambda item: item[1])
+
+
+def _case_parse_vcf():
+    from services.vcf_parser import parse_vcf
+    content = build_synthetic_vcf()
+    return lambda: parse_vcf(BytesIO(content))
+
+
+def _case_determine_phenotype():
+    from services.phenotype_engine import determine_phenotype
+    inputs = [
+        ("CYP2D6", [{"rsid": "rs1065852", "star": "*4"}, {"rsid": "rs3892097", "star": "*10"}]),
+        ("CYP2C19", [{"rsid": "rs4244285", "star": "*2"}, {"rsid": "rs4986893", "star": "*3"}]),
+        ("CYP2C9", [{"rsid": "rs1799853", "star": "*2"}]),
+        ("SLCO1B1", [{"rsid": "rs4149056", "star": "*5"}]),
+        ("TPMT", [{"rsid": "rs1800460", "star": "*3"}, {"rsid": "rs1142345", "star": "*1"}]),
+        ("DPYD", []),
+    ]
+
+    def run():
+        for gene, variants in inputs:
+            determine_phenotype(gene, variants)
+    return run
+
+
+def _case_build_response_json():
+    from services.response_builder import build_response_json
+    variants = [{"rsid": f"rs{1000 + i}", "star": "*4"} for i in range(20)]
+    drugs = ["CODEINE", "WARFARIN", "CLOPIDOGREL", "SIMVASTATIN", "AZATHIOPRINE", "FLUOROURACIL"]
+
+    def run():
+        for drug in drugs:
+            build_response_json(
+                drug=drug, gene="CYP2D6", phenotype="IM", diplotype="*1/*4",
+                variant_count=len(variants), variants=variants,
+                vcf_parsing_success=True, cpic_level="A",
+                guideline_url="https://cpicpgx.org/guidelines/"
+            )
+    return run
+
+
+def _case_cpic_load():
+    from cpic_engine import initialize_cpic_engine
+    from contextlib import redirect_stdout
+    import io
+    path = str(ROOT_DIR / "data" / "cpic_gene-drug_pairs.xlsx")
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            initialize_cpic_engine(path)
+    return run
+
+
+def _case_end_to_end():
+    from contextlib import redirect_stdout
+    import io
+    with redirect_stdout(io.StringIO()):
+        import app as app_module
+    app_module.LLM_PROVIDER = StubLLMProvider()
+    # Measure the pipeline, not result-store hits on repeated uploads
+    app_module.RESULT_STORE = None
+    # Benchmark loops reuse one client id; keep the per-client quota out of the way
+    from services.admission import AdmissionController
+    app_module.ADMISSION = AdmissionController(client_rate=1e9, client_burst=1e9)
+    client = app_module.app.test_client()
+    content = (ROOT_DIR / "data" / "sample_poor_metabolizer.vcf").read_bytes()
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            response = client.post("/api/analysis", data={
+                "drugs": "CODEINE,CLOPIDOGREL,WARFARIN",
+                "vcf_file": (BytesIO(content), "bench.vcf")
+            })
+        if response.status_code != 200:
+            raise RuntimeError(f"End-to-end benchmark request failed: {response.status_code}")
+    return run
+
+
+BENCHMARK_CASES = {
+    "parse_vcf": _case_parse_vcf,
+    "determine_phenotype": _case_determine_phenotype,
+    "build_response_json": _case_build_response_json,
+    "cpic_load": _case_cpic_load,
+    "end_to_end": _case_end_to_end,
+}
+
+
+def _pick_loops(func) -> int:
+    """Choose an inner loop count so one sample takes roughly TARGET_SAMPLE_SECONDS."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= TARGET_SAMPLE_SECONDS or loops >= 100000:
+            return loops
+        loops *= 2 if elapsed * 10 > TARGET_SAMPLE_SECONDS else 10
+
+
+def _time_loops(func, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - started) / loops
+
+
+def measure(func, repeats: int = DEFAULT_REPEATS, loops: int = None) -> dict:
+    """
+    Time a callable and summarize the per-call samples.
+
+    Every sample is bracketed by two runs of the calibration workload and stored
+    as a ratio to it, which cancels CPU frequency drift and noisy neighbours far
+    better than a single up-front calibration.
+
+    Parameters:
+    -----------
+    func : callable
+        Zero-argument function to benchmark
+    repeats : int
+        Number of samples to collect
+    loops : int
+        Calls per sample (auto-selected if None)
+
+    Returns:
+    --------
+    dict
+        {"loops", "samples", "median", "mad"} in calibration units per call,
+        plus "raw_median" in seconds per call
+    """
+    func()  # warm up imports and caches
+    loops = loops or _pick_loops(func)
+    samples = []
+    raw_samples = []
+    for _ in range(repeats):
+        before = _time_loops(_calibration_workload, CALIBRATION_LOOPS)
+        elapsed = _time_loops(func, loops)
+        after = _time_loops(_calibration_workload, CALIBRATION_LOOPS)
+        raw_samples.append(elapsed)
+        samples.append(elapsed / ((before + after) / 2))
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    return {
+        "loops": loops,
+        "samples": samples,
+        "median": median,
+        "mad": mad,
+        "raw_median": statistics.median(raw_samples)
+    }
+
+
+def mann_whitney_greater(current: list, baseline: list) -> float:
+    """
+    One-sided Mann-Whitney U test that `current` tends to be larger than `baseline`.
+
+    Uses the normal approximation with tie correction, which is adequate for the
+    10+ samples the gate collects per side.
+
+    Returns:
+    --------
+    float
+        p-value (small values mean current is significantly slower)
+    """
+    n1, n2 = len(current), len(baseline)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+
+    combined = sorted([(v, 0) for v in current] + [(v, 1) for v in baseline])
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        average_rank = (i + j) / 2.0 + 1
+        for k in range(i, j + 1):
+            ranks[k] = average_rank
+        tied = j - i + 1
+        tie_term += tied ** 3 - tied
+        i = j + 1
+
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u_stat = rank_sum - n1 * (n1 + 1) / 2.0
+    mean_u = n1 * n2 / 2.0
+    n = n1 + n2
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 0.5
+    z = (u_stat - mean_u - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare_case(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD,
+                 alpha: float = DEFAULT_ALPHA) -> dict:
+    """
+    Compare a measured case against its stored baseline.
+
+    Parameters:
+    -----------
+    current : dict
+        Result of measure() for this run
+    baseline : dict
+        Stored baseline entry (same shape as measure())
+    threshold : float
+        Relative slowdown tolerated before a case can fail (0.15 = 15%)
+    alpha : float
+        Significance level for the Mann-Whitney test
+
+    Returns:
+    --------
+    dict
+        {"status": "pass"|"regression"|"improvement", "change", "p_value", ...}
+    """
+    current_median = statistics.median(current["samples"])
+    change = current_median / baseline["median"] - 1.0
+
+    # Noise is handled by the significance test; the threshold is applied as given
+    p_slower = mann_whitney_greater(current["samples"], baseline["samples"])
+    p_faster = mann_whitney_greater(baseline["samples"], current["samples"])
+
+    if change > threshold and p_slower < alpha:
+        status = "regression"
+    elif change < -threshold and p_faster < alpha:
+        status = "improvement"
+    else:
+        status = "pass"
+
+    return {
+        "status": status,
+        "baseline_seconds": baseline.get("raw_median"),
+        "current_seconds": current.get("raw_median"),
+        "change": change,
+        "threshold": threshold,
+        "p_value": p_slower
+    }
+
+
+def load_baselines(path: Path = DEFAULT_BASELINE_PATH) -> dict:
+    """Load stored baselines (empty structure if the file does not exist yet)."""
+    path = Path(path)
+    if not path.exists():
+        return {"cases": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baselines(measurements: dict, path: Path = DEFAULT_BASELINE_PATH, existing: dict = None):
+    """Write measurements as the new baselines, keeping untouched cases from `existing`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cases = dict((existing or {}).get("cases", {}))
+    for name, result in measurements.items():
+        cases[name] = {
+            "loops": result["loops"],
+            "median": result["median"],
+            "mad": result["mad"],
+            "raw_median": result["raw_median"],
+            "samples": [round(s, 6) for s in result["samples"]]
+        }
+    payload = {
+        "version": 1,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "cases": dict(sorted(cases.items()))
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+        f.write("\n")
+
+
+def run_gate(case_names: list = None, baseline_path: Path = DEFAULT_BASELINE_PATH,
+             threshold: float = DEFAULT_THRESHOLD, alpha: float = DEFAULT_ALPHA,
+             repeats: int = DEFAULT_REPEATS, update_baseline: bool = False) -> dict:
+    """
+    Measure the selected cases and compare (or record) them against the baselines.
+
+    Returns:
+    --------
+    dict
+        {"passed": bool, "results": {case: comparison or None}}
+    """
+    case_names = case_names or list(BENCHMARK_CASES.keys())
+    unknown = [name for name in case_names if name not in BENCHMARK_CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark case(s): {', '.join(unknown)}")
+
+    baselines = load_baselines(baseline_path)
+    measurements = {}
+    for name in case_names:
+        func = BENCHMARK_CASES[name]()
+        stored = baselines["cases"].get(name)
+        measurements[name] = measure(func, repeats=repeats, loops=stored["loops"] if stored else None)
+
+    if update_baseline:
+        save_baselines(measurements, baseline_path, existing=baselines)
+        return {"passed": True, "updated": True, "measurements": measurements, "results": {}}
+
+    results = {}
+    for name, measured in measurements.items():
+        stored = baselines["cases"].get(name)
+        results[name] = compare_case(measured, stored, threshold, alpha) if stored else None
+
+    passed = all(r is None or r["status"] != "regression" for r in results.values())
+    return {"passed": passed, "updated": False, "measurements": measurements, "results": results}
+
+
+def _format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.3f} s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.3f} ms"
+    return f"{value * 1e6:.1f} µs"
+
+
+def print_report(report: dict, threshold: float, alpha: float):
+    """Print the gate report as a table."""
+    print("=" * 78)
+    print(f"PERFORMANCE REGRESSION REPORT (threshold {threshold:.0%}, alpha {alpha})")
+    print("=" * 78)
+    if report["updated"]:
+        for name, measured in report["measurements"].items():
+            spread = measured["mad"] / measured["median"] if measured["median"] else 0.0
+            print(f"{name:<22} baseline recorded: {_format_seconds(measured['raw_median'])} (±{spread:.1%})")
+        print("=" * 78)
+        return
+
+    print(f"{'case':<22}{'baseline':>14}{'current':>14}{'change':>10}{'p-value':>10}  status")
+    for name, result in report["results"].items():
+        if result is None:
+            current = report["measurements"][name]["raw_median"]
+            print(f"{name:<22}{'-':>14}{_format_seconds(current):>14}{'':>10}{'':>10}  NO BASELINE")
+            continue
+        print(f"{name:<22}{_format_seconds(result['baseline_seconds'] or 0):>14}"
+              f"{_format_seconds(result['current_seconds']):>14}"
+              f"{result['change']:>+10.1%}{result['p_value']:>10.3f}  {result['status'].upper()}")
+    print("=" * 78)
+    print("change and p-value use calibration-normalized timings; raw times vary with machine load")
+    print("✓ PASS" if report["passed"] else "✗ FAIL: performance regression detected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and compare against stored baselines")
+    parser.add_argument("--cases", default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARK_CASES)}")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH), help="Baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Tolerated relative slowdown")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="Significance level")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Samples per case")
+    parser.add_argument("--update-baseline", action="store_true", help="Record the current run as the baseline")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args()
+
+    case_names = [c.strip() for c in args.cases.split(",") if c.strip()] if args.cases else None
+    report = run_gate(case_names, Path(args.baseline), args.threshold, args.alpha,
+                      args.repeats, args.update_baseline)
+
+    if args.json:
+        print(json.dumps({"passed": report["passed"], "results": report["results"]}, indent=2))
+    else:
+        print_report(report, args.threshold, args.alpha)
+
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Delete uploaded VCFs kept in the result store.
+
+With RESULT_STORE_KEEP_VCF=true the store keeps each uploaded VCF so
+tools/reanalyze.py can recompute its results after a knowledge-base update.
+The app drops VCFs past RESULT_STORE_VCF_TTL_DAYS when it starts; run this
+from cron to enforce the retention between restarts, or with --all to remove
+every kept VCF (e.g. after turning RESULT_STORE_KEEP_VCF off). Stored results
+are not touched; results without a kept VCF refresh on their next upload.
+
+Usage:
+    python -m tools.purge_vcf_inputs                      # apply RESULT_STORE_VCF_TTL_DAYS
+    python -m tools.purge_vcf_inputs --older-than-days 7
+    python -m tools.purge_vcf_inputs --all
+"""
+
+import argparse
+import time
+
+from services.result_store import RESULT_STORE_PATH, RESULT_STORE_VCF_TTL_DAYS, ResultStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete uploaded VCFs kept in the result store")
+    parser.add_argument("--path", default=RESULT_STORE_PATH, help="Result store SQLite file")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--older-than-days", type=float, default=None,
+                       help=f"Retention in days (default: RESULT_STORE_VCF_TTL_DAYS={RESULT_STORE_VCF_TTL_DAYS:g})")
+    group.add_argument("--all", action="store_true", help="Delete every kept VCF")
+    args = parser.parse_args()
+
+    store = ResultStore(args.path)
+    if args.all:
+        older_than = float("inf")
+    elif args.older_than_days is not None:
+        older_than = time.time() - args.older_than_days * 86400
+    else:
+        older_than = None
+        if store.vcf_ttl_days <= 0:
+            print("RESULT_STORE_VCF_TTL_DAYS is 0 (no limit) - nothing to purge; use --all or --older-than-days")
+            return
+
+    deleted = store.purge_vcf_inputs(older_than)
+    print(f"✓ Deleted {deleted} kept VCF(s) from {store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+Incrementally re-analyse stored results after a knowledge-base change.
+
+When data/cpic_gene-drug_pairs.xlsx, the CPIC recommendation table, the
+allele/variant definitions or the phenotype rules (PHENOTYPE_MAP or the CPIC
+table store) change, the app starts under a new knowledge-base version
+(KB_VERSION) and saves a snapshot of it (services/knowledge_base.py). This job:
+
+1. diffs the snapshot of the previous version against the current one
+   (drug -> gene mappings and CPIC levels, diplotype -> phenotype entries,
+   allele definitions per gene, recommendation entries; a VCF_QC_FILTERS
+   change affects every result, a PROMPT_TEMPLATE_VERSION change every
+   result whose recommendation came from the LLM)
+2. looks up the stored results that depend on a changed entry in the result
+   store's dependency index
+3. recomputes only those patient/drug pairs from the stored VCFs (kept only
+   with RESULT_STORE_KEEP_VCF=true)
+4. carries every other result forward to the new version unchanged
+5. reports which results changed (phenotype, recommendation, ...)
+
+Uses the app's own configuration (result store, LLM provider and cache).
+
+Usage:
+    python -m tools.reanalyze --dry-run          # what changed and what would be recomputed
+    python -m tools.reanalyze --concurrency 4    # recompute and carry forward
+    python -m tools.reanalyze --from 3f2a... --no-llm --json
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.analysis_pipeline import analyze_drugs, required_genes
+from services.deadline import Deadline
+from services.knowledge_base import diff_snapshots, load_snapshot
+from services.response_builder import build_responses_from_analyses
+from services.vcf_parser import parse_vcf
+
+
+# Analysis fields compared between the stored and the recomputed result
+COMPARED_FIELDS = ("gene", "diplotype", "phenotype", "cpic_level", "clinical_recommendation", "recommendation_source")
+
+
+def describe_change(old_analysis: dict, new_analysis: dict) -> dict:
+    """{field: [old, new]} for the compared fields that differ (empty if the outcome is unchanged)."""
+    return {
+        field: [old_analysis.get(field), new_analysis.get(field)]
+        for field in COMPARED_FIELDS
+        if old_analysis.get(field) != new_analysis.get(field)
+    }
+
+
+def reanalyze(store, old_version: str, new_version: str, affected: set, cpic_engine: dict,
+              recommendations: dict = None, llm_provider=None, llm_cache=None,
+              concurrency: int = 4, timeout: float = 60.0) -> dict:
+    """
+    Recompute the affected results under the new knowledge base and store them.
+
+    Parameters:
+    -----------
+    store : ResultStore
+        Result store holding the results of `old_version`
+    old_version, new_version : str
+        Knowledge-base versions (previous and current KB_VERSION)
+    affected : set
+        (vcf_hash, drug) pairs to recompute
+    cpic_engine, recommendations : dict
+        Current CPIC data (as loaded by the app)
+    llm_provider, llm_cache :
+        LLM provider and recommendation cache (None for no LLM text)
+    concurrency : int
+        VCFs re-analysed at once
+    timeout : float
+        Time budget per VCF in seconds
+
+    Returns:
+    --------
+    dict
+        Counts plus one {"vcf_hash", "drug", "patient_id", "changes"} entry per changed result
+    """
+    by_vcf = {}
+    for vcf_hash, drug in affected:
+        by_vcf.setdefault(vcf_hash, []).append(drug)
+
+    report = {"recomputed": 0, "changed": 0, "missing_input": 0, "failed": 0, "changes": []}
+    lock = threading.Lock()
+
+    def count(key, amount=1):
+        with lock:
+            report[key] += amount
+
+    def run(item):
+        vcf_hash, drugs = item
+        content = store.get_vcf(vcf_hash)
+        if content is None:
+            # Stored before VCF inputs were kept: cannot be recomputed incrementally
+            count("missing_input", len(drugs))
+            return
+        previous = {drug: store.get_result(vcf_hash, drug, old_version) for drug in drugs}
+        try:
+            vcf_data = parse_vcf(io.BytesIO(content), genes=required_genes(drugs, cpic_engine))
+            if not vcf_data.get("vcf_parsing_success"):
+                raise ValueError(vcf_data.get("error", "VCF parsing failed"))
+            analyses = analyze_drugs(vcf_data, sorted(drugs), cpic_engine, llm_provider, deadline=Deadline(timeout),
+                                     verbose=False, recommendations=recommendations, llm_cache=llm_cache)
+        except Exception as e:
+            print(f"⚠ Re-analysis of {vcf_hash[:12]} failed: {e}")
+            count("failed", len(drugs))
+            return
+
+        by_drug = {analysis["drug"]: analysis for analysis in analyses}
+        for drug in drugs:
+            old = previous.get(drug)
+            analysis = by_drug.get(drug)
+            if old is None or analysis is None or analysis.get("degraded"):
+                count("failed")
+                continue
+            response = build_responses_from_analyses([analysis], True, patient_id=old["patient_id"])
+            store.put_results(vcf_hash, new_version, [analysis], response)
+            count("recomputed")
+            changes = describe_change(old["analysis"], analysis)
+            if changes:
+                with lock:
+                    report["changed"] += 1
+                    report["changes"].append({"vcf_hash": vcf_hash, "drug": drug,
+                                              "patient_id": old["patient_id"], "changes": changes})
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(run, by_vcf.items()))
+    return report
+
+
+def print_report(report: dict, dry_run: bool):
+    diff = report["diff"]
+    print("\nKnowledge-base re-analysis" + (" (dry run)" if dry_run else ""))
+    print(f"  From version:        {report['from_version']}")
+    print(f"  To version:          {report['to_version']}")
+    print(f"  Changed entries:     {len(diff['drugs'])} drug mappings, {len(diff['phenotypes'])} phenotype rules, "
+          f"{len(diff['alleles'])} allele definitions, {len(diff['recommendations'])} recommendations")
+    if diff.get("qc_filters"):
+        print(f"    VCF QC filters: {diff['qc_filters']['old']} -> {diff['qc_filters']['new']} (affects every result)")
+    if diff.get("prompt_template"):
+        print(f"    Prompt template: {diff['prompt_template']['old']} -> {diff['prompt_template']['new']} "
+              f"(affects every LLM-sourced recommendation)")
+    for change in diff["drugs"]:
+        print(f"    drug {change['drug']}: {change['old']} -> {change['new']}")
+    for change in diff["phenotypes"][:20]:
+        print(f"    {change['gene']} {change['diplotype']}: {change['old']} -> {change['new']}")
+    if len(diff["phenotypes"]) > 20:
+        print(f"    ... {len(diff['phenotypes']) - 20} more phenotype rules")
+    print(f"  Stored results:      {report['total']}")
+    print(f"  Affected:            {report['affected']}")
+    if report["already_current"]:
+        print(f"  Already current:     {report['already_current']}")
+    if dry_run:
+        return
+    print(f"  Recomputed:          {report['recomputed']}")
+    print(f"  Outcome changed:     {report['changed']}")
+    print(f"  Carried forward:     {report['carried_forward']}")
+    if report["missing_input"]:
+        print(f"  ⚠ No stored VCF:     {report['missing_input']} (re-upload to refresh)")
+    if report["failed"]:
+        print(f"  ⚠ Failed:            {report['failed']}")
+    print(f"  Elapsed:             {report['elapsed_seconds']}s")
+    for change in report["changes"]:
+        fields = ", ".join(f"{field} {old!r} -> {new!r}" for field, (old, new) in change["changes"].items()
+                           if field != "clinical_recommendation")
+        if "clinical_recommendation" in change["changes"]:
+            fields = ", ".join(filter(None, [fields, "clinical recommendation updated"]))
+        print(f"    {change['patient_id']} {change['drug']}: {fields}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-analyse only the stored results a knowledge-base change affects")
+    parser.add_argument("--from", dest="from_version", help="Previous knowledge-base version "
+                        "(default: the most recent stored version other than the current one)")
+    parser.add_argument("--concurrency", type=int, default=4, help="VCFs re-analysed at once")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Time budget per VCF in seconds")
+    parser.add_argument("--no-llm", action="store_true", help="Recompute without LLM explanations")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the diff and the affected results")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    # The app module owns the knowledge base, result store and LLM configuration
+    import app as app_module
+
+    store = app_module.RESULT_STORE
+    if store is None:
+        parser.error("The result store is disabled (RESULT_STORE=false)")
+    new_version = app_module.KB_VERSION
+    if not store.keep_vcf:
+        print("⚠ RESULT_STORE_KEEP_VCF is off - results of VCFs uploaded since are not kept for re-analysis")
+    old_version = args.from_version or next((v for v in store.versions() if v != new_version), None)
+    if old_version is None or old_version == new_version:
+        print(f"✓ All stored results are already on knowledge base {new_version}")
+        return
+
+    old_snapshot = load_snapshot(old_version)
+    new_snapshot = load_snapshot(new_version)
+    if old_snapshot is None or new_snapshot is None:
+        parser.error(f"No knowledge-base snapshot for {old_version if old_snapshot is None else new_version}; "
+                     "results of that version need a full re-run")
+
+    started = time.monotonic()
+    diff = diff_snapshots(old_snapshot, new_snapshot)
+    affected = store.affected_results(old_version, diff["entries"])
+    # Pairs recomputed by an earlier run (or re-uploaded since) are already current
+    pending = {(vcf_hash, drug) for vcf_hash, drug in affected if store.get_result(vcf_hash, drug, new_version) is None}
+    report = {
+        "from_version": old_version,
+        "to_version": new_version,
+        "diff": dict(diff, entries=sorted(diff["entries"])),
+        "total": store.count(old_version),
+        "affected": len(affected),
+        "already_current": len(affected) - len(pending)
+    }
+    if not args.dry_run:
+        llm_provider = None if args.no_llm else app_module.LLM_PROVIDER
+        report.update(reanalyze(store, old_version, new_version, pending, app_module.CPIC_ENGINE,
+                                app_module.CPIC_RECOMMENDATIONS, llm_provider,
+                                None if args.no_llm else app_module.LLM_CACHE_STORE,
+                                concurrency=args.concurrency, timeout=args.timeout))
+        report["carried_forward"] = store.carry_forward(old_version, new_version, affected)
+        report["elapsed_seconds"] = round(time.monotonic() - started, 2)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+Fill the LLM recommendation cache ahead of traffic.
+
+Enumerates every supported drug (cpic_engine.SUPPORTED_DRUGS loaded from the
+CPIC dataset) against the diplotypes in phenotype_engine.PHENOTYPE_MAP for the
+drug's gene, builds the same prompt the app sends (prepare_llm_prompt) and
+stores each answer under the same semantic key the app looks up. Uses the app's
+own provider configuration (LLM_PROVIDER, LLM_HEDGE_PROVIDER, ...), so the
+model part of the key matches.
+
+Resumable: combinations already in the cache are skipped, so an interrupted
+run (or a re-run after a deploy) only sends what is missing. Run it again after
+bumping PROMPT_TEMPLATE_VERSION to re-warm for the new template.
+
+Usage:
+    python -m tools.warm_llm_cache --concurrency 4 --rate 2 --dry-run
+    python -m tools.warm_llm_cache --concurrency 4 --rate 2 \\
+        --input-price 0.30 --output-price 2.50
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cpic_engine import SUPPORTED_DRUGS
+from services.admission import TokenBucket
+from services.deadline import Deadline
+from services.llm_cache import is_cacheable, provider_model, recommendation_cache_key
+from services.llm_tiering import route_provider
+from services.phenotype_engine import PHENOTYPE_MAP, determine_phenotype
+from services.prompt_budget import estimate_tokens
+from services.response_builder import prepare_llm_prompt
+
+
+def enumerate_combinations(cpic_engine: dict) -> list:
+    """
+    List the distinct (drug, phenotype, diplotype) prompts the app can send.
+
+    Diplotypes are run through determine_phenotype() so they are normalised
+    exactly as at request time.
+    """
+    combinations = []
+    seen = set()
+    for drug in SUPPORTED_DRUGS:
+        drug_data = cpic_engine.get(drug)
+        if not drug_data:
+            continue
+        gene = drug_data.get("gene")
+        for diplotype in PHENOTYPE_MAP.get(gene, {}):
+            variants = [{"star": allele} for allele in diplotype.split("/", 1)]
+            result = determine_phenotype(gene, variants)
+            fields = {
+                "drug": drug,
+                "gene": gene,
+                "phenotype": result.get("phenotype"),
+                "diplotype": result.get("diplotype"),
+                "cpic_level": drug_data.get("cpic_level")
+            }
+            identity = tuple(fields.values())
+            if identity in seen:
+                continue
+            seen.add(identity)
+            combinations.append(dict(fields, guideline_url=drug_data.get("guideline_url"), variants=variants))
+    return combinations
+
+
+def build_prompt(combination: dict) -> str:
+    return prepare_llm_prompt(
+        drug=combination["drug"],
+        gene=combination["gene"],
+        phenotype=combination["phenotype"],
+        diplotype=combination["diplotype"],
+        cpic_level=combination["cpic_level"],
+        variants=combination["variants"],
+        guideline_url=combination["guideline_url"],
+        risk_assessment=None
+    )
+
+
+def cache_fields(combination: dict) -> dict:
+    return {key: combination[key] for key in ("drug", "gene", "phenotype", "diplotype", "cpic_level")}
+
+
+def warm_cache(provider, cache, combinations: list, concurrency: int, rate: float,
+               timeout: float = 60.0, dry_run: bool = False) -> dict:
+    """
+    Send the missing combinations to the provider and store the answers.
+
+    Parameters:
+    -----------
+    provider : LLMProvider
+        Provider used for the prompts
+    cache : RecommendationCache
+        Cache to fill
+    combinations : list
+        Output of enumerate_combinations()
+    concurrency : int
+        Prompts in flight at once
+    rate : float
+        Maximum prompts started per second (token bucket, burst = concurrency)
+    timeout : float
+        Time budget per prompt in seconds
+    dry_run : bool
+        Only report what would be sent
+
+    Returns:
+    --------
+    dict
+        Counts and token totals for the report
+    """
+    missing = []
+    for combination in combinations:
+        # Each combination is answered (and looked up) by the model tier the app routes it to
+        routed = route_provider(provider, combination["phenotype"], combination["cpic_level"], combination["drug"])
+        key = recommendation_cache_key(model=provider_model(routed), **cache_fields(combination))
+        if not cache.contains(key):
+            missing.append((key, routed, combination))
+
+    report = {
+        "combinations": len(combinations),
+        "already_cached": len(combinations) - len(missing),
+        "to_warm": len(missing),
+        "warmed": 0,
+        "failed": 0,
+        "prompt_tokens": sum(estimate_tokens(build_prompt(c)) for _, _, c in missing),
+        "completion_tokens": 0,
+        "elapsed_seconds": 0.0
+    }
+    if dry_run or not missing:
+        return report
+
+    bucket = TokenBucket(rate, max(1.0, float(concurrency)))
+    bucket_lock = threading.Lock()
+    report_lock = threading.Lock()
+    started = time.monotonic()
+
+    def acquire():
+        while True:
+            with bucket_lock:
+                wait = bucket.try_consume(1.0)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def warm_one(item):
+        key, routed, combination = item
+        acquire()
+        prompt = build_prompt(combination)
+        label = f"{combination['drug']} {combination['diplotype']} ({combination['phenotype']})"
+        try:
+            llm_result = routed.generate_clinical_recommendation(prompt, deadline=Deadline(timeout))
+        except Exception as e:
+            llm_result = None
+            print(f"⚠ {label}: {e}")
+        if not is_cacheable(llm_result):
+            with report_lock:
+                report["failed"] += 1
+            print(f"⚠ {label}: no usable answer")
+            return
+        completion_tokens = estimate_tokens(str(llm_result))
+        cache.put(key, llm_result, provider_model(routed), prompt_tokens=estimate_tokens(prompt),
+                  completion_tokens=completion_tokens, **cache_fields(combination))
+        with report_lock:
+            report["warmed"] += 1
+            report["completion_tokens"] += completion_tokens
+            done = report["warmed"] + report["failed"]
+        print(f"✓ [{done}/{len(missing)}] {label}")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(warm_one, missing))
+
+    report["elapsed_seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def print_report(report: dict, input_price: float, output_price: float, dry_run: bool):
+    covered = report["already_cached"] + report["warmed"]
+    coverage = 100.0 * covered / report["combinations"] if report["combinations"] else 100.0
+    print("\nLLM cache warm-up" + (" (dry run)" if dry_run else ""))
+    print(f"  Combinations:      {report['combinations']}")
+    print(f"  Already cached:    {report['already_cached']}")
+    print(f"  To warm:           {report['to_warm']}")
+    if not dry_run:
+        print(f"  Warmed:            {report['warmed']}")
+        print(f"  Failed:            {report['failed']}")
+        print(f"  Coverage:          {coverage:.1f}%")
+        print(f"  Elapsed:           {report['elapsed_seconds']}s")
+    print(f"  Prompt tokens:     ~{report['prompt_tokens']}")
+    if dry_run:
+        # Completion size is unknown before the calls; estimate from a typical answer
+        report = dict(report, completion_tokens=report["to_warm"] * 350)
+    print(f"  Completion tokens: ~{report['completion_tokens']}")
+    cost = (report["prompt_tokens"] * input_price + report["completion_tokens"] * output_price) / 1_000_000
+    print(f"  Estimated cost:    ${cost:.4f} (at ${input_price}/${output_price} per 1M input/output tokens)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the LLM recommendation cache for common drug/diplotype pairs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts in flight at once")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum prompts started per second")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Time budget per prompt in seconds")
+    parser.add_argument("--drugs", default="", help="Comma-separated subset of supported drugs")
+    parser.add_argument("--input-price", type=float, default=0.30, help="USD per 1M prompt tokens")
+    parser.add_argument("--output-price", type=float, default=2.50, help="USD per 1M completion tokens")
+    parser.add_argument("--dry-run", action="store_true", help="Report coverage and cost without calling the LLM")
+    args = parser.parse_args()
+
+    # The app module owns provider/cache configuration; reuse it so keys match
+    import app as app_module
+
+    if app_module.LLM_PROVIDER is None or app_module.LLM_CACHE_STORE is None:
+        parser.error("An LLM provider and LLM_CACHE must be configured (see DEPLOYMENT.md)")
+
+    combinations = enumerate_combinations(app_module.CPIC_ENGINE)
+    if args.drugs:
+        wanted = {d.strip().upper() for d in args.drugs.split(",") if d.strip()}
+        combinations = [c for c in combinations if c["drug"] in wanted]
+
+    report = warm_cache(app_module.LLM_PROVIDER, app_module.LLM_CACHE_STORE, combinations,
+                        args.concurrency, args.rate, timeout=args.timeout, dry_run=args.dry_run)
+    print_report(report, args.input_price, args.output_price, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()